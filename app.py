@@ -1,106 +1,433 @@
-from flask import Flask, render_template, request
-from filter_logic import filter_cards
-from display_result import display_cards
+from flask import Flask, Response, abort, g, jsonify, render_template, request, stream_template
+from filter_logic import filter_cards, filter_params, parse_diagnose_params
+from display_result import iter_results, render_results
+from form_groups import CHECKBOX_GROUPS
+from catalog import get_catalog
+from image_manifest import get_manifest, report_missing_images
+from result_cache import DiagnoseCache
+from chart_data import chart_response_body
+from facets import cached_facet_counts
+from batch_diagnosis import BATCH_MAX_PROFILES, DEFAULT_TOP_N, diagnose_batch, parse_profiles, prepare_profiles, profile_format, profile_params
+from keyword_search import SUGGEST_LIMIT
+from card_api import DEFAULT_LIMIT, MAX_LIMIT, CursorError, card_summary, decode_cursor, encode_cursor, query_fingerprint, ranked_page
+from instrumentation import current_timer, end_request, observe_request, render_metrics, stage, start_request
+from score_rules import assign_weight_set, assignment_counts, get_rules, score_key
+from static_assets import ASSET_MAX_AGE, asset_url, fingerprint, is_current, resolve_asset_urls
+from cache import LRUCache
+from spend_simulator import SPEND_CATEGORIES, parse_spend, simulate, spend_dict
+from card_compare import CompareError, check_catalog_version, compare_cards, parse_card_ids, render_comparison
+from ranking import top_k
+import instrumentation
+import hashlib
 import json
+import secrets
+import time
 
 app = Flask(__name__)
+app.jinja_env.globals["asset_url"] = asset_url # Fingerprinted /static URLs in templates
 
+# Build the catalog and image manifest at startup and list cards whose image file is missing
+report_missing_images(get_catalog().df)
+
+# Rendered /diagnose results by normalized query (see result_cache.normalize_query)
+diagnose_cache = DiagnoseCache()
+
+# Rendered form page (body, ETag) by catalog version and stylesheet fingerprint
+index_cache = LRUCache(4)
+
+# Visitor id cookie for score_rules.json A/B tests (only issued while a test is configured)
+AB_COOKIE = "ab_id"
+AB_COOKIE_MAX_AGE = 180 * 24 * 3600
+
+
+# --- Per-stage timing (disabled with STAGE_TIMING=0) ---
+@app.before_request
+def start_timing():
+    if instrumentation.ENABLED:
+        g.request_started = time.perf_counter()
+        g.timing_token = start_request()
+
+@app.after_request
+def add_server_timing(response):
+    """ Reports the stage timings of this request as a Server-Timing header and records them for /metrics. """
+    started = g.get("request_started")
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    timer = current_timer()
+    entries = timer.server_timing() if timer is not None else ""
+    response.headers["Server-Timing"] = (entries + ", " if entries else "") + f"total;dur={elapsed * 1000:.3f}"
+    observe_request(request.url_rule.rule if request.url_rule else "unmatched", elapsed, timer)
+    return response
+
+@app.teardown_request
+def end_timing(exc):
+    end_request(g.pop("timing_token", None))
+
+
+# --- Score weights (score_rules.json) ---
+def request_weight_set():
+    """
+    Weight set that scores this request: ?weights=NAME if it names a set in score_rules.json,
+    otherwise the visitor's A/B test bucket (the default set when no test is running).
+    """
+    weight_set = g.get("weight_set")
+    if weight_set is None:
+        visitor = request.cookies.get(AB_COOKIE)
+        if visitor is None and get_rules().ab_test:
+            visitor = g.new_visitor = secrets.token_hex(8)
+        weight_set = g.weight_set = assign_weight_set(request.values.get("weights"), visitor)
+    return weight_set
+
+@app.after_request
+def add_weight_set_headers(response):
+    """ Tells which weight set scored the response, and keeps new visitors in their A/B bucket. """
+    weight_set = g.get("weight_set")
+    if weight_set is not None:
+        response.headers["X-Weight-Set"] = weight_set
+        if get_rules().ab_test:
+            response.vary.add("Cookie")
+    visitor = g.get("new_visitor")
+    if visitor is not None:
+        response.set_cookie(AB_COOKIE, visitor, max_age=AB_COOKIE_MAX_AGE, httponly=True, samesite="Lax")
+    return response
+
+
+# --- Static assets ---
+@app.after_request
+def static_cache_headers(response):
+    """ /static responses requested with the file's current fingerprint (?v=) never change: cache them for a year. """
+    if request.endpoint == "static" and response.status_code in (200, 304) and \
+            is_current(request.view_args.get("filename", ""), request.args.get("v")):
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
 
-# CHECKBOX_GROUPS defines the filter options displayed on the webpage.
-CHECKBOX_GROUPS = {
-    # ★★★ 「よく利用するお店(複数可)」が削除されました ★★★
-
-    "lifestyle_single": {
-        "title": "【ライフスタイル診断】主な交通手段は？ (いずれか一つ)",
-        "items": [
-            "電車 (Suica / PASMOなど)",
-            "飛行機 (マイルを貯めたい)",
-            "自動車 (ETC / ガソリン)"
-        ]
-    },
-
-    "tiers": {"title": "【カードスペック】カード区分", "items": ["一般", "ゴールド", "プラチナ"]},
-    "brands": {
-        "title": "【カードスペック】国際ブランド（いずれか含む）", 
-        "items": [
-            {"name": "VISA", "desc": "世界シェアNo.1の決済網。国内外問わず、実店舗でもオンラインでも「使えない場所がほぼない」圧倒的な安心感が強みです。"},
-            {"name": "MasterCard", "desc": "VISAに次ぐ世界No.2のシェア。特にヨーロッパ圏での決済に強く、日本ではコストコで使える国際ブランドとしても知られています。"},
-            {"name": "JCB", "desc": "日本発祥の唯一の国際ブランド。国内加盟店が非常に多く、ハワイやグアム、韓国など日本人観光客が多いエリアでの優待が手厚いのが特徴です。"},
-            {"name": "American Express", "desc": "高いステータスと信頼性が特徴。空港ラウンジ、手厚い旅行保険、コンシェルジュサービスなど、旅行やエンタメ関連の特典が群を抜いて充実しています。"},
-            {"name": "Diners", "desc": "Amexと並ぶ、あるいはそれ以上のステータスを持つ最上位ブランド。特に高級レストランでのコース料理1名分無料サービスなど、グルメ系の優待に圧倒的な強みを持っています。"}
-        ]
-    },
-    "points": {"title": "【カードスペック】貯まるポイントで選ぶ（いずれか含む）", "items": ["Vポイント", "楽天ポイント", "Pontaポイント", "dポイント", "マイル"]},
-    "applicant_type": {"title": "【カードスペック】申込対象で選ぶ（いずれか含む）", "items": ["学生可", "20歳以上", "高校生を除く18歳以上"]},
-    "insurance": {"title": "【カードスペック】保険で選ぶ（すべて満たす）", "items": ["海外旅行保険あり", "国内旅行保険あり", "ショッピング保険あり"]},
-    "e_money": {"title": "【カードスペック】電子マネー（すべて対応）", "items": ["iD", "QUICPay", "交通系", "WAON", "楽天Edy"]},
-    "wallets": {"title": "【カードスペック】スマホウォレット（すべて対応）", "items": ["Apple Pay", "Google Pay", "おサイフケータイ"]},
-    "features": {"title": "【カードスペック】欲しい機能（すべて満たす）", "items": ["年会費無料", "空港ラウンジ", "コンシェルジュ", "タッチ決済", "ETC無料", "家族カード", "即時発行", "バーチャルカード", "番号レス"]},
-    "campaigns": {"title": "【カードスペック】キャンペーン条件", "items": ["入会特典あり"]}
-}
 
 @app.route("/")
 def index():
-    """ Renders the main page with the diagnosis form. """
-    return render_template("index.html", show_form=True, groups=CHECKBOX_GROUPS)
+    """
+    Renders the main page with the diagnosis form. The page only changes with a deploy
+    (template, form groups, stylesheet) or the catalog, so it is rendered once per catalog
+    version and stylesheet fingerprint and served from memory. The ETag is a hash of the
+    body, so every worker and restart agrees on it and unchanged pages revalidate with a 304.
+    """
+    key = (get_catalog().version, fingerprint("style.css"))
+    cached = index_cache.get(key)
+    if cached is None:
+        with stage("template"):
+            body = render_template("index.html", show_form=True, groups=CHECKBOX_GROUPS, spend_categories=SPEND_CATEGORIES).encode("utf-8")
+        cached = (body, hashlib.sha256(body).hexdigest()[:32])
+        index_cache.put(key, cached)
+    body, etag = cached
+    response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache" # Always revalidate, but 304 costs nothing
+    return response.make_conditional(request)
+
+def run_filter(params):
+    """ Calls filter_cards with parsed parameters. Returns (filtered_df, is_fallback). """
+    return filter_cards(**filter_params(params))
+
+def simulation_inputs(values, params):
+    """
+    (monthly spend vector, first_year) when the form asks for ranking by simulated yearly
+    value (ranking=value), otherwise None. Without spend_<category> fields the monthly
+    amount counts as general spend. Invalid spend fields are a 400.
+    """
+    if values.get("ranking") != "value":
+        return None
+    try:
+        spend = parse_spend(values, fallback_amount=params["amount"])
+    except ValueError as e:
+        abort(400, description=f"invalid spend: {e}")
+    return spend, bool(values.get("first_year"))
 
 @app.route("/diagnose", methods=["POST"])
 def diagnose():
     """ Handles the form submission and displays card results. """
-    amount_str = request.form.get("amount")
-    if amount_str and amount_str.isdigit():
-        amount = int(amount_str)
+    params = parse_diagnose_params(request.form)
+    weight_set = request_weight_set()
+    spend_inputs = simulation_inputs(request.form, params)
+    if request.form.get("show_all"):
+        return stream_all_results(params, weight_set, spend_inputs)
+
+    # Identical (normalized) queries against the same catalog, weights and spend are served from the cache
+    catalog_version = get_catalog().version
+    manifest_version = get_manifest().version
+    scores = score_key(weight_set)
+    if spend_inputs is not None:
+        spend, first_year = spend_inputs
+        scores = (scores, tuple(spend.tolist()), first_year)
+    with stage("cache"):
+        cached = diagnose_cache.get(params, catalog_version, manifest_version, scores)
+    if cached is not None:
+        _, results_html = cached
     else:
-        amount = -1
-
-    keyword = request.form.get("keyword", "").strip()
-
-    tiers = request.form.getlist("tiers")
-    brands = request.form.getlist("brands")
-    e_money = request.form.getlist("e_money")
-    wallets = request.form.getlist("wallets")
-    features = request.form.getlist("features")
-    campaigns = request.form.getlist("campaigns")
-    points = request.form.getlist("points")
-    applicant_type = request.form.getlist("applicant_type")
-    insurance = request.form.getlist("insurance")
-
-    # ★★★ ここがキーワード入力に変更されました ★★★
-    lifestyle_keywords = request.form.get("lifestyle_keywords", "").strip()
-    lifestyle_single = request.form.get("lifestyle_single", "") 
-
-    campaign_has_bonus = "入会特典あり" in campaigns
-
-    # フィルター関数を呼び出し
-    filtered_df, is_fallback = filter_cards(
-        amount=amount,
-        tiers=tiers,
-        brands=brands,
-        features=features,
-        e_money=e_money,
-        wallets=wallets,
-        campaign_has_bonus=campaign_has_bonus,
-        keyword=keyword,
-        points=points,
-        applicant_type=applicant_type,
-        insurance=insurance
-    )
-    
-    # ★★★ display_cards にキーワードを渡すよう変更 ★★★
-    results_html = display_cards(
-        filtered_df, 
-        is_fallback,
-        lifestyle_keywords=lifestyle_keywords,
-        lifestyle_single=lifestyle_single
-    )
-
-    # Render the page with the results
-    return render_template(
+        # フィルター関数を呼び出し
+        filtered_df, is_fallback = run_filter(params)
+        simulation = None
+        if spend_inputs is not None:
+            with stage("simulate"):
+                simulation = simulate(filtered_df, *spend_inputs)
+
+        # ★★★ display_cards にキーワードを渡すよう変更 ★★★
+        results_html, card_ids = render_results(
+            filtered_df,
+            is_fallback,
+            lifestyle_keywords=params["lifestyle_keywords"],
+            lifestyle_single=params["lifestyle_single"],
+            weight_set=weight_set,
+            simulation=simulation
+        )
+        # Only cache results computed from the catalog the key was built for
+        if filtered_df.attrs.get("catalog_version") == catalog_version:
+            diagnose_cache.put(params, catalog_version, manifest_version, card_ids, results_html, scores)
+
+    # Render the page with the results (cached HTML carries no asset fingerprints; fill them in now)
+    with stage("template"):
+        return render_template(
+            "index.html",
+            show_form=False,
+            results_html=resolve_asset_urls(results_html),
+            catalog_version=catalog_version,
+            groups=CHECKBOX_GROUPS
+        )
+
+def stream_all_results(params, weight_set=None, spend_inputs=None):
+    """
+    "Show all matches" mode: streams the page, sending the template header first and
+    then each card block as it is rendered. Filtering and ranking run inside the stream,
+    so time-to-first-byte and memory do not grow with the number of results.
+    """
+    def results_stream():
+        filtered_df, is_fallback = run_filter(params)
+        simulation = simulate(filtered_df, *spend_inputs) if spend_inputs is not None else None
+        yield from iter_results(
+            filtered_df,
+            is_fallback,
+            lifestyle_keywords=params["lifestyle_keywords"],
+            lifestyle_single=params["lifestyle_single"],
+            weight_set=weight_set,
+            simulation=simulation
+        )
+
+    return Response(stream_template(
         "index.html",
         show_form=False,
-        results_html=results_html,
+        results_stream=results_stream(),
+        catalog_version=get_catalog().version,
         groups=CHECKBOX_GROUPS
-    )
+    ))
+
+@app.route("/compare")
+def compare():
+    """ Side-by-side view of 2-5 cards picked from the results (?ids=1,5,9 or repeated ids). """
+    catalog = get_catalog()
+    try:
+        check_catalog_version(catalog, request.args.get("catalog_version"))
+        card_ids = parse_card_ids(request.args)
+        with stage("render"):
+            results_html = render_comparison(catalog, card_ids, request_weight_set())
+    except CompareError as e:
+        abort(e.status, description=str(e))
+    with stage("template"):
+        return render_template("index.html", show_form=False, results_html=results_html, groups=CHECKBOX_GROUPS)
+
+@app.route("/api/compare", methods=["GET", "POST"])
+def api_compare():
+    """ JSON version of /compare: fields and base score breakdown of 2-5 cards, in the requested order. """
+    catalog = get_catalog()
+    weight_set = request_weight_set()
+    try:
+        check_catalog_version(catalog, request.values.get("catalog_version"))
+        cards = compare_cards(catalog, parse_card_ids(request.values), weight_set)
+    except CompareError as e:
+        return jsonify({"error": str(e)}), e.status
+    return jsonify({"catalog_version": catalog.version, "weight_set": weight_set, "cards": cards})
+
+@app.route("/api/diagnose", methods=["GET", "POST"])
+def api_diagnose():
+    """
+    JSON version of /diagnose: same parameters, full ranking paginated with limit/cursor.
+    Returns ranked card ids, scores, tier and a compact field subset (no HTML rendering).
+    """
+    params = parse_diagnose_params(request.values)
+    limit_str = request.values.get("limit", "")
+    if limit_str and not limit_str.isdigit():
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    limit = min(int(limit_str), MAX_LIMIT) if limit_str else DEFAULT_LIMIT
+    if limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    weight_set = request_weight_set()
+    filtered_df, is_fallback = run_filter(params)
+    catalog_version = filtered_df.attrs.get("catalog_version")
+    fingerprint = query_fingerprint(params, score_key(weight_set))
+    cursor = request.values.get("cursor", "")
+    try:
+        offset = decode_cursor(cursor, catalog_version, fingerprint) if cursor else 0
+    except CursorError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cards, total, has_more = ranked_page(filtered_df, params, offset, limit, weight_set)
+    return jsonify({
+        "catalog_version": catalog_version,
+        "weight_set": weight_set,
+        "is_fallback": is_fallback,
+        "total": total,
+        "offset": offset,
+        "cards": cards,
+        "next_cursor": encode_cursor(offset + len(cards), catalog_version, fingerprint) if has_more else None,
+    })
+
+@app.route("/api/simulate", methods=["GET", "POST"])
+def api_simulate():
+    """
+    Yearly value simulation: monthly spend per category (spend_<category> fields, or a JSON
+    body {"spend": {category: yen}, "first_year": bool, "limit": n}) plus the /diagnose
+    filters (form/query fields, or keys of the JSON body parsed like a batch profile, e.g.
+    {"tiers": ["ゴールド"], "keyword": "楽天"}). Returns the matching cards ranked by
+    points value minus annual fee.
+    """
+    body = request.get_json(silent=True) if request.is_json else None
+    if isinstance(body, dict):
+        values = body
+        spend_values = body.get("spend", {})
+        if not isinstance(spend_values, dict):
+            return jsonify({"error": "spend must be an object of category: monthly yen"}), 400
+        unknown = sorted(set(spend_values) - set(SPEND_CATEGORIES))
+        if unknown:
+            return jsonify({"error": f"unknown spend categories: {', '.join(unknown)}", "categories": list(SPEND_CATEGORIES)}), 400
+    else:
+        values = spend_values = request.values
+    try:
+        spend = parse_spend(spend_values)
+    except ValueError as e:
+        return jsonify({"error": f"invalid spend: {e}"}), 400
+    limit_str = str(values.get("limit", ""))
+    if limit_str and not limit_str.isdigit():
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    limit = min(int(limit_str), MAX_LIMIT) if limit_str else DEFAULT_LIMIT
+    if limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    first_year = values.get("first_year") not in (None, "", "0", "false", False, 0)
+
+    params = profile_params(body) if isinstance(body, dict) else parse_diagnose_params(request.values)
+    filtered_df, is_fallback = run_filter(params)
+    with stage("simulate"):
+        simulation = simulate(filtered_df, spend, first_year)
+    with stage("rank"):
+        positions = top_k(simulation.net, limit)
+    manifest = get_manifest()
+    cards = [{**card_summary(card_id, filtered_df.iloc[pos], manifest), "simulation": simulation.summary(pos)}
+             for pos, card_id in zip(positions, filtered_df.index[positions].tolist())]
+    return jsonify({
+        "catalog_version": filtered_df.attrs.get("catalog_version"),
+        "spend": spend_dict(spend),
+        "annual_spend": round(float(spend.sum()) * 12),
+        "first_year": first_year,
+        "is_fallback": is_fallback,
+        "total": len(filtered_df),
+        "cards": cards,
+    })
+
+@app.route("/api/batch_diagnose", methods=["POST"])
+def api_batch_diagnose():
+    """
+    Diagnoses many saved profiles in one call: a JSON body {"profiles": [...], "top_n": 10}
+    or an uploaded "profiles" file (.csv / .json / .jsonl). Returns top-N card ids and
+    scores per profile, in input order (see batch_diagnosis.py; no process pool here).
+    """
+    try:
+        upload = request.files.get("profiles")
+        if upload is not None:
+            records = parse_profiles(upload.read().decode("utf-8-sig"), profile_format(upload.filename))
+            top_n_value = request.form.get("top_n")
+        else:
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict) or not isinstance(body.get("profiles"), list):
+                return jsonify({"error": 'expected {"profiles": [...]} or a "profiles" file upload'}), 400
+            records = body["profiles"]
+            top_n_value = body.get("top_n")
+        profiles = prepare_profiles(records)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"invalid profiles: {e}"}), 400
+    # JSON bodies can carry any type here: only integers and digit strings are accepted
+    if top_n_value in (None, ""):
+        top_n = DEFAULT_TOP_N
+    elif isinstance(top_n_value, int) and not isinstance(top_n_value, bool) or \
+            isinstance(top_n_value, str) and top_n_value.strip().isdigit():
+        top_n = int(top_n_value)
+    else:
+        return jsonify({"error": "top_n must be an integer"}), 400
+    if not 1 <= top_n <= MAX_LIMIT:
+        return jsonify({"error": f"top_n must be between 1 and {MAX_LIMIT}"}), 400
+    if len(profiles) > BATCH_MAX_PROFILES:
+        return jsonify({"error": f"at most {BATCH_MAX_PROFILES} profiles per request"}), 413
+
+    weight_set = request_weight_set()
+    results = diagnose_batch(profiles, top_n, weight_set=weight_set)
+    return jsonify({"catalog_version": get_catalog().version, "weight_set": weight_set, "results": results})
+
+@app.route("/api/facets", methods=["GET", "POST"])
+def api_facets():
+    """
+    Takes the current (partial) form selection and returns, for every checkbox option,
+    how many cards would match if it were toggled. Cheap enough to call on every change.
+    """
+    params = parse_diagnose_params(request.values)
+    catalog = get_catalog()
+    result = cached_facet_counts(catalog, params)
+    return jsonify({"catalog_version": catalog.version, **result})
+
+@app.route("/api/suggest")
+def api_suggest():
+    """ Type-ahead for the keyword field: card names and issuers starting with (then containing) q. """
+    q = request.args.get("q", "")
+    limit_str = request.args.get("limit", "")
+    limit = min(int(limit_str), MAX_LIMIT) if limit_str.isdigit() else SUGGEST_LIMIT
+    return jsonify({"query": q, "suggestions": get_catalog().keywords.suggest(q, limit)})
+
+@app.route("/api/chart")
+def api_chart():
+    """
+    基本スコア of every card (under the request's weight set), highest first. The JSON is
+    serialized once per catalog version and weights and served with an ETag, so unchanged
+    polls get an empty 304.
+    """
+    body, etag = chart_response_body(get_catalog(), request_weight_set())
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache" # Always revalidate, but 304 costs nothing
+    return response.make_conditional(request)
+
+@app.route("/api/cache/stats")
+def cache_stats():
+    """ Hit/miss/eviction counters of the /diagnose result cache. """
+    return jsonify(diagnose_cache.stats())
+
+@app.route("/metrics")
+def metrics():
+    """ Stage and request latency histograms plus cache counters, in Prometheus text format. """
+    stats = diagnose_cache.stats()
+    catalog = get_catalog()
+    extra = ["# HELP carddiag_diagnose_cache_events_total /diagnose result cache events.",
+             "# TYPE carddiag_diagnose_cache_events_total counter"]
+    extra += [f'carddiag_diagnose_cache_events_total{{event="{event}"}} {stats[event]}'
+              for event in ("hits", "misses", "evictions", "expirations")]
+    extra += ["# HELP carddiag_catalog_cards Cards in the loaded catalog.",
+              "# TYPE carddiag_catalog_cards gauge",
+              f"carddiag_catalog_cards {len(catalog.df)}",
+              "# HELP carddiag_catalog_version Version of the loaded catalog (increments on reload).",
+              "# TYPE carddiag_catalog_version gauge",
+              f"carddiag_catalog_version {catalog.version}",
+              "# HELP carddiag_weight_set_requests_total Requests scored with each score_rules.json weight set.",
+              "# TYPE carddiag_weight_set_requests_total counter"]
+    extra += [f'carddiag_weight_set_requests_total{{weight_set="{name}"}} {count}' for name, count in sorted(assignment_counts().items())]
+    return Response(render_metrics(["\n".join(extra)]), mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,338 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from catalog import get_catalog
+from display_result import FALLBACK_TIERS
+from filter_index import GROUP_MODES
+from filter_logic import parse_diagnose_params, usage_bucket
+from ranking import top_k, top_k_by_group
+from score_rules import catalog_scores
+from scoring import TRANSPORT_HINTS
+
+# Batch diagnosis: top-N cards and scores for many saved user profiles at once.
+# A chunk of profiles is evaluated against the whole catalog as matrices:
+#   filters  - profiles x options selection matrix times options x cards option masks
+#   bonuses  - profiles x keywords counts times keywords x cards hit matrix, plus 交通手段 flags
+# and each profile is then ranked exactly like /diagnose (fallback: per-tier Top 3).
+#
+#   python batch_diagnosis.py profiles.jsonl [-o results.jsonl|.csv] [--top-n 10] [--workers 4]
+#   python batch_diagnosis.py --sample 1000 --verify 200
+#
+# Profiles use the /diagnose form fields (amount, keyword, tiers, brands, ..., lifestyle_keywords,
+# lifestyle_single) plus an optional "id". In CSV, multi-valued fields are "|"-separated.
+
+LIST_SEPARATOR = "|"
+DEFAULT_TOP_N = 10
+BATCH_MAX_PROFILES = int(os.environ.get("BATCH_MAX_PROFILES", "5000")) # Per /api/batch_diagnose request
+
+# Upper bound on profiles x cards cells evaluated at once (sets the chunk size)
+CHUNK_CELLS = int(os.environ.get("BATCH_CHUNK_CELLS", "8000000"))
+
+
+class _ProfileForm:
+    """ get/getlist view of one profile record, so profiles are parsed exactly like form posts. """
+
+    def __init__(self, record):
+        self._record = record
+
+    def get(self, key, default=None):
+        value = self._record.get(key)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if value is None:
+            return default
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value)
+
+    def getlist(self, key):
+        value = self._record.get(key)
+        if value is None or value == "":
+            return []
+        values = value if isinstance(value, list) else str(value).split(LIST_SEPARATOR)
+        return [str(v).strip() for v in values if str(v).strip()]
+
+def profile_params(record):
+    """ Parsed /diagnose parameters for one profile record (dict from CSV/JSON). """
+    return parse_diagnose_params(_ProfileForm(record))
+
+def parse_profiles(text, fmt):
+    """ Profile records from CSV ("csv"), a JSON array ("json") or JSON Lines ("jsonl") text. """
+    if fmt == "csv":
+        return list(csv.DictReader(io.StringIO(text)))
+    if fmt == "json":
+        records = json.loads(text)
+        if not isinstance(records, list):
+            raise ValueError("expected a JSON array of profiles")
+        return records
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def profile_format(filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    return {".csv": "csv", ".json": "json"}.get(ext, "jsonl")
+
+def read_profiles(path):
+    """ Reads profile records from a .csv, .json or .jsonl file. """
+    with open(path, encoding="utf-8-sig") as f:
+        return parse_profiles(f.read(), profile_format(path))
+
+def prepare_profiles(records):
+    """ [(profile id, params)], ids default to the 1-based record number. """
+    profiles = []
+    for number, record in enumerate(records, 1):
+        if not isinstance(record, dict):
+            raise ValueError(f"profile {number} is not an object")
+        profile_id = record.get("id")
+        profiles.append((number if profile_id in (None, "") else profile_id, profile_params(record)))
+    return profiles
+
+
+def _selection(params, group):
+    """ Options of group the profile filters on, as filter_cards applies them. """
+    if group == "campaigns":
+        return {"入会特典あり"} if "入会特典あり" in params["campaigns"] else set()
+    return set(params[group] or [])
+
+def _filter_matrix(catalog, chunk):
+    """ profiles x cards boolean matrix: True where the card passes the profile's filters. """
+    index = catalog.bitmaps
+    mask = np.ones((len(chunk), index.size), dtype=bool)
+
+    # Monthly amount: one usage bucket per profile
+    if index.usage_filterable:
+        for row, params in enumerate(chunk):
+            if params["amount"] != -1:
+                mask[row] &= index.to_mask(index.option("amount", usage_bucket(params["amount"])))
+
+    # Checkbox groups: selection (profiles x options) @ option masks (options x cards)
+    for group, mode in GROUP_MODES.items():
+        selections = [_selection(params, group) for params in chunk]
+        options = sorted(set().union(*selections))
+        masks = {}
+        for option in options:
+            bits = index.option(group, option)
+            if bits is not None:
+                masks[option] = index.to_mask(bits)
+            elif mode == "any":
+                masks[option] = np.zeros(index.size, dtype=bool) # Matches nothing
+            # "all" groups skip options they cannot evaluate, like BitmapIndex.all_of
+        options = list(masks)
+        if not options:
+            continue
+        column = {option: j for j, option in enumerate(options)}
+        selected = np.zeros((len(chunk), len(options)), dtype=np.float32)
+        for row, selection in enumerate(selections):
+            for option in selection:
+                if option in column:
+                    selected[row, column[option]] = 1
+        hits = selected @ np.stack([masks[o] for o in options]).astype(np.float32)
+        required = selected.sum(axis=1)[:, None]
+        if mode == "any":
+            active = np.array([bool(s) for s in selections])[:, None]
+            mask &= (hits > 0) | ~active
+        else:
+            mask &= hits >= required
+
+    # Keyword search, one index lookup per distinct keyword
+    by_keyword = {}
+    for row, params in enumerate(chunk):
+        if params["keyword"]:
+            by_keyword.setdefault(params["keyword"], []).append(row)
+    for keyword, rows in by_keyword.items():
+        mask[rows] &= catalog.keywords.contains(keyword)
+    return mask
+
+def _bonus_matrix(catalog, chunk):
+    """ profiles x cards lifestyle bonuses, same rules as LifestyleIndex.bonuses. """
+    lifestyle = catalog.lifestyle
+    bonus = np.zeros((len(chunk), lifestyle.size), dtype=np.float32)
+
+    # --- キーワードボーナス: counts (profiles x keywords) @ hits (keywords x cards) ---
+    profile_words = [[w for w in re.split(r'[\s　]+', params["lifestyle_keywords"].lower()) if w] for params in chunk]
+    keywords = sorted(set().union(*map(set, profile_words)))
+    if keywords:
+        column = {keyword: j for j, keyword in enumerate(keywords)}
+        weights = np.zeros((len(chunk), len(keywords)), dtype=np.float32)
+        for row, words in enumerate(profile_words):
+            for word in words:
+                weights[row, column[word]] += 1
+        hits = np.zeros((len(keywords), lifestyle.size), dtype=np.float32)
+        for j, keyword in enumerate(keywords):
+            hits[j, lifestyle.text_index.positions(keyword)] = 1
+        bonus += np.minimum((weights @ hits) * 5, 15)
+
+    # --- 交通手段ボーナス: first mode named in lifestyle_single ---
+    modes = list(TRANSPORT_HINTS)
+    chosen = np.zeros((len(chunk), len(modes)), dtype=np.float32)
+    for row, params in enumerate(chunk):
+        mode = next((m for m in modes if m in params["lifestyle_single"]), None)
+        if mode is not None:
+            chosen[row, modes.index(mode)] = 1
+    if chosen.any():
+        bonus += chosen @ (np.stack([lifestyle.transport_flags[m] for m in modes]).astype(np.float32) * 15)
+    return bonus
+
+def _card_entry(df, pos, base, bonus, total):
+    return {"id": int(df.index[pos]), "name": df["カード名"].iloc[pos], "tier": df["カード区分"].iloc[pos],
+            "scores": {"base": round(float(base[pos]), 2), "bonus": int(bonus[pos]), "total": round(float(total[pos]), 2)}}
+
+def diagnose_chunk(catalog, profiles, top_n=DEFAULT_TOP_N, weight_set=None):
+    """ Ranked results for a list of (id, params) against catalog, in input order (base scores under weight_set). """
+    df = catalog.df
+    if df.empty:
+        return [{"id": pid, "is_fallback": False, "matched": 0, "cards": []} for pid, _ in profiles]
+    chunk = [params for _, params in profiles]
+    passes = _filter_matrix(catalog, chunk)
+    bonuses = _bonus_matrix(catalog, chunk)
+    base = catalog_scores(catalog, weight_set)
+    tiers = df["カード区分"].to_numpy()
+
+    results = []
+    for row, (profile_id, _) in enumerate(profiles):
+        bonus = bonuses[row].astype(int)
+        total = base + bonus
+        candidates = np.flatnonzero(passes[row])
+        if len(candidates):
+            positions = candidates[top_k(total[candidates], top_n)]
+            is_fallback = False
+        else:
+            # No match: per-tier Top 3 over the whole catalog, as on the results page
+            by_tier = top_k_by_group(total, tiers, [t for t, _ in FALLBACK_TIERS], 3)
+            positions = np.concatenate([by_tier[t] for t, _ in FALLBACK_TIERS])
+            is_fallback = True
+        results.append({"id": profile_id, "is_fallback": is_fallback, "matched": int(len(candidates)),
+                        "cards": [_card_entry(df, pos, base, bonus, total) for pos in positions]})
+    return results
+
+def _chunk_size(catalog_size, chunk_size=None):
+    return chunk_size or max(1, CHUNK_CELLS // max(1, catalog_size))
+
+def _worker(args):
+    """ Process pool entry point: diagnoses one chunk against the worker's catalog. """
+    profiles, top_n, weight_set = args
+    return diagnose_chunk(get_catalog(), profiles, top_n, weight_set)
+
+def diagnose_batch(profiles, top_n=DEFAULT_TOP_N, workers=1, chunk_size=None, weight_set=None):
+    """
+    Diagnoses [(id, params)] profiles. With workers > 1, chunks are spread over a
+    process pool (each worker uses its own copy of the catalog). Results keep input order.
+    """
+    catalog = get_catalog()
+    size = _chunk_size(len(catalog.df), chunk_size)
+    chunks = [profiles[i:i + size] for i in range(0, len(profiles), size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_worker, [(chunk, top_n, weight_set) for chunk in chunks]))
+    else:
+        parts = [diagnose_chunk(catalog, chunk, top_n, weight_set) for chunk in chunks]
+    return [result for part in parts for result in part]
+
+
+def sample_profiles(n, seed=0):
+    """ Random profile records over the form options (for trying out and verifying the batch mode). """
+    from form_groups import option_values
+
+    rng = random.Random(seed)
+    def pick(group, most=2):
+        values = option_values(group)
+        return LIST_SEPARATOR.join(rng.sample(values, rng.randint(0, min(most, len(values)))))
+    records = []
+    for i in range(n):
+        records.append({
+            "id": f"p{i + 1}",
+            "amount": rng.choice(["", "", "8000", "25000", "45000", "90000"]),
+            "keyword": rng.choice(["", "", "", "カード", "楽天", "JCB", "ゴールド", "存在しない"]),
+            **{group: pick(group) for group in GROUP_MODES if rng.random() < 0.35},
+            "lifestyle_keywords": rng.choice(["", "", "Amazon", "コンビニ イオン", "ポイント ポイント", "マイル　jal"]),
+            "lifestyle_single": rng.choice([""] + option_values("lifestyle_single")),
+        })
+    return records
+
+def verify_batch(profiles, top_n=DEFAULT_TOP_N, weight_set=None):
+    """ Compares batch results with the one-profile pipeline (filter_cards + rank_cards). Returns mismatching ids. """
+    from display_result import rank_cards
+    from filter_logic import filter_cards, filter_params
+
+    batch = diagnose_batch(profiles, top_n, weight_set=weight_set)
+    mismatches = []
+    for (profile_id, params), result in zip(profiles, batch):
+        df, is_fallback = filter_cards(**filter_params(params))
+        _, _, total, sections = rank_cards(df, is_fallback, params["lifestyle_keywords"], params["lifestyle_single"],
+                                           limit=top_n, weight_set=weight_set)
+        expected = [(i, round(float(total[p]), 2)) for _, positions in sections for i, p in zip(df.index[positions].tolist(), positions)]
+        actual = [(card["id"], card["scores"]["total"]) for card in result["cards"]]
+        if expected != actual or is_fallback != result["is_fallback"]:
+            mismatches.append(profile_id)
+    return mismatches
+
+
+def write_results(results, out):
+    """ Writes results as JSON Lines, or one row per (profile, rank) when out is a .csv path. """
+    if out and out.lower().endswith(".csv"):
+        with open(out, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["profile_id", "is_fallback", "rank", "card_id", "card_name", "tier", "base", "bonus", "total"])
+            for result in results:
+                for rank, card in enumerate(result["cards"], 1):
+                    s = card["scores"]
+                    writer.writerow([result["id"], int(result["is_fallback"]), rank, card["id"], card["name"], card["tier"],
+                                     s["base"], s["bonus"], s["total"]])
+        return
+    f = open(out, "w", encoding="utf-8") if out else sys.stdout
+    try:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if out:
+            f.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diagnose many user profiles at once.")
+    parser.add_argument("profiles", nargs="?", help="profiles file (.csv, .json or .jsonl)")
+    parser.add_argument("-o", "--output", help="results file (.jsonl, or .csv for one row per card); default stdout")
+    parser.add_argument("--top-n", type=int, default=DEFAULT_TOP_N)
+    parser.add_argument("--workers", type=int, default=1, help="processes to spread profile chunks over")
+    parser.add_argument("--chunk-size", type=int, help="profiles per chunk (default: from catalog size)")
+    parser.add_argument("--sample", type=int, help="use N random profiles instead of a file")
+    parser.add_argument("--verify", type=int, metavar="N", help="check the first N profiles against the one-profile pipeline")
+    parser.add_argument("--weights", help="weight set from score_rules.json (default: default)")
+    args = parser.parse_args(argv)
+
+    if args.sample:
+        records = sample_profiles(args.sample)
+    elif args.profiles:
+        try:
+            records = read_profiles(args.profiles)
+        except (OSError, ValueError) as e:
+            print(f"Error: could not read {args.profiles}: {e}", file=sys.stderr)
+            return 1
+    else:
+        parser.error("a profiles file or --sample is required")
+    profiles = prepare_profiles(records)
+    with contextlib.redirect_stdout(sys.stderr): # Keep catalog load notices out of stdout results
+        get_catalog()
+
+    start = time.perf_counter()
+    results = diagnose_batch(profiles, args.top_n, args.workers, args.chunk_size, args.weights)
+    elapsed = time.perf_counter() - start
+    write_results(results, args.output)
+    print(f"Diagnosed {len(profiles)} profile(s) in {elapsed:.2f}s "
+          f"({len(profiles) / elapsed if elapsed else 0:.0f}/s, {sum(r['is_fallback'] for r in results)} fallback)", file=sys.stderr)
+
+    if args.verify:
+        mismatches = verify_batch(profiles[:args.verify], args.top_n, args.weights)
+        print(f"Verify: {min(args.verify, len(profiles))} profile(s), {len(mismatches)} mismatch(es) {mismatches[:10]}", file=sys.stderr)
+        return 1 if mismatches else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
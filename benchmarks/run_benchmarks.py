@@ -0,0 +1,172 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Benchmarks load_cards / catalog build, filter_cards, display_cards and the full
+# /diagnose round-trip (Flask test client) on synthetic catalogs of several sizes.
+# Each size runs in its own subprocess so peak RSS is per catalog size.
+#
+#   python -m benchmarks.run_benchmarks --sizes 200,10000,100000 [-o results.json]
+#   python -m benchmarks.run_benchmarks --compare old.json new.json
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [200, 2_000, 20_000, 200_000, 1_000_000]
+
+# Filter mixes, as /diagnose form data
+FILTER_MIXES = {
+    "empty": {},
+    "single_tier": {"tiers": ["ゴールド"]},
+    "free_fee": {"features": ["年会費無料"]},
+    "transport": {"lifestyle_single": "電車 (Suica / PASMOなど)"},
+    "heavy": {"brands": ["VISA", "JCB"], "e_money": ["iD"], "wallets": ["Apple Pay"], "points": ["マイル", "楽天ポイント"],
+              "insurance": ["海外旅行保険あり"], "keyword": "カード", "lifestyle_keywords": "Amazon コンビニ", "amount": "40000"},
+    "no_match": {"keyword": "存在しないカード名"},
+}
+
+
+def _repeats(size, base):
+    """ Fewer repetitions for large catalogs so a full run stays within minutes. """
+    return max(3, base // max(1, size // 2000))
+
+def _measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    t = np.array(times) * 1000
+    return {"runs": repeat, "p50_ms": round(float(np.percentile(t, 50)), 3), "p95_ms": round(float(np.percentile(t, 95)), 3),
+            "mean_ms": round(float(t.mean()), 3), "throughput_per_s": round(float(1000 / t.mean()), 2) if t.mean() else None}
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1) # bytes on macOS, KiB on Linux
+
+
+def run_size(size, seed, repeat):
+    """ Runs every stage for one catalog size in this process. Returns a list of result dicts. """
+    from benchmarks.synthetic_catalog import write_catalog
+
+    tmp = tempfile.mkdtemp(prefix="cards_bench_")
+    csv_path = os.path.join(tmp, "cards.csv")
+    write_catalog(size, csv_path, seed)
+    os.environ["CARDS_CSV"] = csv_path
+    os.chdir(REPO_ROOT)
+
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        import catalog
+        from filter_logic import load_cards, filter_cards
+        from display_result import display_cards
+        import app as webapp
+    catalog.CARDS_CSV = csv_path
+
+    results = []
+    def record(stage, mix, fn, n):
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = _measure(fn, n)
+        results.append({"size": size, "stage": stage, "mix": mix, **stats})
+        print(f"  {size:>9,} {stage:<18} {mix:<12} p50 {stats['p50_ms']:>10.2f} ms  p95 {stats['p95_ms']:>10.2f} ms", file=sys.stderr)
+
+    load_repeat = 1 if size >= 200_000 else 3
+    record("load_cards", "-", lambda: load_cards(csv_path), load_repeat)
+    record("catalog_build", "-", lambda: catalog.build_catalog(csv_path, None, 0), load_repeat)
+    with contextlib.redirect_stdout(io.StringIO()):
+        catalog.get_catalog() # Warm the shared catalog used by the stages below
+
+    client = webapp.app.test_client()
+    for mix, form in FILTER_MIXES.items():
+        params = webapp.parse_diagnose_params(_multidict(form))
+        n = _repeats(size, repeat)
+        record("filter_cards", mix, lambda: webapp.run_filter(params), n)
+        filtered, fallback = webapp.run_filter(params)
+        record("display_cards", mix, lambda: display_cards(filtered, fallback, params["lifestyle_keywords"], params["lifestyle_single"]), n)
+
+        def diagnose_uncached():
+            webapp.diagnose_cache._cache.clear()
+            client.post("/diagnose", data=form)
+        record("diagnose", mix, diagnose_uncached, n)
+        record("diagnose_cached", mix, lambda: client.post("/diagnose", data=form), n)
+    return results
+
+def _multidict(form):
+    from werkzeug.datastructures import MultiDict
+    return MultiDict([(k, v) for k, vs in form.items() for v in (vs if isinstance(vs, list) else [vs])])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def run_all(sizes, seed, repeat):
+    import pandas as pd
+
+    report = {"meta": {"commit": _git_commit(), "python": platform.python_version(), "pandas": pd.__version__,
+                       "numpy": np.__version__, "platform": platform.platform(), "seed": seed,
+                       "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+              "results": [], "peak_rss_mb": {}}
+    for size in sizes:
+        print(f"catalog size {size:,}", file=sys.stderr)
+        proc = subprocess.run([sys.executable, "-m", "benchmarks.run_benchmarks", "--worker", str(size),
+                               "--seed", str(seed), "--repeat", str(repeat)],
+                              cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            print(f"  size {size} failed (exit {proc.returncode})", file=sys.stderr)
+            continue
+        worker = json.loads(proc.stdout.strip().splitlines()[-1])
+        report["results"] += worker["results"]
+        report["peak_rss_mb"][str(size)] = worker["peak_rss_mb"]
+        print(f"  peak RSS {worker['peak_rss_mb']} MB", file=sys.stderr)
+    return report
+
+def compare(old_path, new_path):
+    """ Prints p50 ratios (new / old) for every (size, stage, mix) present in both reports. """
+    old = {(r["size"], r["stage"], r["mix"]): r for r in json.load(open(old_path))["results"]}
+    new = json.load(open(new_path))["results"]
+    print(f"{'size':>9} {'stage':<18} {'mix':<12} {'old p50':>10} {'new p50':>10} {'ratio':>7}")
+    for r in new:
+        o = old.get((r["size"], r["stage"], r["mix"]))
+        if o:
+            ratio = r["p50_ms"] / o["p50_ms"] if o["p50_ms"] else float("nan")
+            print(f"{r['size']:>9,} {r['stage']:<18} {r['mix']:<12} {o['p50_ms']:>10.2f} {r['p50_ms']:>10.2f} {ratio:>7.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the card diagnosis pipeline on synthetic catalogs.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma-separated catalog sizes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=50, help="repetitions per stage at 2,000 cards (scaled down for larger catalogs)")
+    parser.add_argument("-o", "--output", help="result JSON path (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    if args.worker:
+        results = run_size(args.worker, args.seed, args.repeat)
+        print(json.dumps({"results": results, "peak_rss_mb": _peak_rss_mb()}))
+        return 0
+
+    report = run_all([int(s) for s in args.sizes.split(",") if s], args.seed, args.repeat)
+    out = args.output or os.path.join(REPO_ROOT, "benchmarks", "results",
+                                      f"{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved {out}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Seeded generator of synthetic card catalogs with the cards.csv schema.
+# Most columns are sampled from the empirical value distribution of the real cards.csv;
+# names, brands, fees and tiers are synthesized so every card is distinct but realistic
+# (brands joined with "/", fee strings such as "永年無料" / "11,000円", tier consistent with fee).
+#
+#   python -m benchmarks.synthetic_catalog 100000 -o /tmp/cards_100k.csv [--seed 42]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BRANDS = ["VISA", "MasterCard", "JCB", "American Express", "Diners"]
+BRAND_WEIGHTS = [0.9, 0.7, 0.5, 0.2, 0.05] # Probability that a card carries each brand
+NAME_WORDS = ["スマート", "ライフ", "トラベル", "ポイント", "プレミアム", "ベーシック", "エブリデイ", "ネクスト", "プライム", "ワールド"]
+
+def _empirical(rng, series, n):
+    """ n values drawn from the observed distribution of series (NaN included). """
+    values = series.astype(object).to_numpy()
+    return values[rng.integers(0, len(values), n)]
+
+def _fee_strings(rng, tiers):
+    """ Fee text per tier: free/low fees for 一般, 1-3万 for ゴールド, 3万+ for プラチナ. """
+    fees = np.empty(len(tiers), dtype=object)
+    ranges = {"一般": (0, 2750), "ゴールド": (5500, 29700), "プラチナ": (33000, 165000)}
+    for tier, (lo, hi) in ranges.items():
+        idx = np.flatnonzero(tiers == tier)
+        amounts = (rng.integers(lo // 110, hi // 110 + 1, len(idx)) * 110)
+        fees[idx] = [f"{a:,}円" for a in amounts]
+        if tier == "一般":
+            free = idx[rng.random(len(idx)) < 0.5]
+            fees[free] = "永年無料"
+    return fees
+
+def generate_catalog(n, seed=42, source="cards.csv"):
+    """ Returns a DataFrame of n synthetic cards following the schema of source. """
+    rng = np.random.default_rng(seed)
+    real = pd.read_csv(os.path.join(REPO_ROOT, source), on_bad_lines="skip")
+    df = pd.DataFrame({col: _empirical(rng, real[col], n) for col in real.columns})
+
+    tiers = rng.choice(np.array(["一般", "ゴールド", "プラチナ"], dtype=object), n, p=[0.72, 0.18, 0.10])
+    df["カード区分"] = tiers
+    df["年会費（税込）"] = _fee_strings(rng, tiers)
+
+    tier_suffix = {"一般": "カード", "ゴールド": "ゴールドカード", "プラチナ": "プラチナカード"}
+    issuers = df["発行会社"].fillna("カード会社").astype(str).to_numpy()
+    words = rng.choice(NAME_WORDS, n)
+    df["カード名"] = [f"{issuer}{word}{tier_suffix[t]} No.{i}" for i, (issuer, word, t) in enumerate(zip(issuers, words, tiers))]
+
+    has_brand = rng.random((n, len(BRANDS))) < np.array(BRAND_WEIGHTS)
+    has_brand[~has_brand.any(axis=1), 0] = True # Every card has at least one brand
+    df["国際ブランド"] = ["/".join(b for b, keep in zip(BRANDS, row) if keep) for row in has_brand]
+    return df
+
+def write_catalog(n, path, seed=42):
+    generate_catalog(n, seed).to_csv(path, index=False)
+    return path
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic cards.csv")
+    parser.add_argument("size", type=int)
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    write_catalog(args.size, args.output, args.seed)
+    print(f"Wrote {args.size} cards to {args.output}")
@@ -0,0 +1,120 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+# Per-worker memory of the gunicorn deployment, with and without the shared catalog.
+# Starts gunicorn (gunicorn.conf.py) on a synthetic catalog for each configuration,
+# warms every worker with /diagnose requests and reads /proc/<pid>/smaps_rollup of the
+# master and each worker. PSS splits shared pages between the processes using them, so
+# the PSS total is the real footprint; private memory is what one more worker costs.
+#
+#   python -m benchmarks.worker_memory --size 100000 --workers 4
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGURATIONS = {
+    "before (no preload, no mmap)": {"GUNICORN_PRELOAD": "0", "CATALOG_MMAP": "0"},
+    "after (preload + mmap)": {"GUNICORN_PRELOAD": "1", "CATALOG_MMAP": "1"},
+}
+
+WARMUP_FORMS = [
+    {},
+    {"tiers": "ゴールド", "lifestyle_keywords": "Amazon コンビニ"},
+    {"brands": "VISA", "features": "年会費無料", "keyword": "カード"},
+    {"lifestyle_single": "電車 (Suica / PASMOなど)", "amount": "40000"},
+]
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            if int(fields[1]) == pid: # Field 4 (ppid), after "pid (comm)"
+                children.append(int(entry))
+    return sorted(children)
+
+def _wait_ready(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + "/api/cache/stats", timeout=5).read()
+            return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+def measure(name, env_overrides, csv_path, workers, port, requests_per_worker, timeout):
+    from instrumentation import process_memory
+
+    env = dict(os.environ, CARDS_CSV=csv_path, WEB_CONCURRENCY=str(workers), **env_overrides)
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}", "app:app"],
+                            cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        if not _wait_ready(url, timeout):
+            print(f"{name}: gunicorn did not become ready", file=sys.stderr)
+            return None
+        # Enough requests that every worker has served each kind of query
+        for _ in range(requests_per_worker * workers):
+            for form in WARMUP_FORMS:
+                data = urllib.parse.urlencode(form).encode("utf-8")
+                urllib.request.urlopen(url + "/diagnose", data=data, timeout=timeout).read()
+        master = process_memory(proc.pid)
+        per_worker = [process_memory(pid) for pid in _children(proc.pid)]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+    return master, per_worker
+
+def _mb(value):
+    return f"{value / 2**20:>9.1f}"
+
+def report(name, master, per_worker):
+    print(f"\n{name}")
+    print(f"  {'process':<10} {'RSS MB':>9} {'PSS MB':>9} {'private':>9} {'shared':>9}")
+    rows = [("master", master)] + [(f"worker {i + 1}", m) for i, m in enumerate(per_worker)]
+    for label, m in rows:
+        private = m.get("private_clean", 0) + m.get("private_dirty", 0)
+        shared = m.get("shared_clean", 0) + m.get("shared_dirty", 0)
+        print(f"  {label:<10} {_mb(m.get('rss', 0))} {_mb(m.get('pss', 0))} {_mb(private)} {_mb(shared)}")
+    total_pss = sum(m.get("pss", 0) for _, m in rows)
+    worker_private = [m.get("private_clean", 0) + m.get("private_dirty", 0) for m in per_worker]
+    print(f"  total PSS {total_pss / 2**20:.1f} MB, "
+          f"mean private per worker {sum(worker_private) / max(1, len(worker_private)) / 2**20:.1f} MB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare per-worker memory with and without the shared catalog.")
+    parser.add_argument("--size", type=int, default=100_000, help="synthetic catalog size")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=5, help="warm-up rounds per worker")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("Error: needs Linux /proc/<pid>/smaps_rollup", file=sys.stderr)
+        return 1
+    from benchmarks.synthetic_catalog import write_catalog
+
+    csv_path = os.path.join(tempfile.mkdtemp(prefix="cards_mem_"), "cards.csv")
+    write_catalog(args.size, csv_path)
+    print(f"{args.size:,} cards, {args.workers} workers")
+    for name, env in CONFIGURATIONS.items():
+        result = measure(name, env, csv_path, args.workers, args.port, args.requests, args.timeout)
+        if result is not None:
+            report(name, *result)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
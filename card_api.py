@@ -0,0 +1,88 @@
+import base64
+import binascii
+import hashlib
+import json
+from display_result import _fmt, score_cards
+from image_manifest import get_manifest
+from static_assets import asset_url
+from instrumentation import stage
+from ranking import top_k
+from result_cache import normalize_query
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+class CursorError(ValueError):
+    """ Raised for cursors that are malformed or belong to another query / catalog version. """
+
+
+def query_fingerprint(params, score_key=None):
+    """
+    Short hash of the normalized query and score weights (score_rules.score_key), embedded
+    in cursors so they cannot be reused across queries or after the ranking changed.
+    """
+    return hashlib.sha1(repr((normalize_query(params), score_key)).encode("utf-8")).hexdigest()[:16]
+
+def encode_cursor(offset, catalog_version, fingerprint):
+    payload = json.dumps({"o": offset, "v": catalog_version, "q": fingerprint}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, catalog_version, fingerprint):
+    """ Returns the offset stored in cursor, checking that it was issued for this query and catalog. """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        offset = int(payload["o"])
+    except (ValueError, KeyError, TypeError, binascii.Error, UnicodeError):
+        raise CursorError("invalid cursor")
+    if payload.get("q") != fingerprint:
+        raise CursorError("cursor belongs to a different query")
+    if payload.get("v") != catalog_version:
+        raise CursorError("card data has been updated; restart from the first page")
+    if offset < 0:
+        raise CursorError("invalid cursor")
+    return offset
+
+def _text_or_none(value):
+    return _fmt(value) or None
+
+def card_summary(card_id, row, manifest=None):
+    """ Compact, JSON-serializable subset of a card's fields. """
+    if manifest is None:
+        manifest = get_manifest()
+    brands = [b.strip() for b in str(row.get("国際ブランド", "")).split("/") if b.strip()]
+    return {
+        "id": card_id,
+        "name": _text_or_none(row.get("カード名")),
+        "issuer": _text_or_none(row.get("発行会社")),
+        "tier": _text_or_none(row.get("カード区分")),
+        "brands": brands,
+        "annual_fee": _text_or_none(row.get("年会費（税込）")),
+        "base_rate": _text_or_none(row.get("還元率_基本（%）")),
+        "point_program": _text_or_none(row.get("ポイントプログラム名")),
+        "image": asset_url("images/" + manifest.resolve(_fmt(row.get("画像ファイル名")) or "default.png")),
+    }
+
+def ranked_page(df, params, offset=0, limit=DEFAULT_LIMIT, weight_set=None):
+    """
+    One page of the full ranking of df (no HTML). Only the top offset+limit rows are
+    selected and sorted, so early pages stay cheap on large result sets.
+    Returns (cards, total, has_more).
+    """
+    if df.empty:
+        return [], 0, False
+    with stage("score"):
+        base_scores, bonus_scores, total_scores = score_cards(df, params["lifestyle_keywords"], params["lifestyle_single"], weight_set)
+    with stage("rank"):
+        positions = top_k(total_scores, offset + limit)[offset:]
+    manifest = get_manifest()
+    cards = []
+    for pos, card_id in zip(positions, df.index[positions].tolist()):
+        card = card_summary(card_id, df.iloc[pos], manifest)
+        card["scores"] = {
+            "base": round(float(base_scores[pos]), 2),
+            "bonus": int(bonus_scores[pos]),
+            "total": round(float(total_scores[pos]), 2),
+        }
+        cards.append(card)
+    return cards, len(df), offset + len(positions) < len(df)
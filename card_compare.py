@@ -0,0 +1,162 @@
+import html
+import re
+from card_api import card_summary
+from display_result import _fmt
+from image_manifest import get_manifest
+from score_rules import catalog_scores, get_rules, score_breakdown
+from static_assets import asset_slot, resolve_asset_urls
+
+# カード比較: 2〜5枚のカードを id (/api/diagnose などが返す行ラベル) で受け取り、項目とスコア内訳を横に並べる。
+# カードは catalog.ids (読み込み時に作る主キー索引) で引き、DataFrame は走査しない。
+# カードごとの項目セル (HTML) は catalog.compare_rows にキャッシュし、リクエストごとに変わる
+# スコア行 (重みセット次第) だけを毎回組み立てる。画像URLの fingerprint もキャッシュせず、応答ごとに埋める。
+
+COMPARE_MIN = 2
+COMPARE_MAX = 5
+
+# Rows of the comparison table, in display order: (label, column)
+COMPARE_FIELDS = [
+    ("年会費（税込）", "年会費（税込）"),
+    ("年会費条件", "年会費条件"),
+    ("還元率_基本（%）", "還元率_基本（%）"),
+    ("ボーナス還元率（%）", "ボーナス還元率（%）"),
+    ("還元対象カテゴリ", "還元対象カテゴリ"),
+    ("還元上限（月額）", "還元上限（月額）"),
+    ("ポイントプログラム名", "ポイントプログラム名"),
+    ("ポイント換算（円→P）", "ポイント換算（円→P）"),
+    ("国際ブランド", "国際ブランド"),
+    ("旅行保険_有無", "旅行保険_有無"),
+    ("海外旅行保険_付帯種別", "海外旅行保険_付帯種別"),
+    ("海外旅行保険_最高補償額（万円）", "海外旅行保険_最高補償額（万円）"),
+    ("ショッピング保険_年間補償額（万円）", "ショッピング保険_年間補償額（万円）"),
+    ("電子マネー対応", "電子マネー対応"),
+    ("タッチ決済対応", "タッチ決済対応"),
+    ("スマホ決済対応", "スマホ決済対応"),
+    ("空港ラウンジ", "空港ラウンジ"),
+    ("コンシェルジュ", "コンシェルジュ"),
+    ("ETC_可否", "ETC_可否"),
+    ("ETC_年会費", "ETC_年会費"),
+    ("家族カード可否", "家族カード可否"),
+    ("即時発行", "即時発行"),
+    ("バーチャルカード対応", "バーチャルカード対応"),
+    ("番号レスカード", "番号レスカード"),
+    ("申込対象", "申込対象"),
+    ("入会特典ポイント", "入会特典ポイント"),
+    ("公式キャンペーン", "公式キャンペーン"),
+    ("メリット", "メリット"),
+    ("デメリット", "デメリット"),
+]
+
+
+class CompareError(ValueError):
+    """ Raised for comparison requests that cannot be served; status is the HTTP status to answer with. """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_card_ids(values):
+    """
+    Card ids from ids=1,5,9 or repeated ids fields (form/args mapping), in the given order.
+    Raises CompareError unless there are 2-5 distinct integer ids.
+    """
+    raw = values.getlist("ids") if hasattr(values, "getlist") else [values.get("ids", "")]
+    ids = []
+    for part in (p for value in raw for p in re.split(r"[,\s]+", str(value)) if p):
+        if not part.isdigit():
+            raise CompareError(f"invalid card id: {part!r}")
+        card_id = int(part)
+        if card_id not in ids:
+            ids.append(card_id)
+    if not COMPARE_MIN <= len(ids) <= COMPARE_MAX:
+        raise CompareError(f"select between {COMPARE_MIN} and {COMPARE_MAX} cards to compare (got {len(ids)})")
+    return ids
+
+def check_catalog_version(catalog, requested):
+    """ Ids are only meaningful for the catalog they came from; a stale catalog_version is a 409. """
+    if requested not in (None, "") and str(requested) != str(catalog.version):
+        raise CompareError("card data has been updated; run the diagnosis again to pick cards", status=409)
+
+def card_entry(catalog, card_id, manifest=None):
+    """
+    (position, cached entry) of one card: its summary, field values and rendered header/field
+    cells. Looked up through the catalog's primary-key index; raises CompareError (404) if unknown.
+    """
+    position = catalog.ids.get(card_id)
+    if position is None:
+        raise CompareError(f"unknown card id: {card_id}", status=404)
+    if manifest is None:
+        manifest = get_manifest()
+    key = (card_id, manifest.version)
+    entry = catalog.compare_rows.get(key)
+    if entry is None:
+        row = catalog.df.iloc[position]
+        summary = card_summary(card_id, row, manifest)
+        summary["image"] = asset_slot("images/" + manifest.resolve(_fmt(row.get("画像ファイル名")) or "default.png"))
+        values = [_fmt(row.get(column)) for _, column in COMPARE_FIELDS]
+        name = html.escape(summary["name"] or "")
+        entry = {
+            "summary": summary,
+            "fields": values,
+            "header": f"""<th class="compare-card"><img src="{summary['image']}" class="card-image" alt="{name}" loading="lazy">
+              <div>{name}</div><div class="subline">{html.escape(summary['issuer'] or '')}</div></th>""",
+            "cells": [f"<td>{html.escape(v)}</td>" for v in values],
+        }
+        catalog.compare_rows.put(key, entry)
+    return position, entry
+
+def compare_cards(catalog, card_ids, weight_set=None):
+    """ JSON-serializable comparison: per card its summary, fields (COMPARE_FIELDS order) and base score with category breakdown. """
+    manifest = get_manifest()
+    scores = catalog_scores(catalog, weight_set)
+    cards = []
+    for card_id in card_ids:
+        position, entry = card_entry(catalog, card_id, manifest)
+        breakdown = score_breakdown(catalog, position, weight_set)
+        cards.append({
+            **entry["summary"],
+            "image": resolve_asset_urls(entry["summary"]["image"]),
+            "fields": [{"label": label, "value": value or None} for (label, _), value in zip(COMPARE_FIELDS, entry["fields"])],
+            "scores": {"base": round(float(scores[position]), 2),
+                       "categories": {category: round(points, 2) for category, points in breakdown.items()}},
+        })
+    return cards
+
+def _score_row(label, values, css_class, fmt):
+    best = max(values)
+    cells = "".join(f"<td class=\"best\">{fmt(v)}</td>" if v == best and best > 0 else f"<td>{fmt(v)}</td>" for v in values)
+    return f"<tr class=\"{css_class}\"><th>{label}</th>{cells}</tr>"
+
+def render_comparison(catalog, card_ids, weight_set=None):
+    """ HTML table with one column per card: header, base score and its category breakdown, then the fields. """
+    manifest = get_manifest()
+    rules = get_rules()
+    scores = catalog_scores(catalog, weight_set)
+    entries, breakdowns, base = [], [], []
+    for card_id in card_ids:
+        position, entry = card_entry(catalog, card_id, manifest)
+        entries.append(entry)
+        breakdowns.append(score_breakdown(catalog, position, weight_set))
+        base.append(float(scores[position]))
+
+    rows = [_score_row("基本スコア", base, "compare-score", lambda v: f"{v:.0f} 点")]
+    for category, max_points in rules.categories.items():
+        rows.append(_score_row(f"{category} (/{max_points})", [b[category] for b in breakdowns], "compare-breakdown", lambda v: f"{v:.1f}"))
+    for i, (label, _) in enumerate(COMPARE_FIELDS):
+        values = [entry["fields"][i] for entry in entries]
+        if not any(values):
+            continue
+        css = " class=\"same\"" if len(set(values)) == 1 else "" # 全カード同じ値の行は薄く表示
+        rows.append(f"<tr{css}><th>{label}</th>" + "".join(entry["cells"][i] for entry in entries) + "</tr>")
+
+    header = resolve_asset_urls("".join(entry["header"] for entry in entries))
+    return f"""
+    <h2 style='margin-bottom: 16px;'>カード比較 ({len(entries)}枚)</h2>
+    <div class="compare-wrap">
+      <table class="compare">
+        <thead><tr><th></th>{header}</tr></thead>
+        <tbody>{"".join(rows)}</tbody>
+      </table>
+    </div>
+    """
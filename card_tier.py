@@ -1,48 +1,45 @@
-import re
+import numpy as np
 import pandas as pd # Added import for type hinting
 
+# --- Annual fee parsing (single parser shared by tier inference and fee scoring) ---
+# Patterns are tried in order on NFKC-normalized text (full-width digits/commas become ASCII):
+#   "xxxx円" -> "x.x万" -> first number in the text.
+_FEE_YEN = r'(\d[\d,]*)\s*円'
+_FEE_MAN = r'(\d+(?:\.\d+)?)\s*万'
+_FEE_ANY = r'(\d[\d,]*)'
+# Free: "無料" anywhere, or a standalone "0円" (not the tail of "11,000円")
+_FEE_FREE = r'無料|(?<![\d,.])0\s*円'
+
+def _to_number(extracted):
+    return pd.to_numeric(extracted.str.replace(",", "", regex=False), errors="coerce")
+
+def parse_annual_fees(fees: pd.Series) -> pd.Series:
+    """ Parses annual fee strings (e.g. "11,000円", "3.3万", "永年無料") into yen, vectorized.
+    Args:
+        fees (pd.Series): The 年会費（税込） column.
+    Returns:
+        pd.Series: float yen amounts; 0 for free cards, NaN when the text contains no amount.
+    """
+    text = fees.fillna("").astype(str).str.normalize("NFKC").str.strip()
+    yen = _to_number(text.str.extract(_FEE_YEN, expand=False))
+    man = pd.to_numeric(text.str.extract(_FEE_MAN, expand=False), errors="coerce") * 10000
+    first = _to_number(text.str.extract(_FEE_ANY, expand=False))
+    parsed = yen.fillna(man).fillna(first).astype(float)
+    parsed[text.str.contains(_FEE_FREE, regex=True).to_numpy(dtype=bool)] = 0.0
+    return parsed.floordiv(1) # Whole yen, like int()
+
 def _parse_yen_to_int(fee_str: str) -> int:
-    """ Parses annual fee string (e.g., "11,000円", "3.3万", "無料") to an integer amount in yen. Returns 0 if free or parsing fails. """
-    if not fee_str:
-        return 0
-    s = str(fee_str).strip() # Convert to string and remove whitespace
-    if "無料" in s or "0円" in s:
-        return 0
-
-    # Pattern for "xxxx円"
-    m = re.search(r'([\d,]+)\s*円', s)
-    if m:
-        try:
-            return int(m.group(1).replace(",", ""))
-        except ValueError:
-            pass # Continue to next pattern if conversion fails
-
-    # Pattern for "x.x万"
-    m2 = re.search(r'([\d\.]+)\s*万', s)
-    if m2:
-        try:
-            return int(float(m2.group(1)) * 10000)
-        except ValueError:
-            pass # Continue to next pattern
-
-    # Pattern for digits only (potentially with commas)
-    m3 = re.search(r'^([\d,]+)$', s) # Match the whole string
-    if m3:
-        try:
-            return int(m3.group(1).replace(",", ""))
-        except ValueError:
-            pass
-
-    # Fallback: find first sequence of digits if other patterns fail
-    nums = re.findall(r'([\d,]+)', s)
-    if nums:
-        try:
-            return int(nums[0].replace(",", ""))
-        except ValueError:
-            pass
-
-    # print(f"Warning: Failed to parse annual fee: '{fee_str}'") # Optional warning
-    return 0 # Return 0 if parsing fails
+    """ Parses a single annual fee string to an integer amount in yen. Returns 0 if free or parsing fails. """
+    value = parse_annual_fees(pd.Series([fee_str], dtype=object)).iloc[0]
+    return 0 if pd.isna(value) else int(value)
+
+def annual_fee_column(df: pd.DataFrame) -> pd.Series:
+    """ The parsed 年会費数値 column, parsing 年会費（税込） only if it has not been added yet. """
+    if "年会費数値" in df.columns:
+        return df["年会費数値"]
+    if "年会費（税込）" not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return parse_annual_fees(df["年会費（税込）"])
 
 def infer_card_tier(row: pd.Series) -> str:
     """
@@ -75,29 +72,59 @@ def infer_card_tier(row: pd.Series) -> str:
     # Default to '一般'
     return "一般"
 
-def add_card_tier(df: pd.DataFrame) -> pd.DataFrame:
+def infer_card_tiers(df: pd.DataFrame) -> pd.Series:
+    """ Vectorized infer_card_tier over the whole DataFrame (same priority: name keyword > fee threshold). """
+    name = df["カード名"].fillna("").astype(str).str.strip() if "カード名" in df.columns else pd.Series("", index=df.index)
+    fee_yen = annual_fee_column(df).fillna(0).to_numpy()
+    tiers = np.select(
+        [name.str.contains("プラチナ", regex=False).to_numpy(dtype=bool),
+         name.str.contains("ゴールド", regex=False).to_numpy(dtype=bool),
+         fee_yen >= 30000,
+         fee_yen >= 10000],
+        ["プラチナ", "ゴールド", "プラチナ", "ゴールド"],
+        default="一般",
+    )
+    return pd.Series(tiers, index=df.index, dtype=object)
+
+def needs_tier_inference(df: pd.DataFrame) -> bool:
+    """ True when the catalog carries no 'カード区分' values at all, so tiers must be inferred. """
+    return "カード区分" not in df.columns or df["カード区分"].isnull().all() or (df["カード区分"] == "").all()
+
+def add_card_tier(df: pd.DataFrame, infer: bool = None) -> pd.DataFrame:
     """ Adds 'カード区分' (tier) and 'カードランクスコア' (tier score) columns to the DataFrame.
         If 'カード区分' already exists and has values, it calculates the score based on existing tiers.
-        Otherwise, it infers the tier using infer_card_tier.
+        Otherwise, it infers the tier using infer_card_tiers.
     Args:
         df (pd.DataFrame): The input DataFrame.
+        infer (bool): Overrides the decision above, e.g. when df is only some rows of the catalog.
     Returns:
-        pd.DataFrame: DataFrame with added tier and score columns.
+        pd.DataFrame: DataFrame with added tier and score columns (the input is not modified).
     """
-    df_copy = df.copy() # Work on a copy to avoid modifying the original DataFrame
-
     # Check if 'カード区分' needs inference or already exists
-    if "カード区分" not in df_copy.columns or df_copy["カード区分"].isnull().all() or (df_copy["カード区分"] == "").all():
+    if infer is None:
+        infer = needs_tier_inference(df)
+    if infer:
         print("Inferring 'カード区分' based on name and fee.")
-        # Apply inference function row by row
-        df_copy["カード区分"] = df_copy.apply(infer_card_tier, axis=1)
+        df = df.assign(カード区分=infer_card_tiers(df))
     else:
         print("Using existing 'カード区分' column.")
 
-    # Map tier name to a numerical score
+    # Map tier name to a numerical score, fill missing/unknown tiers with score 1 (General)
     tier_score_map = {"一般": 1, "ゴールド": 2, "プラチナ": 3}
-    # Apply map, fill missing/unknown tiers with score 1 (General)
-    df_copy["カードランクスコア"] = df_copy["カード区分"].map(tier_score_map).fillna(1).astype(int)
-
-    return df_copy
-
+    return df.assign(カードランクスコア=df["カード区分"].map(tier_score_map).fillna(1).astype(int))
+
+def fee_parse_table(df: pd.DataFrame) -> pd.DataFrame:
+    """ One row per distinct 年会費（税込） string: how often it occurs, its parsed amount and the fee-only tier. """
+    fees = df["年会費（税込）"].fillna("").astype(str)
+    table = fees.value_counts(sort=False).rename_axis("年会費（税込）").reset_index(name="件数")
+    table["年会費数値"] = parse_annual_fees(table["年会費（税込）"])
+    table["料金による区分"] = infer_card_tiers(table.assign(カード名=""))
+    return table.sort_values(["年会費数値", "年会費（税込）"], na_position="last").reset_index(drop=True)
+
+if __name__ == "__main__":
+    # Prints the parse result of every distinct fee string: python card_tier.py [cards.csv]
+    import sys
+    from catalog import load_cards
+
+    cards = load_cards(sys.argv[1] if len(sys.argv) > 1 else "cards.csv")
+    print(fee_parse_table(cards).to_string(index=False))
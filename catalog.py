@@ -0,0 +1,196 @@
+import os
+import threading
+import warnings
+import pandas as pd
+from cache import LRUCache
+from card_tier import add_card_tier, parse_annual_fees
+from filter_index import BitmapIndex
+from keyword_search import KeywordIndex
+from score_rules import get_rules
+from scoring import LifestyleIndex
+
+def _read_csv_reporting(file_path):
+    """ Reads the CSV, skipping malformed lines. Returns (df, messages for the skipped lines). """
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        df = pd.read_csv(file_path, on_bad_lines='warn')
+    skipped = []
+    for w in caught:
+        if issubclass(w.category, pd.errors.ParserWarning):
+            # pandas reports e.g. "Skipping line 46: expected 36 fields, saw 37", one line per drop
+            skipped += [line.strip() for line in str(w.message).splitlines() if line.strip()]
+        else:
+            warnings.warn(w.message, w.category)
+    return df, skipped
+
+def load_cards(file_path="cards.csv", skipped=None):
+    """ Loads and preprocesses the card data from a CSV file.
+        Malformed lines are skipped; their messages are appended to `skipped` if a list is given.
+    """
+    try:
+        # Skip lines with parsing errors to prevent crashes
+        df, skipped_lines = _read_csv_reporting(file_path)
+    except pd.errors.ParserError as e:
+        print(f"CSV parsing error: {e}")
+        return pd.DataFrame()
+    except FileNotFoundError:
+        print(f"Error: {file_path} not found.")
+        return pd.DataFrame()
+
+    if skipped_lines:
+        print(f"Warning: skipped {len(skipped_lines)} malformed line(s) in {file_path}: " + "; ".join(skipped_lines))
+        if skipped is not None:
+            skipped.extend(skipped_lines)
+
+    # Create numeric columns for easier filtering and scoring
+    numeric_cols = {
+        "還元率_基本（%）": "還元率数値",
+        "海外旅行保険_最高補償額（万円）": "海外旅行保険数値",
+        "ショッピング保険_年間補償額（万円）": "ショッピング保険数値"
+    }
+    for original_col, new_col in numeric_cols.items():
+        if original_col in df.columns:
+            df[new_col] = pd.to_numeric(df[original_col], errors='coerce').fillna(0)
+        else:
+            df[new_col] = 0.0 # Assign default value if column doesn't exist
+
+    # Ensure all required text columns exist to prevent errors during filtering
+    required_cols = [
+        "カード名","発行会社","カード区分","国際ブランド","年会費（税込）","年会費条件",
+        "旅行保険_有無","画像ファイル名","月々の推奨利用額","電子マネー対応",
+        "タッチ決済対応","スマホ決済対応","空港ラウンジ","コンシェルジュ",
+        "ETC_年会費","ETC_可否","家族カード可否","即時発行","バーチャルカード対応","番号レスカード",
+        "メリット","デメリット","入会特典ポイント","入会特典有効期限","公式キャンペーン", "申込対象", "ポイントプログラム名"
+    ]
+    for col in required_cols:
+        if col not in df.columns:
+            df[col] = "" # Add missing columns with empty strings
+
+    return df
+
+
+class CardCatalog:
+    """
+    Preprocessed, read-only snapshot of cards.csv.
+    One instance is shared by every request in the worker; consumers must never mutate `df`
+    (pandas copy-on-write keeps slices taken from it independent).
+    """
+
+    def __init__(self, df, path, signature, version, bitmaps=None, lifestyle=None, keywords=None, fragments=None,
+                 score_features=None):
+        # Rows are labelled 0..n-1, so the index of any slice gives catalog positions
+        # (prebuilt indexes are passed in by catalog_reload when only some rows changed)
+        df.attrs["catalog_version"] = version
+        self.df = df
+        self.bitmaps = bitmaps if bitmaps is not None else BitmapIndex(df) # Per-option filter bitsets
+        self.lifestyle = lifestyle if lifestyle is not None else LifestyleIndex(df) # Text index + transport flags for the lifestyle bonus
+        self.keywords = keywords if keywords is not None else KeywordIndex(df) # Normalized bigram index over カード名/発行会社 for keyword search
+        # Feature columns of the score rules; any weight set scores the catalog with one matrix-vector product
+        self.score_features = score_features if score_features is not None else get_rules().compile(df)
+        # Static card HTML by row label, lives and dies with this catalog
+        self.fragments = fragments if fragments is not None else LRUCache(FRAGMENT_CACHE_SIZE)
+        # Primary-key index: card id (row label, as returned by the APIs) -> position
+        self.ids = dict(zip(df.index.tolist(), range(len(df))))
+        # Rendered comparison rows by card id (see card_compare.card_entry)
+        self.compare_rows = LRUCache(COMPARE_CACHE_SIZE)
+        self.path = path
+        self.signature = signature # (mtime_ns, size) of the file this snapshot was built from
+        self.version = version     # Increases by one on every reload; used as a cache key
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "version"):
+            raise AttributeError("CardCatalog is immutable")
+        super().__setattr__(name, value)
+
+    @property
+    def empty(self):
+        return self.df.empty
+
+
+# Catalog served by the app (override with the CARDS_CSV environment variable, e.g. for benchmarks)
+CARDS_CSV = os.environ.get("CARDS_CSV", "cards.csv")
+
+# Upper bound on cached per-card HTML fragments (see display_result._render_card_parts)
+FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", "4096"))
+
+# Upper bound on cached per-card comparison rows (see card_compare.py)
+COMPARE_CACHE_SIZE = int(os.environ.get("COMPARE_CACHE_SIZE", "1024"))
+
+_lock = threading.Lock()
+_current = None
+_version = 0
+
+
+def _file_signature(file_path):
+    """ Returns (mtime_ns, size) of the file, or None if it does not exist. """
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def prepare_frame(df, infer_tiers=None):
+    """
+    Adds the request-independent derived columns to a frame returned by load_cards.
+    infer_tiers is passed to add_card_tier (needed when df is only part of the catalog).
+    """
+    df = df.reset_index(drop=True)
+    if not df.empty:
+        df["年会費数値"] = parse_annual_fees(df["年会費（税込）"]) # Parsed once; used by tier inference and fee scoring
+        df = add_card_tier(df, infer=infer_tiers)
+    return df
+
+
+def build_catalog(file_path, signature, version):
+    """
+    Builds a CardCatalog, from the compiled snapshot when it is up to date with the CSV
+    (see catalog_snapshot.py), otherwise from the CSV itself.
+    """
+    from catalog_snapshot import load_snapshot
+
+    snapshot = load_snapshot(file_path)
+    if snapshot is not None:
+        df, bitsets = snapshot
+        return CardCatalog(df, file_path, signature, version, BitmapIndex.from_bitsets(df, bitsets))
+    df = prepare_frame(load_cards(file_path))
+    return CardCatalog(df, file_path, signature, version)
+
+
+def get_catalog(file_path=None):
+    """
+    Returns the current catalog, rebuilding it only when the file's mtime/size has changed.
+    The new catalog is fully built before it replaces the old one, so concurrent readers
+    always see either the previous or the next snapshot, never a half-built one.
+    """
+    global _current, _version
+    file_path = file_path or CARDS_CSV
+    signature = _file_signature(file_path)
+    current = _current
+    if current is not None and current.path == file_path and current.signature == signature:
+        return current
+
+    with _lock:
+        current = _current
+        if current is not None and current.path == file_path and current.signature == signature:
+            return current # Another thread reloaded while we were waiting
+        _version += 1
+        if current is not None and current.path == file_path and not current.empty:
+            from catalog_reload import reload_catalog
+            catalog = reload_catalog(current, signature, _version) # Re-processes only the rows that changed
+        else:
+            catalog = build_catalog(file_path, signature, _version)
+        _current = catalog
+        return catalog
+
+
+def catalog_for(df):
+    """
+    Returns the current catalog if df is (a slice of) its frame, else None.
+    Slices keep the catalog_version attr, so a frame filtered just before a reload
+    is not mistaken for one of the new catalog.
+    """
+    catalog = _current
+    if catalog is not None and df.attrs.get("catalog_version") == catalog.version:
+        return catalog
+    return None
@@ -0,0 +1,238 @@
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+from cache import LRUCache
+from card_tier import needs_tier_inference
+from catalog import CardCatalog, load_cards, prepare_frame
+
+# Incremental catalog reload: when cards.csv changes, the new file is diffed against the
+# current catalog by カード名+発行会社 and only added or changed rows go through
+# prepare_frame and the indexes; everything else (derived columns, filter bits, text
+# postings, rendered fragments) is carried over. Falls back to a full build whenever the
+# diff cannot be trusted (columns or dtypes changed, inferred tiers).
+#
+#   python catalog_reload.py OLD.csv NEW.csv   (checks the incremental result against a full build)
+
+KEY_COLUMNS = ["カード名", "発行会社"]
+
+# How many card names a reload log line lists per kind of change
+LOG_CARD_NAMES = 5
+
+
+def card_keys(df):
+    """
+    (カード名, 発行会社, occurrence) of every row, in row order. The CSV may list the same
+    card twice; repeats are told apart by how many rows with that key came before them.
+    """
+    parts = [df[col].fillna("").astype(str) for col in KEY_COLUMNS]
+    occurrence = pd.DataFrame(dict(enumerate(parts))).groupby(list(range(len(parts))), sort=False).cumcount()
+    return list(zip(*(part.tolist() for part in parts), occurrence.tolist()))
+
+class CatalogDiff:
+    """ Row-level difference between the current catalog frame and a newly loaded CSV. """
+
+    def __init__(self, old_positions, added, changed, removed, changed_columns):
+        self.old_positions = old_positions # Per new row: its position in the old frame, -1 if added or changed
+        self.added = added # Keys of the new, changed and removed cards
+        self.changed = changed
+        self.removed = removed
+        self.changed_columns = changed_columns # {column: number of changed cards that differ in it}
+
+    @property
+    def unchanged(self):
+        return int((self.old_positions >= 0).sum())
+
+    def summary(self):
+        text = f"{len(self.added)} added, {len(self.changed)} changed, {len(self.removed)} removed, {self.unchanged} unchanged"
+        if self.changed_columns:
+            columns = sorted(self.changed_columns.items(), key=lambda item: -item[1])
+            text += "; changed columns: " + ", ".join(f"{col} ({n})" for col, n in columns)
+        for sign, keys in (("+", self.added), ("~", self.changed), ("-", self.removed)):
+            if keys:
+                names = [key[0] for key in keys[:LOG_CARD_NAMES]]
+                more = f" (+{len(keys) - LOG_CARD_NAMES} more)" if len(keys) > LOG_CARD_NAMES else ""
+                text += f"; {sign} " + ", ".join(names) + more
+        return text
+
+def _same_values(a, b):
+    """ Element-wise equality of two aligned Series where NaN equals NaN. """
+    equal = a.eq(b).fillna(False).to_numpy(dtype=bool, copy=True)
+    unequal = np.flatnonzero(~equal)
+    if len(unequal): # Only the (few) unequal rows can be a NaN pair
+        equal[unequal] = a.iloc[unequal].isna().to_numpy() & b.iloc[unequal].isna().to_numpy()
+    return equal
+
+def diff_frames(previous, raw):
+    """
+    Compares raw (load_cards output of the new CSV) with the previous catalog frame.
+    Returns (CatalogDiff, None), or (None, reason) when only a full build is safe.
+    """
+    columns = [col for col in previous.columns if col in raw.columns]
+    if columns != list(raw.columns):
+        return None, "CSV columns changed"
+    for col in columns:
+        if previous[col].dtype != raw[col].dtype:
+            return None, f"column {col} changed type ({previous[col].dtype} -> {raw[col].dtype})"
+
+    old_keys, new_keys = card_keys(previous), card_keys(raw)
+    old_index = {key: pos for pos, key in enumerate(old_keys)}
+
+    matched_new = np.array([pos for pos, key in enumerate(new_keys) if key in old_index], dtype=np.int64)
+    matched_old = np.array([old_index[new_keys[pos]] for pos in matched_new], dtype=np.int64)
+    differs = np.zeros(len(matched_new), dtype=bool)
+    changed_columns = {}
+    for col in columns:
+        a = raw[col].take(matched_new).reset_index(drop=True)
+        b = previous[col].take(matched_old).reset_index(drop=True)
+        col_differs = ~_same_values(a, b)
+        if col_differs.any():
+            changed_columns[col] = int(col_differs.sum())
+            differs |= col_differs
+
+    old_positions = np.full(len(raw), -1, dtype=np.int64)
+    old_positions[matched_new[~differs]] = matched_old[~differs]
+    new_key_set = set(new_keys)
+    diff = CatalogDiff(
+        old_positions,
+        added=[key for key in new_keys if key not in old_index],
+        changed=[new_keys[pos] for pos in matched_new[differs]],
+        removed=[key for key in old_keys if key not in new_key_set],
+        changed_columns=changed_columns,
+    )
+    return diff, None
+
+def incremental_frame(previous, raw, old_positions):
+    """
+    The frame prepare_frame(raw) would return, computing the derived columns only for
+    rows with old_positions < 0 and copying them from previous for the rest.
+    """
+    fresh = np.flatnonzero(old_positions < 0)
+    # Tiers come from the CSV (whole-catalog inference is ruled out by the caller)
+    computed = prepare_frame(raw.iloc[fresh], infer_tiers=False) if len(fresh) else None
+    source = np.where(old_positions >= 0, old_positions, 0)
+    data = {}
+    for col in previous.columns:
+        if col in raw.columns:
+            data[col] = raw[col]
+            continue
+        values = previous[col].to_numpy()[source] # Fancy indexing copies, so the result is writable
+        if computed is not None:
+            values[fresh] = computed[col].to_numpy()
+        data[col] = pd.Series(values, dtype=previous[col].dtype)
+    return pd.DataFrame(data)
+
+def _carry_fragments(fragments, old_positions, old_size):
+    """ A fragment cache holding the previous fragments of the unchanged rows, under their new labels. """
+    old_to_new = np.full(old_size, -1, dtype=np.int64)
+    kept = np.flatnonzero(old_positions >= 0)
+    old_to_new[old_positions[kept]] = kept
+    carried = LRUCache(fragments.maxsize)
+    for (label, manifest_version), parts in fragments.items():
+        if old_to_new[label] >= 0:
+            carried.put((int(old_to_new[label]), manifest_version), parts)
+    return carried
+
+def incremental_catalog(previous, raw, diff, file_path, signature, version):
+    """ CardCatalog for raw built from previous, re-processing only the rows diff marks as new or changed. """
+    old_positions = diff.old_positions
+    df = incremental_frame(previous.df, raw, old_positions)
+    return CardCatalog(
+        df, file_path, signature, version,
+        bitmaps=previous.bitmaps.updated(df, old_positions),
+        lifestyle=previous.lifestyle.updated(df, old_positions),
+        keywords=previous.keywords.updated(df, old_positions),
+        fragments=_carry_fragments(previous.fragments, old_positions, len(previous.df)),
+        score_features=previous.score_features.updated(df, old_positions),
+    )
+
+def reload_catalog(previous, signature, version, file_path=None):
+    """
+    Catalog for the current contents of previous.path (or file_path), built incrementally
+    from previous when possible and fully otherwise. Logs how long it took and what changed.
+    """
+    file_path = file_path or previous.path
+    started = time.perf_counter()
+    raw = load_cards(file_path).reset_index(drop=True)
+    loaded = time.perf_counter()
+
+    diff = None
+    if raw.empty:
+        reason = "new catalog is empty"
+    elif needs_tier_inference(raw):
+        reason = "カード区分 is inferred from the whole catalog"
+    else:
+        diff, reason = diff_frames(previous.df, raw)
+    diffed = time.perf_counter()
+
+    if diff is None:
+        catalog = CardCatalog(prepare_frame(raw), file_path, signature, version)
+        print(f"Catalog v{version}: full rebuild of {len(raw)} cards in {(time.perf_counter() - started) * 1000:.0f} ms ({reason})")
+        return catalog
+
+    old_positions = diff.old_positions
+    catalog = incremental_catalog(previous, raw, diff, file_path, signature, version)
+    done = time.perf_counter()
+    print(f"Catalog v{version}: incremental reload in {(done - started) * 1000:.0f} ms "
+          f"(read {(loaded - started) * 1000:.0f} ms, diff {(diffed - loaded) * 1000:.0f} ms, "
+          f"rebuild {(done - diffed) * 1000:.0f} ms for {int((old_positions < 0).sum())} rows): {diff.summary()}")
+    return catalog
+
+def verify_reload(old_csv, new_csv):
+    """
+    Builds the catalog of old_csv, reloads new_csv into it incrementally and compares
+    the result with a full build of new_csv. Returns a list of mismatch descriptions.
+    """
+    from display_result import _render_card_parts, prerender_fragments
+    from image_manifest import get_manifest
+
+    previous = CardCatalog(prepare_frame(load_cards(old_csv)), old_csv, None, 1)
+    prerender_fragments(previous)
+    incremental = reload_catalog(previous, None, 2, file_path=new_csv)
+    full = CardCatalog(prepare_frame(load_cards(new_csv)), new_csv, None, 2)
+
+    problems = []
+    try:
+        pd.testing.assert_frame_equal(incremental.df, full.df)
+    except AssertionError as e:
+        problems.append(f"frame: {e}")
+    expected_bits, actual_bits = full.bitmaps.bitsets(), incremental.bitmaps.bitsets()
+    for key in expected_bits.keys() | actual_bits.keys():
+        if key not in expected_bits or key not in actual_bits or not np.array_equal(expected_bits[key], actual_bits[key]):
+            problems.append(f"bitset {key}")
+
+    if not np.array_equal(incremental.score_features.values, full.score_features.values):
+        problems.append("score features")
+
+    names = full.df["カード名"].fillna("").astype(str)
+    terms = ["カード", "JCB", "ゴールド", "楽天", "ana"] + [name[:3] for name in names.head(20)]
+    for term in terms:
+        if not np.array_equal(incremental.keywords.contains(term), full.keywords.contains(term)):
+            problems.append(f"keyword {term!r}")
+        if incremental.keywords.suggest(term) != full.keywords.suggest(term):
+            problems.append(f"suggest {term!r}")
+    for keywords, single in [("", "電車"), ("amazon コンビニ", ""), ("マイル", "飛行機"), ("ガソリン", "自動車")] + [(t, "") for t in terms]:
+        if not np.array_equal(incremental.lifestyle.bonuses(keywords, single), full.lifestyle.bonuses(keywords, single)):
+            problems.append(f"lifestyle {keywords!r}/{single!r}")
+
+    manifest = get_manifest()
+    carried = incremental.fragments.items()
+    for (label, manifest_version), parts in carried:
+        if manifest_version == manifest.version and parts != _render_card_parts(full.df.loc[label], manifest):
+            problems.append(f"fragment of row {label}")
+    print(f"{len(full.df)} cards, {len(carried)} fragments carried over, {len(problems)} mismatch(es)")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check an incremental catalog reload against a full build.")
+    parser.add_argument("old_csv")
+    parser.add_argument("new_csv")
+    args = parser.parse_args(argv)
+    problems = verify_reload(args.old_csv, args.new_csv)
+    for problem in problems:
+        print(f"MISMATCH {problem}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zipfile
+import numpy as np
+import pandas as pd
+
+# Compiled, typed snapshot of cards.csv (NumPy .npz + one shared string table).
+# Holds every column of the prepared catalog frame (derived numeric columns, tier,
+# base score...) and the filter bitsets, so workers skip CSV parsing and preprocessing.
+#
+# Arrays are stored uncompressed, so a loaded snapshot can map them straight from the file.
+#
+#   python catalog_snapshot.py [cards.csv] [-o cards.snapshot.npz] [--check]
+
+SNAPSHOT_FORMAT = 1
+
+# Memory-map snapshot arrays instead of reading them into each process (CATALOG_MMAP=0 to disable)
+SNAPSHOT_MMAP = os.environ.get("CATALOG_MMAP", "1") != "0"
+
+# Source files whose code determines what a snapshot contains. Editing any of them
+# (or upgrading pandas/numpy) makes existing snapshots stale.
+_DERIVATION_FILES = ["catalog.py", "filter_index.py", "scoring.py", "score_rules.py", "score_rules.json",
+                     "card_tier.py", "form_groups.py", "catalog_snapshot.py"]
+
+
+def snapshot_path(csv_path):
+    """ Default snapshot location: next to the CSV (cards.csv -> cards.snapshot.npz). """
+    return os.path.splitext(csv_path)[0] + ".snapshot.npz"
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def code_fingerprint():
+    h = hashlib.sha256(f"{SNAPSHOT_FORMAT}|{pd.__version__}|{np.__version__}".encode("utf-8"))
+    base = os.path.dirname(os.path.abspath(__file__))
+    for name in _DERIVATION_FILES:
+        try:
+            with open(os.path.join(base, name), "rb") as f:
+                h.update(f.read())
+        except OSError:
+            h.update(b"missing:" + name.encode("utf-8"))
+    return h.hexdigest()
+
+
+def write_snapshot(df, bitsets, csv_path, out_path, skipped=()):
+    """
+    Writes the prepared frame and {(group, option): packed bits} to out_path.
+    The file is written next to the target and renamed into place, so readers never see a partial snapshot.
+    """
+    arrays = {}
+    columns = []
+    table = []       # Shared string table
+    table_codes = {} # str -> position in table
+    for i, col in enumerate(df.columns):
+        s = df[col]
+        if pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s):
+            arrays[f"c{i}"] = s.to_numpy()
+            columns.append({"name": col, "dtype": str(s.dtype), "kind": "value"})
+            continue
+        # Text column: per-column factorize, then remap the uniques into the shared table
+        codes, uniques = pd.factorize(s, use_na_sentinel=True)
+        remap = np.empty(len(uniques), dtype=np.int32)
+        for j, value in enumerate(uniques):
+            value = str(value)
+            if value not in table_codes:
+                table_codes[value] = len(table)
+                table.append(value)
+            remap[j] = table_codes[value]
+        arrays[f"c{i}"] = np.where(codes < 0, -1, remap[codes] if len(remap) else -1).astype(np.int32)
+        columns.append({"name": col, "dtype": str(s.dtype), "kind": "text"})
+
+    joined = "".join(table)
+    arrays["strings_blob"] = np.frombuffer(joined.encode("utf-8"), dtype=np.uint8)
+    arrays["strings_offsets"] = np.cumsum([0] + [len(t) for t in table], dtype=np.int64) # In characters
+
+    bitset_keys = []
+    for j, (key, bits) in enumerate(bitsets.items()):
+        arrays[f"b{j}"] = bits
+        bitset_keys.append(list(key))
+
+    st = os.stat(csv_path)
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "code": code_fingerprint(),
+        "csv": {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": _sha256(csv_path)},
+        "rows": len(df),
+        "columns": columns,
+        "bitsets": bitset_keys,
+        "skipped_lines": list(skipped),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    arrays["meta"] = np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, out_path)
+    return meta
+
+
+def _read_meta(z):
+    return json.loads(z["meta"].tobytes().decode("utf-8"))
+
+def _map_members(path):
+    """
+    {member name: array} of an .npz written by np.savez, as read-only views of one
+    memory mapping of the file. Nothing is copied: the pages come from the OS page cache,
+    so every process (e.g. each gunicorn worker) mapping the same snapshot shares them.
+    """
+    arrays = {}
+    with open(path, "rb") as f, zipfile.ZipFile(f) as zf:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"member {info.filename} is compressed")
+            # Local file header: fixed 30 bytes, then file name and extra field
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            count = int(np.prod(shape, dtype=np.int64))
+            values = np.frombuffer(mapped, dtype=dtype, count=count, offset=f.tell()) if count else np.empty(0, dtype=dtype)
+            arrays[os.path.splitext(info.filename)[0]] = values.reshape(shape, order="F" if fortran_order else "C")
+    return arrays
+
+def _read_members(path):
+    with np.load(path, allow_pickle=False) as z:
+        return {name: z[name] for name in z.files}
+
+def is_fresh(meta, csv_path):
+    """ True if the snapshot was compiled by the current code from the current CSV contents. """
+    if meta.get("format") != SNAPSHOT_FORMAT or meta.get("code") != code_fingerprint():
+        return False
+    try:
+        st = os.stat(csv_path)
+    except OSError:
+        return False
+    src = meta["csv"]
+    if st.st_size != src["size"]:
+        return False
+    # Same size and mtime: unchanged. Same size, new mtime (copied/touched): compare contents.
+    return st.st_mtime_ns == src["mtime_ns"] or _sha256(csv_path) == src["sha256"]
+
+def load_snapshot(csv_path="cards.csv", path=None, mmap_arrays=None):
+    """
+    Loads (df, bitsets) from the compiled snapshot of csv_path.
+    Returns None when there is no snapshot or it is stale, so the caller falls back to the CSV.
+    With mmap_arrays (default: CATALOG_MMAP), numeric columns (parsed fees, ...)
+    and filter bitsets are read-only views of the mapped file instead of private copies.
+    """
+    path = path or snapshot_path(csv_path)
+    if mmap_arrays is None:
+        mmap_arrays = SNAPSHOT_MMAP
+    if not os.path.exists(path):
+        return None
+    try:
+        z = _map_members(path) if mmap_arrays else _read_members(path)
+        meta = _read_meta(z)
+        if not is_fresh(meta, csv_path):
+            print(f"Snapshot {path} is stale; loading {csv_path} instead.")
+            return None
+
+        joined = z["strings_blob"].tobytes().decode("utf-8")
+        offsets = z["strings_offsets"]
+        # Last slot is the missing value, so code -1 maps to it
+        table = np.array([joined[offsets[k]:offsets[k + 1]] for k in range(len(offsets) - 1)] + [None], dtype=object)
+
+        data = {}
+        for i, col in enumerate(meta["columns"]):
+            values = z[f"c{i}"]
+            if col["kind"] == "text":
+                values = table[values]
+            # copy=False keeps numeric columns on the mapped pages
+            data[col["name"]] = pd.Series(values, dtype=pd.api.types.pandas_dtype(col["dtype"]), copy=False)
+        df = pd.DataFrame(data, copy=False)
+        bitsets = {tuple(key): z[f"b{j}"] for j, key in enumerate(meta["bitsets"])}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile, struct.error) as e:
+        print(f"Could not read snapshot {path}: {e}")
+        return None
+    return df, bitsets
+
+
+def ensure_snapshot(csv_path="cards.csv", path=None):
+    """ Compiles the snapshot of csv_path unless an up-to-date one exists. Returns True if a usable snapshot exists. """
+    path = path or snapshot_path(csv_path)
+    try:
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as z:
+                if is_fresh(_read_meta(z), csv_path):
+                    return True
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        print(f"Could not read snapshot {path}: {e}")
+    try:
+        meta = compile_snapshot(csv_path, path)
+    except (OSError, ValueError) as e:
+        print(f"Could not compile snapshot of {csv_path}: {e}")
+        return False
+    print(f"Compiled snapshot {path} ({meta['rows']} cards)")
+    return True
+
+def compile_snapshot(csv_path="cards.csv", out_path=None):
+    """ Compiles csv_path into a snapshot. Returns the snapshot metadata (including skipped lines). """
+    from catalog import load_cards, prepare_frame
+    from filter_index import BitmapIndex
+
+    out_path = out_path or snapshot_path(csv_path)
+    skipped = []
+    df = prepare_frame(load_cards(csv_path, skipped))
+    if df.empty:
+        raise ValueError(f"{csv_path} contains no cards")
+    return write_snapshot(df, BitmapIndex(df).bitsets(), csv_path, out_path, skipped)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile cards.csv into a binary catalog snapshot.")
+    parser.add_argument("csv", nargs="?", default="cards.csv")
+    parser.add_argument("-o", "--output", help="snapshot path (default: <csv>.snapshot.npz)")
+    parser.add_argument("--check", action="store_true", help="verify that the snapshot loads back identical to the CSV")
+    args = parser.parse_args(argv)
+    out_path = args.output or snapshot_path(args.csv)
+
+    start = time.perf_counter()
+    try:
+        meta = compile_snapshot(args.csv, out_path)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Compiled {meta['rows']} cards, {len(meta['columns'])} columns, {len(meta['bitsets'])} filter bitsets "
+          f"into {out_path} ({os.path.getsize(out_path):,} bytes) in {time.perf_counter() - start:.2f}s")
+    if meta["skipped_lines"]:
+        print(f"Skipped {len(meta['skipped_lines'])} malformed line(s):")
+        for line in meta["skipped_lines"]:
+            print(f"  - {line}")
+    else:
+        print("No malformed lines.")
+
+    if args.check:
+        from catalog import load_cards, prepare_frame
+
+        start = time.perf_counter()
+        df, _ = load_snapshot(args.csv, out_path)
+        elapsed = time.perf_counter() - start
+        pd.testing.assert_frame_equal(df, prepare_frame(load_cards(args.csv)))
+        print(f"Check OK: snapshot loads back identical to the CSV in {elapsed * 1000:.1f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,43 +1,51 @@
+import hashlib
+import json
+import threading
 import pandas as pd 
+from cache import LRUCache
+from ranking import top_k
+from score_rules import catalog_scores, compute_base_scores, score_key
 
-def _score_row(row):
-    
-    cashback_text = row.get("還元率数値", 0)
-    try:
-        cashback = float(cashback_text) if cashback_text is not None else 0.0
-    except (ValueError, TypeError):
-        cashback = 0.0
-    cashback_score = min(cashback / 0.5, 5)
+# The chart plots the same 基本スコア the results page ranks by (score_rules.json)
 
-    insurance = str(row.get("旅行保険_有無", "なし"))
-    insurance_score = 5 if "あり" in insurance else 1
-
-    fee = str(row.get("年会費（税込）", ""))
-    cond = str(row.get("年会費条件", ""))
-    if "無料" in fee and "初年度" not in fee:
-        fee_score = 5
-    elif "条件" in cond or "初年度無料" in fee or "条件付" in fee:
-        fee_score = 3
-    else:
-        fee_score = 1
-
-    brands = str(row.get("国際ブランド", "")).split("/")
-    brand_score = min(len([b for b in brands if b.strip()]), 5)
-
-    return cashback_score + insurance_score + fee_score + brand_score
-
-def prepare_chart_data(df):
+def prepare_chart_data(df, scores=None):
+    """
+    Returns [{"id", "label", "score"}] for every card, highest score first (ties in row order).
+    scores are the base scores of df's rows (computed from the default weights if omitted).
+    """
     chart_list = []
     if not df.empty:
         try:
-            for _, row in df.iterrows():
-
-                label = row.get("カード名", "不明なカード")
-                score = _score_row(row)
-                chart_list.append({"label": label, "score": score})
-
-            chart_list.sort(key=lambda item: item['score'], reverse=True)
+            if scores is None:
+                scores = compute_base_scores(df)
+            labels = df["カード名"].astype(object).where(df["カード名"].notna(), "不明なカード") if "カード名" in df.columns \
+                else pd.Series("不明なカード", index=df.index)
+            ids = df.index.tolist()
+            for pos in top_k(scores, len(df)):
+                chart_list.append({"id": ids[pos], "label": labels.iloc[pos], "score": round(float(scores[pos]), 2)})
         except Exception as e:
             print(f"チャートデータ準備中にエラー: {e}")
 
-            return []
\ No newline at end of file
+            return []
+    return chart_list
+
+
+# Pre-serialized /api/chart responses: (catalog version, score_key) -> (body bytes, etag)
+_chart_cache = LRUCache(8)
+_chart_lock = threading.Lock()
+
+def chart_response_body(catalog, weight_set=None):
+    """ Returns (body, etag) for the catalog, serializing the chart only once per catalog version and weights. """
+    key = (catalog.version, score_key(weight_set))
+    cached = _chart_cache.get(key)
+    if cached is not None:
+        return cached
+    with _chart_lock:
+        cached = _chart_cache.get(key)
+        if cached is None:
+            cards = prepare_chart_data(catalog.df, catalog_scores(catalog, weight_set))
+            body = json.dumps({"catalog_version": catalog.version, "weight_set": key[1][1], "cards": cards},
+                              ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            cached = (body, hashlib.sha256(body).hexdigest()[:32])
+            _chart_cache.put(key, cached)
+        return cached
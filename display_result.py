@@ -1,8 +1,22 @@
-import os
+import numpy as np
 import pandas as pd
 import re # キーワード検索のために re をインポート
+from catalog import catalog_for
+from card_tier import parse_annual_fees
+from ranking import top_k, top_k_by_group
+from instrumentation import stage
+from image_manifest import get_manifest
+from static_assets import asset_slot, resolve_asset_urls
+from score_rules import catalog_scores, compute_base_scores
 
-# 100点満点の「基本スコア」を計算する関数
+def _parse_fee_or_none(fee_text):
+    """ Parses one 年会費 string with the shared card_tier parser (None if it has no amount). """
+    value = parse_annual_fees(pd.Series([fee_text], dtype=object)).iloc[0]
+    return None if pd.isna(value) else value
+
+# 100点満点の「基本スコア」を計算する関数 (1行ずつの参照実装)
+# 実際の採点は score_rules.json のルールで行う。既定の重みがこの関数と一致することを
+# scoring.verify_base_scores で確認している。
 def _calculate_base_score(row):
     """ カードの各特徴に基づき、100点満点で「基本スコア」を算出する """
     total_score = 0
@@ -24,14 +38,13 @@ def _calculate_base_score(row):
     elif "条件" in cond or "初年度無料" in fee or "条件付" in fee:
         total_score += 10 
     else: 
-        try:
-            fee_val_str = "".join(filter(str.isdigit, fee.replace(",", "")))
-            fee_val = int(fee_val_str) if fee_val_str else 99999
-            if fee_val <= 2200:
-                total_score += 5 
-            else:
-                total_score += 1 
-        except ValueError:
+        # 年会費数値 is parsed once at load time (card_tier.parse_annual_fees); no amount counts as expensive
+        fee_val = row.get("年会費数値")
+        if fee_val is None:
+            fee_val = _parse_fee_or_none(row.get("年会費（税込）"))
+        if fee_val is not None and not pd.isna(fee_val) and fee_val <= 2200:
+            total_score += 5 
+        else:
             total_score += 1 
 
     # --- 3. 保険スコア (最大15点) ---
@@ -134,21 +147,12 @@ def _kv(label, value):
     v = _fmt(value)
     return f"<tr><th>{label}</th><td>{v}</td></tr>" if v else ""
 
-def _generate_card_html(rank, index, r, base_score, bonus_score, total_score):
-    """ 単一のカードのHTMLブロックを生成する (スコア引数を追加) """
-    brands = [b.strip() for b in str(r.get("国際ブランド","")).split("/") if b.strip()]
-    brand_ul = "<ul class='brand-list'>" + "".join(f"<li>{b}</li>" for b in brands) + "</ul>" if brands else ""
+# Markers left in the static card template where the per-request rank and scores go
+_RANK_SLOT = "\x00rank\x00"
+_SCORE_SLOT = "\x00score\x00"
 
-    img = _fmt(r.get("画像ファイル名","")) or "default.png"
-    img_path = os.path.join("static", "images", img)
-    if not os.path.isfile(img_path):
-        img = "default.png" 
-
-    tier = _fmt(r.get("カード区分","")) or "（区分未設定）"
-    badge = "badge-normal"
-    if tier == "ゴールド": badge = "badge-gold"
-    elif tier == "プラチナ": badge = "badge-platinum"
-    
+def _score_html(base_score, bonus_score, total_score):
+    """ スコア表示部分 (リクエストごとに変わる部分) のHTML """
     score_html = f"<p><strong>総合スコア：</strong>{total_score:.0f} 点</p>"
     if bonus_score > 0:
         score_html += f"""
@@ -162,18 +166,47 @@ def _generate_card_html(rank, index, r, base_score, bonus_score, total_score):
           (基本スコア {base_score:.0f}点)
         </p>
         """
+    return score_html
 
+def _value_html(summary):
+    """ 年間シミュレーション結果の表示部分 (spend_simulator.Simulation.summary の値) """
     return f"""
+        <p><strong>年間の実質還元額：</strong>{summary['net_yen']:,} 円</p>
+        <p style="font-size: 0.9em; color: #555; margin-top: -8px;">
+          (ポイント {summary['annual_points']:,.0f}pt ≒ {summary['reward_yen']:,}円 − 年会費 {summary['fee_yen']:,}円)
+        </p>
+        """
+
+def _render_card_parts(r, manifest=None):
+    """
+    Renders the static part of a card block once.
+    Returns (head, middle, tail): the block is head + rank + middle + score HTML + tail.
+    The image URL is left as an asset_slot (see static_assets.resolve_asset_urls).
+    """
+    if manifest is None:
+        manifest = get_manifest()
+    brands = [b.strip() for b in str(r.get("国際ブランド","")).split("/") if b.strip()]
+    brand_ul = "<ul class='brand-list'>" + "".join(f"<li>{b}</li>" for b in brands) + "</ul>" if brands else ""
+
+    # Missing images fall back to default.png (in-memory manifest lookup, no filesystem call)
+    img = manifest.resolve(_fmt(r.get("画像ファイル名","")) or "default.png")
+
+    tier = _fmt(r.get("カード区分","")) or "（区分未設定）"
+    badge = "badge-normal"
+    if tier == "ゴールド": badge = "badge-gold"
+    elif tier == "プラチナ": badge = "badge-platinum"
+    
+    html = f"""
     <div class="card">
       <div class="card-header">
         <div>
-          <h3>{rank}位：{_fmt(r.get('カード名'))}</h3>
+          <h3>{_RANK_SLOT}位：{_fmt(r.get('カード名'))}</h3>
           <div class="subline">{_fmt(r.get('発行会社'))} | <span class="badge {badge}">{tier}</span></div>
         </div>
-        <img src="/static/images/{img}" class="card-image" alt="{_fmt(r.get('カード名'))}" loading="lazy">
+        <img src="{asset_slot('images/' + img)}" class="card-image" alt="{_fmt(r.get('カード名'))}" loading="lazy">
       </div>
       
-      {score_html} <p><strong>国際ブランド：</strong></p>
+      {_SCORE_SLOT} <p><strong>国際ブランド：</strong></p>
       {brand_ul}
 
       <details class="details">
@@ -212,64 +245,164 @@ def _generate_card_html(rank, index, r, base_score, bonus_score, total_score):
       </details>
     </div>
     """
+    head, rest = html.split(_RANK_SLOT)
+    middle, tail = rest.split(_SCORE_SLOT)
+    return head, middle, tail
 
-def display_cards(df, is_fallback=False, lifestyle_keywords="", lifestyle_single=""):
-    """ Generates HTML to display a list of recommended cards sorted by score. """
-    
+def prerender_fragments(catalog, limit=None):
+    """
+    Renders the static HTML of the highest base-score cards (the ones most often shown)
+    into catalog.fragments ahead of time, up to limit or the cache size. Run in the
+    gunicorn master, the fragments are then shared by every forked worker.
+    """
+    manifest = get_manifest()
+    df = catalog.df
     if df.empty:
-        return "<p>エラー: カードデータ(cards.csv)の読み込みに失敗しました。</p>"
+        return 0
+    limit = min(limit or catalog.fragments.maxsize, catalog.fragments.maxsize, len(df))
+    positions = top_k(catalog_scores(catalog), limit)
+    for pos in positions:
+        catalog.fragments.put((df.index[pos], manifest.version), _render_card_parts(df.iloc[pos], manifest))
+    return len(positions)
 
-    try:
-        rows_with_scores = []
-        for index, row in df.iterrows():
-            base_score = _calculate_base_score(row)
-            bonus_score = _calculate_lifestyle_bonus(row, lifestyle_keywords, lifestyle_single)
-            total_score = base_score + bonus_score
-            rows_with_scores.append((index, row, base_score, bonus_score, total_score))
-
-        # 総合スコア(total_score)でソート
-        rows_with_scores.sort(key=lambda t: t[4], reverse=True) 
-        
-    except Exception as e:
-        print(f"Error during scoring/sorting: {e}")
-        return f"<p>結果の表示中にエラーが発生しました: {e}</p>"
+def _generate_card_html(rank, index, r, base_score, bonus_score, total_score, parts=None, extra_html=""):
+    """ 単一のカードのHTMLブロックを生成する (静的部分 parts はキャッシュから渡せる) """
+    head, middle, tail = parts if parts is not None else _render_card_parts(r)
+    # 比較用チェックボックスは行ラベル次第なので静的部分には含めない (再読み込みで行が移動する)
+    pick = f'<label class="compare-pick"><input type="checkbox" name="ids" value="{index}" form="compare-form"> 比較する</label>'
+    return head + str(rank) + middle + pick + _score_html(base_score, bonus_score, total_score) + extra_html + tail
+
+def score_cards(df, lifestyle_keywords="", lifestyle_single="", weight_set=None):
+    """ Returns (base, bonus, total) score arrays for the rows of df, in row order (base under weight_set). """
+    # Catalog frames look their scores up by catalog position (rows are labelled by it):
+    # base scores from the catalog's compiled features, bonuses from its text index.
+    # Only frames that did not come from the catalog are evaluated row by row.
+    catalog = catalog_for(df)
+    if catalog is not None:
+        positions = df.index.to_numpy()
+        base_scores = catalog_scores(catalog, weight_set)[positions]
+        bonus_scores = catalog.lifestyle.bonuses(lifestyle_keywords, lifestyle_single)[positions]
+    else:
+        base_scores = compute_base_scores(df, weight_set)
+        bonus_scores = np.array([_calculate_lifestyle_bonus(row, lifestyle_keywords, lifestyle_single) for _, row in df.iterrows()], dtype=int)
 
-    html = "" 
+    return base_scores, bonus_scores, base_scores + bonus_scores
+
+# Sections shown in fallback mode: (tier, heading color)
+FALLBACK_TIERS = [("プラチナ", "#aaa"), ("ゴールド", "#f0b400"), ("一般", "#007bff")]
+
+def rank_cards(df, is_fallback=False, lifestyle_keywords="", lifestyle_single="", limit=10, weight_set=None, ranking_values=None):
+    """
+    Scores df and picks the cards to show, without rendering anything.
+    Returns (base, bonus, total, sections): score arrays in row order and a list of
+    (tier or None, positions) sections - one per tier (top 3 each) in fallback mode,
+    otherwise a single section with the top `limit` cards. Cards are picked by total
+    score, or by ranking_values (row order, e.g. simulated yearly value) when given.
+    """
+    with stage("score"):
+        base_scores, bonus_scores, total_scores = score_cards(df, lifestyle_keywords, lifestyle_single, weight_set)
+
+    # 総合スコア(total_score)の上位だけを選ぶ (同点はデータ順のまま)
+    values = total_scores if ranking_values is None else ranking_values
+    with stage("rank"):
+        if is_fallback:
+            # 区分ごとに上位3件（またはそれ以下）を1回の走査で取得
+            by_tier = top_k_by_group(values, df["カード区分"].to_numpy(), [t for t, _ in FALLBACK_TIERS], 3)
+            sections = [(tier, by_tier[tier]) for tier, _ in FALLBACK_TIERS]
+        else:
+            sections = [(None, top_k(values, limit))]
+    return base_scores, bonus_scores, total_scores, sections
+
+def _result_chunks(df, is_fallback, sections, base_scores, bonus_scores, total_scores, heading, simulation=None):
+    """ Yields the results HTML piece by piece: notice/headings and one block per card (with its simulated value if given). """
+    # Static card HTML is cached per catalog (dropped on reload), keyed by catalog row
+    # and image manifest version (a changed static/images re-renders the image tags)
+    catalog = catalog_for(df)
+    manifest = get_manifest()
+
+    def card_blocks(positions):
+        for rank, pos in enumerate(positions, 1):
+            index = df.index[pos]
+            key = (index, manifest.version)
+            parts = catalog.fragments.get(key) if catalog is not None else None
+            if parts is None:
+                parts = _render_card_parts(df.iloc[pos], manifest)
+                if catalog is not None:
+                    catalog.fragments.put(key, parts)
+            extra = _value_html(simulation.summary(pos)) if simulation is not None else ""
+            yield _generate_card_html(rank, index, None, base_scores[pos], bonus_scores[pos], total_scores[pos], parts, extra)
 
     if is_fallback:
-        html += """
+        yield """
         <div style='background-color: #fff8e1; border: 1px solid #ffecb3; padding: 15px; border-radius: 6px; margin-bottom: 20px;'>
           <strong>該当したカードがありませんでした。</strong><br>
           おすすめのカードはこちらです。
         </div>
         """
-        
-        # 区分ごとに分類し、上位3件（またはそれ以下）を取得
-        platinum_cards = [t for t in rows_with_scores if t[1].get("カード区分") == "プラチナ"][:3]
-        gold_cards = [t for t in rows_with_scores if t[1].get("カード区分") == "ゴールド"][:3]
-        general_cards = [t for t in rows_with_scores if t[1].get("カード区分") == "一般"][:3]
-
-        if platinum_cards:
-            html += "<h2 style='margin-bottom: 16px; border-bottom: 2px solid #aaa;'>おすすめのプラチナカード (Top 3)</h2>"
-            for rank, (index, r, base, bonus, total) in enumerate(platinum_cards, 1):
-                html += _generate_card_html(rank, index, r, base, bonus, total)
-        
-        if gold_cards:
-            html += "<h2 style='margin-bottom: 16px; border-bottom: 2px solid #f0b400;'>おすすめのゴールドカード (Top 3)</h2>"
-            for rank, (index, r, base, bonus, total) in enumerate(gold_cards, 1):
-                html += _generate_card_html(rank, index, r, base, bonus, total)
 
-        if general_cards:
-            html += "<h2 style='margin-bottom: 16px; border-bottom: 2px solid #007bff;'>おすすめの一般カード (Top 3)</h2>"
-            for rank, (index, r, base, bonus, total) in enumerate(general_cards, 1):
-                html += _generate_card_html(rank, index, r, base, bonus, total)
+        colors = dict(FALLBACK_TIERS)
+        for tier, positions in sections:
+            if len(positions):
+                yield f"<h2 style='margin-bottom: 16px; border-bottom: 2px solid {colors[tier]};'>おすすめの{tier}カード (Top 3)</h2>"
+                yield from card_blocks(positions)
 
     else:
        
-        html += "<h2 style='margin-bottom: 16px;'>おすすめカード Top 10</h2>"
-       
-        for rank, (index, r, base, bonus, total) in enumerate(rows_with_scores[:10], 1): 
-            html += _generate_card_html(rank, index, r, base, bonus, total)
-       
+        yield f"<h2 style='margin-bottom: 16px;'>{heading}</h2>"
+        yield from card_blocks(sections[0][1])
+
+def render_results(df, is_fallback=False, lifestyle_keywords="", lifestyle_single="", weight_set=None, simulation=None):
+    """
+    Same as display_cards, but returns (html, card ids) where card ids are the shown catalog
+    rows in display order. The html is cacheable: image URLs are still asset slots, to be
+    filled in per response with static_assets.resolve_asset_urls. With a simulation (spend_simulator.simulate of df), cards are
+    ranked by simulated yearly net value instead of score.
+    """
     
-    return html
\ No newline at end of file
+    if df.empty:
+        return "<p>エラー: カードデータ(cards.csv)の読み込みに失敗しました。</p>", []
+
+    try:
+        base_scores, bonus_scores, total_scores, sections = rank_cards(
+            df, is_fallback, lifestyle_keywords, lifestyle_single, weight_set=weight_set,
+            ranking_values=simulation.net if simulation is not None else None)
+
+    except Exception as e:
+        print(f"Error during scoring/sorting: {e}")
+        return f"<p>結果の表示中にエラーが発生しました: {e}</p>", []
+
+    card_ids = [i for _, positions in sections for i in df.index[positions].tolist()]
+    with stage("render"):
+        heading = "年間の実質還元額 Top 10" if simulation is not None else "おすすめカード Top 10"
+        html = "".join(_result_chunks(df, is_fallback, sections, base_scores, bonus_scores, total_scores, heading, simulation))
+    return html, card_ids
+
+def iter_results(df, is_fallback=False, lifestyle_keywords="", lifestyle_single="", limit=None, weight_set=None, simulation=None):
+    """
+    Generator version of display_cards for streaming responses: yields the heading and
+    then one card block at a time, so nothing is accumulated. limit=None shows every
+    matching card (fallback mode still shows the per-tier Top 3).
+    """
+    if df.empty:
+        yield "<p>エラー: カードデータ(cards.csv)の読み込みに失敗しました。</p>"
+        return
+
+    try:
+        base_scores, bonus_scores, total_scores, sections = rank_cards(
+            df, is_fallback, lifestyle_keywords, lifestyle_single, limit=len(df) if limit is None else limit,
+            weight_set=weight_set, ranking_values=simulation.net if simulation is not None else None)
+
+    except Exception as e:
+        print(f"Error during scoring/sorting: {e}")
+        yield f"<p>結果の表示中にエラーが発生しました: {e}</p>"
+        return
+
+    order = "年間の実質還元額順" if simulation is not None else "スコア順"
+    heading = f"該当カード 全{len(df)}件 ({order})" if limit is None else f"おすすめカード Top {limit}"
+    for chunk in _result_chunks(df, is_fallback, sections, base_scores, bonus_scores, total_scores, heading, simulation):
+        yield resolve_asset_urls(chunk)
+
+def display_cards(df, is_fallback=False, lifestyle_keywords="", lifestyle_single=""):
+    """ Generates HTML to display a list of recommended cards sorted by score. """
+    html, _ = render_results(df, is_fallback, lifestyle_keywords, lifestyle_single)
+    return resolve_asset_urls(html)
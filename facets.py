@@ -0,0 +1,82 @@
+import os
+from cache import LRUCache
+from filter_index import GROUP_MODES
+from filter_logic import filter_predicates
+from form_groups import option_values
+from result_cache import normalize_query
+
+# Facet counts for the diagnosis form: for every checkbox option, how many cards would
+# match if that option were toggled in the current selection. Computed from the
+# catalog's per-option bitsets: the selection of every other group is ANDed once per
+# group, then each option costs one OR/AND and a popcount, without running filter_cards.
+
+FACET_CACHE_SIZE = int(os.environ.get("FACET_CACHE_SIZE", "1024"))
+
+# (catalog version, normalized query) -> response dict
+_facet_cache = LRUCache(FACET_CACHE_SIZE)
+
+
+def _group_bits(index, group, options):
+    """ Bitset selected by one group (every card when nothing is checked), combined as in filter_cards. """
+    if not options:
+        return index.all
+    if GROUP_MODES[group] == "any":
+        return index.any_of(group, options)
+    return index.all_of(group, options)
+
+def _selection(params):
+    """ Checked options per group, as filter_cards sees them (campaigns only knows 入会特典あり). """
+    selected = {group: list(dict.fromkeys(params.get(group) or [])) for group in GROUP_MODES}
+    selected["campaigns"] = ["入会特典あり"] if "入会特典あり" in selected["campaigns"] else []
+    return selected
+
+def facet_counts(catalog, params):
+    """
+    Returns {"total": cards matching the current selection, "facets": {group: [{"value",
+    "count", "selected"}...]}}, where count is the number of matches with that option toggled.
+    Options are listed in form order. A count of 0 means toggling it would fall back.
+    """
+    index, df = catalog.bitmaps, catalog.df
+    if df.empty:
+        return {"total": 0, "facets": {group: [] for group in GROUP_MODES}}
+
+    # Amount and keyword are not facets: they narrow every count the same way
+    base = index.all
+    for predicate in filter_predicates(index, amount=params.get("amount", -1), keyword=params.get("keyword", "")):
+        base = predicate.apply(index, df, base)
+
+    selected = _selection(params)
+    groups = list(GROUP_MODES)
+    bits = [_group_bits(index, group, selected[group]) for group in groups]
+
+    # others[i] = base AND every group except groups[i] (prefix/suffix products)
+    prefix = [base]
+    for group_bits in bits[:-1]:
+        prefix.append(prefix[-1] & group_bits)
+    others = [None] * len(groups)
+    suffix = index.all
+    for i in range(len(groups) - 1, -1, -1):
+        others[i] = prefix[i] & suffix
+        suffix = suffix & bits[i]
+
+    facets = {}
+    for i, group in enumerate(groups):
+        current = selected[group]
+        entries = []
+        for option in option_values(group):
+            is_selected = option in current
+            toggled = [o for o in current if o != option] if is_selected else current + [option]
+            count = index.count(others[i] & _group_bits(index, group, toggled))
+            entries.append({"value": option, "count": count, "selected": is_selected})
+        facets[group] = entries
+
+    return {"total": index.count(others[0] & bits[0]), "facets": facets}
+
+def cached_facet_counts(catalog, params):
+    """ facet_counts, memoized per catalog version and normalized query (lifestyle inputs do not matter). """
+    key = (catalog.version, normalize_query(params)[:4])
+    result = _facet_cache.get(key)
+    if result is None:
+        result = facet_counts(catalog, params)
+        _facet_cache.put(key, result)
+    return result
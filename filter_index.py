@@ -0,0 +1,222 @@
+import re
+import numpy as np
+import pandas as pd
+from form_groups import option_values
+
+# How the options selected inside each checkbox group are combined by filter_cards
+GROUP_MODES = {
+    "tiers": "any",
+    "brands": "any",
+    "points": "any",
+    "applicant_type": "any",
+    "e_money": "all",
+    "wallets": "all",
+    "insurance": "all",
+    "features": "all",
+    "campaigns": "all",
+}
+
+# Values of 月々の推奨利用額 that the amount filter can select
+USAGE_BUCKETS = ["～1万円", "1万円～3万円", "3万円～5万円", "5万円～"]
+
+# Number of set bits in each byte value, for popcounts over packed bitsets
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_bitwise_count = getattr(np, "bitwise_count", None) # NumPy >= 2.0
+
+def _has_bonus(text):
+    """ Checks if a card has a sign-up bonus based on the text. """
+    s = str(text).strip()
+    if not s or s.lower() == "nan":
+        return False
+    # Check for any digit
+    if re.search(r'\d', s):
+        nums = re.findall(r'[0-9,]+', s)
+        try:
+            # Check if the first number found is greater than 0
+            if nums:
+                val = int(nums[0].replace(',', ''))
+                return val > 0
+            else: # Contains digits but not in expected number format, assume bonus
+                return True
+        except (ValueError, IndexError):
+            return True # Error during conversion, but text exists
+    elif len(s) > 0: # Non-empty string without digits
+         return True
+    else: # Empty string
+         return False
+
+def _text(df, col):
+    return df[col].fillna("").astype(str)
+
+def _not_blank(df, col):
+    s = df[col].fillna("")
+    return s.str.strip().ne("") & s.str.strip().ne("なし")
+
+def option_mask(df, group, option):
+    """
+    Evaluates a single checkbox option against every row.
+    Returns a boolean numpy array, or None if the option does not filter anything
+    (unknown insurance/feature/campaign values are ignored by filter_cards).
+    """
+    if group == "amount":
+        mask = df["月々の推奨利用額"].astype(str).str.strip() == option
+    elif group == "tiers":
+        mask = df["カード区分"].isin([option])
+    elif group == "brands":
+        mask = _text(df, "国際ブランド").str.contains(option, regex=False)
+    elif group == "e_money":
+        mask = _text(df, "電子マネー対応").str.contains(option, regex=False)
+    elif group == "wallets":
+        mask = _text(df, "スマホ決済対応").str.contains(option, regex=False)
+    elif group == "applicant_type":
+        mask = _text(df, "申込対象").str.contains(option, regex=False)
+    elif group == "points":
+        keyword_to_search = "マイル" if "マイル" in option else option.replace("ポイント", "")
+        mask = (
+            df["ポイントプログラム名"].fillna("").str.contains(keyword_to_search, case=False, regex=False) |
+            df["メリット"].fillna("").str.contains(keyword_to_search, case=False, regex=False)
+        )
+    elif group == "insurance":
+        if option == "海外旅行保険あり":
+            mask = df["海外旅行保険数値"] > 0
+        elif option == "国内旅行保険あり":
+            mask1 = df["旅行保険_有無"].fillna("").str.contains("あり")
+            mask2 = df["メリット"].fillna("").str.contains("国内") | df["デメリット"].fillna("").str.contains("国内")
+            mask = mask1 & mask2
+        elif option == "ショッピング保険あり":
+            mask = df["ショッピング保険数値"] > 0
+        else:
+            return None
+    elif group == "features":
+        if option == "年会費無料":
+            mask = df["年会費（税込）"].fillna("").str.contains("無料")
+        elif option == "空港ラウンジ":
+            mask = _not_blank(df, "空港ラウンジ")
+        elif option == "コンシェルジュ":
+            mask = df["コンシェルジュ"].fillna("").str.contains("あり")
+        elif option == "タッチ決済":
+            mask = _not_blank(df, "タッチ決済対応") & df["タッチ決済対応"].fillna("").str.lower().ne("nan")
+        elif option == "ETC無料":
+            mask = df["ETC_年会費"].fillna("").str.contains("無料")
+        elif option == "家族カード":
+            mask = df["家族カード可否"].fillna("").str.contains("あり")
+        elif option == "即時発行":
+            mask = df["即時発行"].fillna("").str.contains("あり")
+        elif option == "バーチャルカード":
+            mask = df["バーチャルカード対応"].fillna("").str.contains("あり")
+        elif option == "番号レス":
+            mask = df["番号レスカード"].fillna("").str.contains("あり")
+        else:
+            return None
+    elif group == "campaigns":
+        if option != "入会特典あり":
+            return None
+        mask = df["入会特典ポイント"].apply(_has_bonus)
+    else:
+        raise KeyError(f"Unknown filter group: {group}")
+    return np.asarray(mask, dtype=bool)
+
+
+class BitmapIndex:
+    """
+    One packed bitset (np.packbits, one bit per card in catalog order) per checkbox option.
+    Built once per catalog; a query is then bitwise OR inside the "any" groups and
+    bitwise AND across groups, with no string scanning.
+    """
+
+    def __init__(self, df):
+        self._df = df
+        self.size = len(df)
+        self.all = np.packbits(np.ones(self.size, dtype=bool))
+        self.none = np.zeros_like(self.all)
+        # The amount filter is skipped entirely when the column carries no values at all
+        self.usage_filterable = bool(self.size) and bool(df["月々の推奨利用額"].notna().any())
+
+        self._counts = None # Per-option card counts, computed on first use
+
+        bitsets = {}
+        if not self.size: # Empty catalog (e.g. cards.csv missing): no columns to index
+            self._bitsets = bitsets
+            return
+        for usage in USAGE_BUCKETS:
+            bitsets[("amount", usage)] = np.packbits(option_mask(df, "amount", usage))
+        for group in GROUP_MODES:
+            for option in option_values(group):
+                mask = option_mask(df, group, option)
+                if mask is not None:
+                    bitsets[(group, option)] = np.packbits(mask)
+        self._bitsets = bitsets
+
+    @classmethod
+    def from_bitsets(cls, df, bitsets):
+        """ Rebuilds an index from precomputed {(group, option): packed bits} (e.g. a compiled snapshot). """
+        index = cls.__new__(cls)
+        index._df = df
+        index.size = len(df)
+        index.all = np.packbits(np.ones(index.size, dtype=bool))
+        index.none = np.zeros_like(index.all)
+        index.usage_filterable = bool(index.size) and bool(df["月々の推奨利用額"].notna().any())
+        index._bitsets = dict(bitsets)
+        index._counts = None
+        return index
+
+    def updated(self, df, old_positions):
+        """
+        Index for df, whose row i is this index's row old_positions[i] when that is >= 0.
+        Bits of those rows are copied over; only the other (new or changed) rows are evaluated.
+        """
+        old_positions = np.asarray(old_positions)
+        kept = np.flatnonzero(old_positions >= 0)
+        fresh = np.flatnonzero(old_positions < 0)
+        fresh_df = df.iloc[fresh]
+        bitsets = {}
+        for (group, option), bits in self._bitsets.items():
+            mask = np.zeros(len(df), dtype=bool)
+            mask[kept] = self.to_mask(bits)[old_positions[kept]]
+            if len(fresh):
+                mask[fresh] = option_mask(fresh_df, group, option)
+            bitsets[(group, option)] = np.packbits(mask)
+        return BitmapIndex.from_bitsets(df, bitsets)
+
+    def bitsets(self):
+        """ The precomputed {(group, option): packed bits} mapping. """
+        return dict(self._bitsets)
+
+    def option(self, group, option):
+        """ Bitset for one option; values not on the form are evaluated on the fly (not cached). """
+        bits = self._bitsets.get((group, option))
+        if bits is not None:
+            return bits
+        mask = option_mask(self._df, group, option)
+        return None if mask is None else np.packbits(mask)
+
+    def any_of(self, group, options):
+        bits = self.none
+        for option in options:
+            bits = bits | self.option(group, option)
+        return bits
+
+    def all_of(self, group, options):
+        bits = self.all
+        for option in options:
+            option_bits = self.option(group, option)
+            if option_bits is not None:
+                bits = bits & option_bits
+        return bits
+
+    def count(self, bits):
+        """ Number of cards selected by a bitset (padding bits are always zero). """
+        if _bitwise_count is not None:
+            return int(_bitwise_count(bits).sum(dtype=np.int64))
+        return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+    def option_count(self, group, option):
+        """ Number of cards with a precomputed option, or None for options evaluated on the fly. """
+        counts = self._counts
+        if counts is None:
+            counts = self._counts = {key: self.count(bits) for key, bits in self._bitsets.items()}
+        return counts.get((group, option))
+
+    def to_mask(self, bits):
+        """ Unpacks a bitset into a boolean row mask usable with df[mask]. """
+        return np.unpackbits(bits, count=self.size).astype(bool)
@@ -1,175 +1,138 @@
 import pandas as pd
-import re
-
-def load_cards(file_path="cards.csv"):
-    """ Loads and preprocesses the card data from a CSV file. """
-    try:
-        # Skip lines with parsing errors to prevent crashes
-        df = pd.read_csv(file_path, on_bad_lines='skip')
-    except pd.errors.ParserError as e:
-        print(f"CSV parsing error: {e}")
-        return pd.DataFrame()
-    except FileNotFoundError:
-        print(f"Error: {file_path} not found.")
-        return pd.DataFrame()
-
-
-    # Create numeric columns for easier filtering and scoring
-    numeric_cols = {
-        "還元率_基本（%）": "還元率数値",
-        "海外旅行保険_最高補償額（万円）": "海外旅行保険数値",
-        "ショッピング保険_年間補償額（万円）": "ショッピング保険数値"
+from catalog import get_catalog, load_cards # load_cards is re-exported for existing callers
+from filter_index import _has_bonus # Re-exported for existing callers
+from instrumentation import current_timer
+from query_plan import Predicate, planner
+
+def usage_bucket(amount):
+    """ Maps a monthly amount in yen to its 月々の推奨利用額 bucket (None if amount is -1). """
+    if amount == -1: return None
+    if amount <= 10000: return "～1万円"
+    elif amount <= 30000: return "1万円～3万円"
+    elif amount <= 50000: return "3万円～5万円"
+    else: return "5万円～"
+
+def parse_diagnose_params(form):
+    """ Parses /diagnose inputs (form or query args) into the keyword arguments used by the pipeline. """
+    amount_str = form.get("amount")
+    if amount_str and amount_str.isdigit():
+        amount = int(amount_str)
+    else:
+        amount = -1
+
+    return {
+        "amount": amount,
+        "keyword": form.get("keyword", "").strip(),
+        "tiers": form.getlist("tiers"),
+        "brands": form.getlist("brands"),
+        "e_money": form.getlist("e_money"),
+        "wallets": form.getlist("wallets"),
+        "features": form.getlist("features"),
+        "campaigns": form.getlist("campaigns"),
+        "points": form.getlist("points"),
+        "applicant_type": form.getlist("applicant_type"),
+        "insurance": form.getlist("insurance"),
+        # ★★★ ここがキーワード入力に変更されました ★★★
+        "lifestyle_keywords": form.get("lifestyle_keywords", "").strip(),
+        "lifestyle_single": form.get("lifestyle_single", ""),
     }
-    for original_col, new_col in numeric_cols.items():
-        if original_col in df.columns:
-            df[new_col] = pd.to_numeric(df[original_col], errors='coerce').fillna(0)
-        else:
-            df[new_col] = 0.0 # Assign default value if column doesn't exist
-
-    # Ensure all required text columns exist to prevent errors during filtering
-    required_cols = [
-        "カード名","発行会社","カード区分","国際ブランド","年会費（税込）","年会費条件",
-        "旅行保険_有無","画像ファイル名","月々の推奨利用額","電子マネー対応",
-        "タッチ決済対応","スマホ決済対応","空港ラウンジ","コンシェルジュ",
-        "ETC_年会費","ETC_可否","家族カード可否","即時発行","バーチャルカード対応","番号レスカード",
-        "メリット","デメリット","入会特典ポイント","入会特典有効期限","公式キャンペーン", "申込対象", "ポイントプログラム名"
-    ]
-    for col in required_cols:
-        if col not in df.columns:
-            df[col] = "" # Add missing columns with empty strings
-
-    return df
-
-def _has_bonus(text):
-    """ Checks if a card has a sign-up bonus based on the text. """
-    s = str(text).strip()
-    if not s or s.lower() == "nan":
-        return False
-    # Check for any digit
-    if re.search(r'\d', s):
-        nums = re.findall(r'[0-9,]+', s)
-        try:
-            # Check if the first number found is greater than 0
-            if nums:
-                val = int(nums[0].replace(',', ''))
-                return val > 0
-            else: # Contains digits but not in expected number format, assume bonus
-                return True
-        except (ValueError, IndexError):
-            return True # Error during conversion, but text exists
-    elif len(s) > 0: # Non-empty string without digits
-         return True
-    else: # Empty string
-         return False
-
-def filter_cards(amount=-1, tiers=None, brands=None, features=None, e_money=None, wallets=None, campaign_has_bonus=False, keyword="", points=None, applicant_type=None, insurance=None):
-    """ 
-    Filters the DataFrame of cards based on various user-selected criteria.
-    
-    Returns:
-        tuple: (DataFrame, is_fallback)
-               - (filtered_df, False) if results are found.
-               - (original_df, True) if no results are found (fallback).
-    """
-    df = load_cards()
-    if df.empty:
-        return df, False # Return empty DF and no fallback
-
-    filtered = df.copy()
 
-    # --- Apply Filters Sequentially ---
-    # (...中略...)
+def filter_params(params):
+    """ filter_cards keyword arguments for parsed /diagnose parameters (see parse_diagnose_params above). """
+    return dict(
+        amount=params["amount"],
+        tiers=params["tiers"],
+        brands=params["brands"],
+        features=params["features"],
+        e_money=params["e_money"],
+        wallets=params["wallets"],
+        campaign_has_bonus="入会特典あり" in params["campaigns"],
+        keyword=params["keyword"],
+        points=params["points"],
+        applicant_type=params["applicant_type"],
+        insurance=params["insurance"]
+    )
+
+def filter_predicates(index, amount=-1, tiers=None, brands=None, features=None, e_money=None, wallets=None, campaign_has_bonus=False, keyword="", points=None, applicant_type=None, insurance=None):
+    """ The active filter steps of a query, in the fixed (form) order. The planner may run them in any order. """
+    predicates = []
 
     # Filter by monthly usage amount (skipped if amount is -1)
     if amount != -1:
-        if amount <= 10000: usage = "～1万円"
-        elif amount <= 30000: usage = "1万円～3万円"
-        elif amount <= 50000: usage = "3万円～5万円"
-        else: usage = "5万円～"
-        if "月々の推奨利用額" in filtered.columns and filtered["月々の推奨利用額"].notna().any():
-            filtered = filtered[filtered["月々の推奨利用額"].astype(str).str.strip() == usage]
+        if index.usage_filterable:
+            predicates.append(Predicate("amount", "option", ("amount", usage_bucket(amount))))
 
     # Filter by card tiers
     if tiers:
-        filtered = filtered[filtered["カード区分"].isin(tiers)]
+        predicates.append(Predicate("tiers", "any", tiers))
 
     # Filter by brands (OR logic)
     if brands:
-        filtered = filtered[filtered["国際ブランド"].fillna("").astype(str).apply(lambda s: any(b in s for b in brands))]
+        predicates.append(Predicate("brands", "any", brands))
 
     # Filter by e-money (AND logic)
     if e_money:
-        filtered = filtered[filtered["電子マネー対応"].fillna("").astype(str).apply(lambda s: all(em in s for em in e_money))]
+        predicates.append(Predicate("e_money", "all", e_money))
 
     # Filter by wallets (AND logic)
     if wallets:
-        filtered = filtered[filtered["スマホ決済対応"].fillna("").astype(str).apply(lambda s: all(w in s for w in wallets))]
+        predicates.append(Predicate("wallets", "all", wallets))
 
-    # Filter by point type (OR logic)
+    # Filter by point type (OR logic, マイル matches any mileage program)
     if points:
-        point_masks = []
-        for p in points:
-            keyword_to_search = "マイル" if "マイル" in p else p.replace("ポイント", "")
-            mask = (
-                filtered["ポイントプログラム名"].fillna("").str.contains(keyword_to_search, case=False, regex=False) |
-                filtered["メリット"].fillna("").str.contains(keyword_to_search, case=False, regex=False)
-            )
-            point_masks.append(mask)
-        if point_masks:
-            combined_mask = pd.concat(point_masks, axis=1).any(axis=1)
-            filtered = filtered[combined_mask]
+        predicates.append(Predicate("points", "any", points))
 
     # Filter by applicant type (OR logic)
     if applicant_type:
-        filtered = filtered[filtered["申込対象"].fillna("").astype(str).apply(lambda s: any(at in s for at in applicant_type))]
+        predicates.append(Predicate("applicant_type", "any", applicant_type))
 
     # Filter by insurance types (AND logic)
     if insurance:
-        for ins in insurance:
-            if ins == "海外旅行保険あり":
-                filtered = filtered[filtered["海外旅行保険数値"] > 0]
-            elif ins == "国内旅行保険あり":
-                mask1 = filtered["旅行保険_有無"].fillna("").str.contains("あり")
-                mask2 = filtered["メリット"].fillna("").str.contains("国内") | filtered["デメリット"].fillna("").str.contains("国内")
-                filtered = filtered[mask1 & mask2]
-            elif ins == "ショッピング保険あり":
-                filtered = filtered[filtered["ショッピング保険数値"] > 0]
+        predicates.append(Predicate("insurance", "all", insurance))
+
+    # Filter by other features (AND logic)
+    if features:
+        predicates.append(Predicate("features", "all", features))
+
+    # Filter by campaign bonus presence
+    if campaign_has_bonus:
+        predicates.append(Predicate("campaigns", "option", ("campaigns", "入会特典あり")))
 
     # Keyword Search (searches only card name and issuer)
     if keyword:
-        search_cols = ["カード名", "発行会社"]
-        mask = filtered[search_cols].fillna("").astype(str).apply(
-            lambda x: x.str.lower().str.contains(keyword.lower(), na=False, regex=False)
-        ).any(axis=1)
-        filtered = filtered[mask]
-
-    # Filter by other features (AND logic, using vectorized operations)
-    feat_list = features or []
-    if feat_list:
-        for f in feat_list:
-            if f == "年会費無料" and "年会費（税込）" in filtered.columns:
-                filtered = filtered[filtered["年会費（税込）"].fillna("").str.contains("無料")]
-            elif f == "空港ラウンジ" and "空港ラウンジ" in filtered.columns:
-                filtered = filtered[filtered["空港ラウンジ"].fillna("").str.strip().ne("") & filtered["空港ラウンジ"].fillna("").str.strip().ne("なし")]
-            elif f == "コンシェルジュ" and "コンシェルジュ" in filtered.columns:
-                filtered = filtered[filtered["コンシェルジュ"].fillna("").str.contains("あり")]
-            elif f == "タッチ決済" and "タッチ決済対応" in filtered.columns:
-                filtered = filtered[filtered["タッチ決済対応"].fillna("").str.strip().ne("") & filtered["タッチ決済対応"].fillna("").str.lower().ne("nan") & filtered["タッチ決済対応"].fillna("").str.strip().ne("なし")]
-            elif f == "ETC無料" and "ETC_年会費" in filtered.columns:
-                filtered = filtered[filtered["ETC_年会費"].fillna("").str.contains("無料")]
-            elif f == "家族カード" and "家族カード可否" in filtered.columns:
-                filtered = filtered[filtered["家族カード可否"].fillna("").str.contains("あり")]
-            elif f == "即時発行" and "即時発行" in filtered.columns:
-                filtered = filtered[filtered["即時発行"].fillna("").str.contains("あり")]
-            elif f == "バーチャルカード" and "バーチャルカード対応" in filtered.columns:
-                filtered = filtered[filtered["バーチャルカード対応"].fillna("").str.contains("あり")]
-            elif f == "番号レス" and "番号レスカード" in filtered.columns:
-                filtered = filtered[filtered["番号レスカード"].fillna("").str.contains("あり")]
+        predicates.append(Predicate("keyword", "keyword", keyword))
 
-    # Filter by campaign bonus presence
-    if campaign_has_bonus and "入会特典ポイント" in filtered.columns:
-        filtered = filtered[filtered["入会特典ポイント"].apply(_has_bonus)]
+    return predicates
+
+def filter_cards(amount=-1, tiers=None, brands=None, features=None, e_money=None, wallets=None, campaign_has_bonus=False, keyword="", points=None, applicant_type=None, insurance=None):
+    """ 
+    Filters the DataFrame of cards based on various user-selected criteria.
     
+    Returns:
+        tuple: (DataFrame, is_fallback)
+               - (filtered_df, False) if results are found.
+               - (original_df, True) if no results are found (fallback).
+    """
+    # Per-stage timing with the candidate count after each step (None when timing is off)
+    timer = current_timer()
+    if timer: timer.start_lap()
+
+    # Shared, preprocessed catalog (re-read only when cards.csv changes). Never mutated here.
+    catalog = get_catalog()
+    df = catalog.df
+    if timer: timer.lap("catalog", len(df))
+    if df.empty:
+        return df, False # Return empty DF and no fallback
+
+    # --- Narrow the precomputed option bitsets ---
+    # OR inside "any" groups, AND across groups; the planner picks the cheapest, most
+    # selective step first and stops once nothing is left. The frame is sliced only once.
+    index = catalog.bitmaps
+    predicates = filter_predicates(index, amount, tiers, brands, features, e_money, wallets, campaign_has_bonus, keyword, points, applicant_type, insurance)
+    bits = planner.run(predicates, index, df, timer)
+
+    filtered = df[index.to_mask(bits)]
+    if timer: timer.lap("filter.slice", len(filtered))
 
     if filtered.empty:
        
@@ -0,0 +1,49 @@
+import gc
+import os
+
+# gunicorn settings (gunicorn reads ./gunicorn.conf.py automatically).
+# The app, and with it the card catalog, is loaded once in the master and shared by the
+# forked workers: numeric columns and filter bitsets are memory-mapped from the compiled
+# snapshot (cards.snapshot.npz, see catalog_snapshot.py), and everything else built at
+# startup stays in copy-on-write pages that the workers only read.
+#
+#   GUNICORN_PRELOAD=0 / CATALOG_MMAP=0 turn the sharing off (e.g. to compare memory).
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+if preload_app:
+    # Compile (or refresh) the snapshot before the app loads the catalog
+    from catalog import CARDS_CSV
+    from catalog_snapshot import SNAPSHOT_MMAP, ensure_snapshot
+    if SNAPSHOT_MMAP and os.path.exists(CARDS_CSV):
+        ensure_snapshot(CARDS_CSV)
+
+    # Objects allocated while loading stay where they are: no collection runs in the
+    # master, so freed gaps do not end up in pages the workers share
+    gc.disable()
+
+
+def when_ready(server):
+    """ Master, after the app is loaded and before any worker is forked. """
+    if not preload_app:
+        return
+    from catalog import get_catalog
+    from display_result import prerender_fragments
+    from instrumentation import format_memory, process_memory
+
+    count = prerender_fragments(get_catalog())
+    server.log.info("Pre-rendered %d card fragments; master memory: %s", count, format_memory(process_memory()))
+
+def pre_fork(server, worker):
+    if preload_app:
+        # Move everything loaded so far out of the collector's reach, so collections
+        # in the workers never write to (and thereby copy) the shared pages
+        gc.freeze()
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+
+def post_worker_init(worker):
+    from instrumentation import format_memory, process_memory
+    worker.log.info("Worker %s memory after start: %s", worker.pid, format_memory(process_memory()))
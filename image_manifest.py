@@ -0,0 +1,82 @@
+import os
+import threading
+
+IMAGE_DIR = os.path.join("static", "images")
+DEFAULT_IMAGE = "default.png"
+
+class ImageManifest:
+    """ In-memory listing of static/images: image name (relative path) -> resolved file path. """
+
+    def __init__(self, image_dir, mtime_ns, version):
+        self.image_dir = image_dir
+        self.mtime_ns = mtime_ns
+        self.version = version # Increases whenever the directory is re-scanned
+        self.paths = {}
+        if mtime_ns is None:
+            return # Directory does not exist: every image falls back to the default
+        for root, _, files in os.walk(image_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, image_dir).replace(os.sep, "/")
+                self.paths[rel] = os.path.realpath(path)
+
+    def __contains__(self, name):
+        return name in self.paths
+
+    def resolve(self, name):
+        """ Returns name if the image exists, otherwise the default image name. """
+        return name if name in self.paths else DEFAULT_IMAGE
+
+
+_lock = threading.Lock()
+_current = None
+_version = 0
+
+
+def _dir_mtime(image_dir):
+    try:
+        return os.stat(image_dir).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_manifest(image_dir=IMAGE_DIR):
+    """ Returns the current manifest, re-scanning the directory only when its mtime has changed. """
+    global _current, _version
+    mtime_ns = _dir_mtime(image_dir)
+    current = _current
+    if current is not None and current.image_dir == image_dir and current.mtime_ns == mtime_ns:
+        return current
+    with _lock:
+        current = _current
+        if current is not None and current.image_dir == image_dir and current.mtime_ns == mtime_ns:
+            return current
+        _version += 1
+        _current = ImageManifest(image_dir, mtime_ns, _version)
+        return _current
+
+
+def missing_images(df, manifest=None):
+    """ Lists (card name, image name) for cards whose 画像ファイル名 is set but not present in the manifest. """
+    if manifest is None:
+        manifest = get_manifest()
+    missing = []
+    if df.empty:
+        return missing
+    for name, img in zip(df["カード名"], df["画像ファイル名"]):
+        img = "" if img is None else str(img).strip()
+        if img and img.lower() != "nan" and img != DEFAULT_IMAGE and img not in manifest:
+            missing.append((name, img))
+    return missing
+
+
+def report_missing_images(df):
+    """ Prints the startup report of cards that will be shown with the default image. """
+    missing = missing_images(df)
+    if not missing:
+        print("Image check: every card image was found.")
+        return missing
+    print(f"Image check: {len(missing)} card(s) have no image file in {IMAGE_DIR}, using {DEFAULT_IMAGE}:")
+    for name, img in missing:
+        print(f"  - {name}: {img}")
+    return missing
@@ -0,0 +1,169 @@
+import contextlib
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+# Lightweight per-request stage timing.
+# A RequestTimer is attached to the current request context by the app; pipeline code
+# calls stage() / current_timer().lap(), which cost one ContextVar lookup when no timer is
+# active, e.g. when STAGE_TIMING=0 or outside a request.
+
+ENABLED = os.environ.get("STAGE_TIMING", "1") != "0"
+
+_timer = ContextVar("stage_timer", default=None)
+_NOOP = contextlib.nullcontext()
+
+
+class RequestTimer:
+    """ Collects (stage, seconds, rows) entries for one request, in execution order. """
+
+    def __init__(self):
+        self.entries = []
+        self._last = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.entries.append([name, end - start, None])
+            self._last = end
+
+    def start_lap(self):
+        self._last = time.perf_counter()
+
+    def lap(self, name, rows=None):
+        """ Records the time since the previous lap/stage as stage `name`. """
+        now = time.perf_counter()
+        self.entries.append([name, now - self._last, rows])
+        self._last = now
+
+    def server_timing(self):
+        """ Server-Timing header value, e.g. 'filter.brands;dur=0.120;desc="rows=42"'. """
+        parts = []
+        for name, seconds, rows in self.entries:
+            part = f"{name};dur={seconds * 1000:.3f}"
+            if rows is not None:
+                part += f';desc="rows={rows}"'
+            parts.append(part)
+        return ", ".join(parts)
+
+
+def start_request():
+    """ Attaches a new timer to the current context (returns the reset token), or None if disabled. """
+    return _timer.set(RequestTimer()) if ENABLED else None
+
+def end_request(token):
+    if token is not None:
+        _timer.reset(token)
+
+def current_timer():
+    """ The active RequestTimer, or None when timing is off. """
+    return _timer.get()
+
+def stage(name):
+    """ Context manager timing a block as stage `name` (no-op without an active timer). """
+    timer = _timer.get()
+    return _NOOP if timer is None else timer.stage(name)
+
+
+# --- Prometheus metrics ---
+
+class Histogram:
+    """ Minimal labelled Prometheus histogram (cumulative buckets, _sum and _count). """
+
+    def __init__(self, name, help_text, label, buckets):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = list(buckets)
+        self._series = {} # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for label_value, series in items:
+            label = f'{self.label}="{_escape(label_value)}"'
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound:g}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{label}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {series[-1]}")
+        return "\n".join(lines)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+_ROW_BUCKETS = [0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000]
+
+STAGE_SECONDS = Histogram("carddiag_stage_duration_seconds", "Time spent in each pipeline stage.", "stage", _LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram("carddiag_request_duration_seconds", "Request latency by endpoint.", "endpoint", _LATENCY_BUCKETS)
+STAGE_ROWS = Histogram("carddiag_stage_rows", "Candidate cards left after each filter stage.", "stage", _ROW_BUCKETS)
+
+def observe_request(endpoint, seconds, timer):
+    REQUEST_SECONDS.observe(endpoint, seconds)
+    if timer is None:
+        return
+    for name, stage_seconds, rows in timer.entries:
+        STAGE_SECONDS.observe(name, stage_seconds)
+        if rows is not None:
+            STAGE_ROWS.observe(name, rows)
+
+# --- Process memory ---
+
+_SMAPS_FIELDS = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared_clean", "Shared_Dirty": "shared_dirty",
+                 "Private_Clean": "private_clean", "Private_Dirty": "private_dirty"}
+
+def process_memory(pid="self"):
+    """
+    Memory of a process in bytes from /proc/<pid>/smaps_rollup (Linux): rss, pss (shared pages
+    split between the processes using them), shared_* and private_*. Outside Linux only the
+    peak RSS of the current process is available ({"max_rss": ...}).
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        import resource, sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"max_rss": peak if sys.platform == "darwin" else peak * 1024}
+    memory = {}
+    for line in lines:
+        key, _, rest = line.partition(":")
+        if key in _SMAPS_FIELDS:
+            memory[_SMAPS_FIELDS[key]] = int(rest.split()[0]) * 1024 # kB
+    return memory
+
+def format_memory(memory):
+    return ", ".join(f"{key} {value / 2**20:.1f} MB" for key, value in memory.items())
+
+def _memory_metrics():
+    lines = ["# HELP carddiag_process_memory_bytes Memory of this worker process (smaps_rollup).",
+             "# TYPE carddiag_process_memory_bytes gauge"]
+    lines += [f'carddiag_process_memory_bytes{{kind="{kind}",pid="{os.getpid()}"}} {value}'
+              for kind, value in process_memory().items()]
+    return "\n".join(lines)
+
+def render_metrics(extra_lines=()):
+    """ All metrics in Prometheus text exposition format. """
+    blocks = [STAGE_SECONDS.render(), REQUEST_SECONDS.render(), STAGE_ROWS.render(), _memory_metrics()]
+    blocks.extend(extra_lines)
+    return "\n".join(blocks) + "\n"
@@ -0,0 +1,107 @@
+import bisect
+import numpy as np
+import pandas as pd
+from text_index import NgramIndex, normalize_text
+
+# Keyword search over カード名 / 発行会社, plus prefix completion for /api/suggest.
+# Both fields are indexed in their normalized form (text_index.normalize_text), so
+# lookups ignore full-width/half-width, case and hiragana/katakana differences.
+
+SUGGEST_LIMIT = 10
+
+
+def _text_values(df, col):
+    if col not in df.columns:
+        return [""] * len(df)
+    return df[col].fillna("").astype(str).tolist()
+
+class KeywordIndex:
+    """
+    Bigram index over the normalized card names (one text per card) and the distinct
+    normalized issuers (cards map to them through a code array), built once per catalog.
+    """
+
+    def __init__(self, df, names_index=None):
+        self.size = len(df)
+        names = _text_values(df, "カード名")
+        issuer_codes, issuer_texts = pd.factorize(pd.Series(_text_values(df, "発行会社"), dtype=object))
+        issuer_texts = list(issuer_texts)
+        self.names = names_index if names_index is not None else NgramIndex(normalize_text(n) for n in names)
+        self.issuers = NgramIndex(normalize_text(t) for t in issuer_texts)
+        self._issuer_codes = issuer_codes
+
+        # Distinct (normalized, display text, kind) entries sorted by normalized text, for prefix lookups
+        entries = {}
+        for kind, texts, normalized in (("card", names, self.names.texts), ("issuer", issuer_texts, self.issuers.texts)):
+            for text, norm in zip(texts, normalized):
+                if text:
+                    entries.setdefault((text, kind), norm)
+        ordered = sorted((norm, text, kind) for (text, kind), norm in entries.items())
+        self._prefix_keys = [norm for norm, _, _ in ordered]
+        self._prefix_entries = [(text, kind) for _, text, kind in ordered]
+
+    def updated(self, df, old_positions):
+        """
+        Index for df, whose row i is this index's row old_positions[i] (-1: new or changed).
+        Only the names of those rows are re-indexed; the (small) issuer index is rebuilt.
+        """
+        old_positions = np.asarray(old_positions)
+        fresh = np.flatnonzero(old_positions < 0)
+        fresh_names = {pos: normalize_text(n) for pos, n in zip(fresh, _text_values(df.iloc[fresh], "カード名"))}
+        return KeywordIndex(df, self.names.updated(old_positions, fresh_names))
+
+    def contains(self, keyword):
+        """ Boolean mask over the catalog: True where カード名 or 発行会社 contains keyword. """
+        term = normalize_text(keyword)
+        mask = np.zeros(self.size, dtype=bool)
+        if not term:
+            mask[:] = True # Empty term matches everything, as str.contains("") does
+            return mask
+        mask[self.names.positions(term)] = True
+        issuers = self.issuers.positions(term)
+        if len(issuers):
+            mask |= np.isin(self._issuer_codes, issuers)
+        return mask
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        """
+        Up to limit completions [{"text", "kind"}] for prefix: card names and issuers that
+        start with it (shortest first), then ones that contain it elsewhere.
+        """
+        term = normalize_text(prefix.strip())
+        if not term or limit < 1:
+            return []
+
+        # Prefix matches: a contiguous run of the sorted keys
+        keys = self._prefix_keys
+        start = bisect.bisect_left(keys, term)
+        end = start
+        while end < len(keys) and end - start < limit * 20 and keys[end].startswith(term):
+            end += 1
+        ranked = sorted(range(start, end), key=lambda i: (len(keys[i]), i))
+        candidates = [self._prefix_entries[i] for i in ranked]
+
+        # Then infix matches from the bigram indexes (catalog order)
+        if len(ranked) < limit:
+            infix = [(self.issuers.texts[p], "issuer") for p in self.issuers.positions(term)]
+            infix += [(self.names.texts[p], "card") for p in self.names.positions(term)[:limit * 5]]
+            candidates += [self._display(norm, kind) for norm, kind in infix]
+
+        results = []
+        seen = set() # A card named like its issuer is suggested once
+        for entry in candidates:
+            if entry is not None and entry[0] not in seen:
+                seen.add(entry[0])
+                results.append({"text": entry[0], "kind": entry[1]})
+                if len(results) >= limit:
+                    break
+        return results
+
+    def _display(self, norm, kind):
+        """ Display entry for a normalized text (the first one in sorted order). """
+        i = bisect.bisect_left(self._prefix_keys, norm)
+        while i < len(self._prefix_keys) and self._prefix_keys[i] == norm:
+            if self._prefix_entries[i][1] == kind:
+                return self._prefix_entries[i]
+            i += 1
+        return None
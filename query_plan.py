@@ -0,0 +1,209 @@
+import argparse
+import random
+import sys
+import threading
+import time
+import numpy as np
+from catalog import catalog_for
+from keyword_search import KeywordIndex
+
+# Selectivity-aware ordering of the filter_cards predicates.
+# Every predicate narrows a packed bitset of candidate cards, so they commute: any order
+# gives the same result. The planner runs the predicate with the lowest
+#   estimated cost / (1 - estimated selectivity)
+# first, re-planning after each step, and stops as soon as no candidate is left.
+# Selectivity comes from the catalog's per-option card counts (checkbox groups) and from
+# observed queries (keyword); costs are per-unit averages of observed run times.
+# The keyword step is a lookup in the catalog's keyword index (keyword_search.py).
+#
+#   python query_plan.py [--queries 500]   # checks planned order == fixed order
+
+# Per-unit costs (seconds) used until queries have been observed:
+# bitset predicates per option per bitset byte, keyword search per catalog card
+_PRIOR_COST = {"bitset": 1e-9, "keyword": 2e-7}
+_PRIOR_KEYWORD_SELECTIVITY = 0.2
+_SMOOTHING = 0.2 # Weight of the newest observation in the running averages
+
+
+class Predicate:
+    """
+    One filter step of filter_cards. kind is "option" (value is (group, option)),
+    "any" / "all" (value is the selected options of group `name`) or "keyword".
+    """
+
+    def __init__(self, name, kind, value):
+        self.name = name
+        self.kind = kind
+        self.value = value
+
+    def __repr__(self):
+        return f"Predicate({self.name!r}, {self.kind!r}, {self.value!r})"
+
+    @property
+    def cost_class(self):
+        return "keyword" if self.kind == "keyword" else "bitset"
+
+    def units(self, index):
+        """
+        Work done by apply(), in the units of its cost class. Neither kind depends on how many
+        candidates are left: bitsets are combined whole, and the keyword is looked up in the
+        catalog-wide index and turned into a mask over every card.
+        """
+        if self.kind == "keyword":
+            return index.size
+        options = 1 if self.kind == "option" else len(self.value)
+        return options * len(index.all)
+
+    def catalog_selectivity(self, index):
+        """ Fraction of the catalog the predicate keeps, from per-option counts (None if unknown). """
+        if self.kind == "keyword" or not index.size:
+            return None
+        if self.kind == "option":
+            counts = [index.option_count(*self.value)]
+        else:
+            counts = [index.option_count(self.name, option) for option in self.value]
+        if any(c is None for c in counts):
+            return None # Some option is evaluated on the fly: no statistics
+        if self.kind == "any":
+            return min(1.0, sum(counts) / index.size)
+        return min(counts) / index.size # "option" / "all": at most the rarest option
+
+    def apply(self, index, df, bits):
+        """ Returns bits narrowed to the cards that satisfy the predicate. """
+        if self.kind == "option":
+            return bits & index.option(*self.value)
+        if self.kind == "any":
+            return bits & index.any_of(self.name, self.value)
+        if self.kind == "all":
+            return bits & index.all_of(self.name, self.value)
+
+        # Keyword search (card name and issuer) through the catalog's normalized bigram index
+        catalog = catalog_for(df)
+        keywords = catalog.keywords if catalog is not None else KeywordIndex(df)
+        return bits & np.packbits(keywords.contains(self.value))
+
+
+class QueryPlanner:
+    """ Orders and runs predicates, keeping running cost and selectivity statistics. """
+
+    def __init__(self):
+        self._cost = dict(_PRIOR_COST)
+        self._selectivity = {"keyword": _PRIOR_KEYWORD_SELECTIVITY} # Observed, by predicate name
+        self._runs = {} # Predicate name -> times run
+        self._early_exits = 0
+        self._lock = threading.Lock()
+
+    def estimate(self, predicate, index):
+        """ (estimated seconds, estimated fraction of the candidates kept) for running predicate now. """
+        selectivity = predicate.catalog_selectivity(index)
+        if selectivity is None:
+            selectivity = self._selectivity.get(predicate.name, 1.0)
+        return self._cost[predicate.cost_class] * predicate.units(index), selectivity
+
+    def _rank(self, predicate, index):
+        cost, selectivity = self.estimate(predicate, index)
+        return cost / max(1.0 - selectivity, 1e-6)
+
+    def run(self, predicates, index, df, timer=None, fixed_order=False):
+        """
+        Applies predicates to the whole catalog and returns the resulting bitset.
+        fixed_order=True runs them in the given order (used to check the planner).
+        Stops early once no candidates are left; the remaining predicates cannot add any.
+        """
+        bits = index.all
+        rows = index.size
+        remaining = list(predicates)
+        while remaining:
+            if rows == 0:
+                with self._lock:
+                    self._early_exits += 1
+                break
+            if fixed_order:
+                predicate = remaining[0]
+            else:
+                predicate = min(remaining, key=lambda p: self._rank(p, index))
+            remaining.remove(predicate)
+
+            start = time.perf_counter()
+            new_bits = predicate.apply(index, df, bits)
+            elapsed = time.perf_counter() - start
+            new_rows = index.count(new_bits)
+            self._observe(predicate, predicate.units(index), elapsed, rows, new_rows)
+            if timer: timer.lap(f"filter.{predicate.name}", new_rows)
+            bits, rows = new_bits, new_rows
+        return bits
+
+    def _observe(self, predicate, units, elapsed, rows_before, rows_after):
+        with self._lock:
+            cost_class = predicate.cost_class
+            if units:
+                self._cost[cost_class] += _SMOOTHING * (elapsed / units - self._cost[cost_class])
+            if rows_before:
+                kept = rows_after / rows_before
+                previous = self._selectivity.get(predicate.name, kept)
+                self._selectivity[predicate.name] = previous + _SMOOTHING * (kept - previous)
+            self._runs[predicate.name] = self._runs.get(predicate.name, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {"unit_cost_seconds": dict(self._cost),
+                    "observed_selectivity": {k: round(v, 4) for k, v in self._selectivity.items()},
+                    "runs": dict(self._runs), "early_exits": self._early_exits}
+
+# Shared by all requests of the process
+planner = QueryPlanner()
+
+
+def _random_query(rng, keywords):
+    from form_groups import option_values
+
+    def pick(group):
+        values = option_values(group)
+        return rng.sample(values, rng.randint(0, min(3, len(values))))
+
+    return {
+        "amount": rng.choice([-1, -1, 5000, 20000, 40000, 80000]),
+        "tiers": pick("tiers"), "brands": pick("brands"), "features": pick("features"),
+        "e_money": pick("e_money"), "wallets": pick("wallets"), "points": pick("points"),
+        "applicant_type": pick("applicant_type"), "insurance": pick("insurance"),
+        "campaign_has_bonus": rng.random() < 0.3,
+        "keyword": rng.choice(keywords) if rng.random() < 0.5 else "",
+    }
+
+def verify_plan(queries=500, seed=0, catalog=None):
+    """
+    Runs random queries in planned and in fixed order against catalog (default: the served
+    one). Returns the queries whose results differ.
+    """
+    from catalog import get_catalog
+    from filter_logic import filter_predicates
+
+    catalog = catalog or get_catalog()
+    df, index = catalog.df, catalog.bitmaps
+    rng = random.Random(seed)
+    names = df["カード名"].dropna().astype(str).tolist()
+    keywords = ["カード", "JCB", "visa", "ゴールド", "楽天", "存在しない"] + [n[:3] for n in rng.sample(names, min(20, len(names)))]
+    mismatches = []
+    for _ in range(queries):
+        query = _random_query(rng, keywords)
+        predicates = filter_predicates(index=index, **query)
+        planned = planner.run(predicates, index, df)
+        fixed = QueryPlanner().run(predicates, index, df, fixed_order=True)
+        if not np.array_equal(planned, fixed):
+            mismatches.append(query)
+    return mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that planned filter order gives the same results as the fixed order.")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    mismatches = verify_plan(args.queries, args.seed)
+    print(f"Filter plan check: {args.queries} queries, {len(mismatches)} mismatch(es)")
+    for query in mismatches[:10]:
+        print(f"  - {query}")
+    print(f"Planner stats: {planner.stats()}")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import numpy as np
+
+# Bounded top-k selection over score arrays.
+# Every function returns positions ordered exactly like a stable descending sort:
+# highest score first, ties in row order.
+
+def _sort_desc(scores, positions):
+    """ positions sorted by descending score, ties by ascending position. """
+    return positions[np.lexsort((positions, -scores[positions]))]
+
+def top_k(scores, k):
+    """ Positions of the k highest scores. Only rows that can still make the cut are sorted. """
+    scores = np.asarray(scores, dtype=float)
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return _sort_desc(scores, np.arange(n))
+    # k-th largest value; every row at or above it is a candidate (keeps all boundary ties)
+    kth = np.partition(scores, n - k)[n - k]
+    candidates = np.flatnonzero(scores >= kth)
+    return _sort_desc(scores, candidates)[:k]
+
+def top_k_by_group(scores, groups, group_values, k):
+    """
+    Top k positions for each value in group_values, in a single sort over the rows
+    that belong to one of the groups. Returns {group value: positions}.
+    """
+    scores = np.asarray(scores, dtype=float)
+    groups = np.asarray(groups, dtype=object)
+    codes = np.full(len(scores), -1, dtype=np.int64)
+    for code, value in enumerate(group_values):
+        codes[groups == value] = code
+    members = np.flatnonzero(codes >= 0)
+    # One lexsort by (group, -score, position); each group's top k is then the head of its run
+    ordered = members[np.lexsort((members, -scores[members], codes[members]))]
+    ordered_codes = codes[ordered]
+    starts = np.searchsorted(ordered_codes, np.arange(len(group_values)), side="left")
+    return {value: ordered[start:start + k][ordered_codes[start:start + k] == code]
+            for code, (value, start) in enumerate(zip(group_values, starts))}
@@ -0,0 +1,65 @@
+import os
+import re
+from cache import LRUCache
+from filter_logic import usage_bucket
+from scoring import TRANSPORT_HINTS
+from text_index import normalize_text
+
+# Checkbox groups whose selections are order- and duplicate-insensitive in filter_cards
+CHECKBOX_PARAMS = ["tiers", "brands", "e_money", "wallets", "features", "points", "applicant_type", "insurance"]
+
+DIAGNOSE_CACHE_SIZE = int(os.environ.get("DIAGNOSE_CACHE_SIZE", "512"))
+DIAGNOSE_CACHE_TTL = float(os.environ.get("DIAGNOSE_CACHE_TTL", "600"))
+
+def normalize_query(params):
+    """
+    Canonical, hashable form of parsed /diagnose inputs. Two inputs with the same key
+    always produce the same ranking: only the amount bucket matters, checkbox lists are
+    sets, the keyword is keyed by the form keyword search matches on (normalize_text:
+    ＪＣＢ == jcb, カタカナ == かたかな), lifestyle keywords are counted as a multiset and
+    交通手段 only matters through the mode it selects.
+    """
+    transport = next((mode for mode in TRANSPORT_HINTS if mode in params.get("lifestyle_single", "")), "")
+    lifestyle_keywords = params.get("lifestyle_keywords", "")
+    return (
+        usage_bucket(params.get("amount", -1)),
+        tuple(tuple(sorted(set(params.get(name) or []))) for name in CHECKBOX_PARAMS),
+        "入会特典あり" in (params.get("campaigns") or []),
+        normalize_text(params.get("keyword", "")),
+        tuple(sorted(k for k in re.split(r'[\s　]+', lifestyle_keywords.lower()) if k)),
+        transport,
+    )
+
+
+class DiagnoseCache:
+    """
+    LRU+TTL cache of /diagnose results: normalized query -> (ranked card ids, results_html).
+    Entries are tagged with the catalog and image manifest versions and the score weights
+    (score_rules.score_key); when the catalog reloads the whole cache is dropped.
+    """
+
+    def __init__(self, maxsize=DIAGNOSE_CACHE_SIZE, ttl=DIAGNOSE_CACHE_TTL):
+        self._cache = LRUCache(maxsize, ttl)
+        self._catalog_version = None
+        self.invalidations = 0
+
+    def _check_version(self, catalog_version):
+        if catalog_version != self._catalog_version:
+            if self._catalog_version is not None:
+                self._cache.clear()
+                self.invalidations += 1
+            self._catalog_version = catalog_version
+
+    def get(self, params, catalog_version, manifest_version, score_key=None):
+        self._check_version(catalog_version)
+        return self._cache.get((normalize_query(params), catalog_version, manifest_version, score_key))
+
+    def put(self, params, catalog_version, manifest_version, card_ids, results_html, score_key=None):
+        self._check_version(catalog_version)
+        self._cache.put((normalize_query(params), catalog_version, manifest_version, score_key), (card_ids, results_html))
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats["invalidations"] = self.invalidations
+        stats["catalog_version"] = self._catalog_version
+        return stats
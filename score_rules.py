@@ -0,0 +1,339 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from collections import Counter
+import numpy as np
+import pandas as pd
+from cache import LRUCache
+from card_tier import annual_fee_column
+from scoring import _contains, _num_col, _str_col
+
+# 基本スコアのルール定義 (score_rules.json) を読み込み、カードごとの特徴量列と重みベクトルに
+# コンパイルする。スコア = clip(特徴量行列 @ 重み, 0, max_total) なので、重みの差し替えや
+# A/B テストで別の重みを使うときもカードのテキストを再解析しない。
+#
+# score_rules.json:
+#   "categories":  {category: max points}   (the breakdown documented in スコア詳細)
+#   "features":    [{"name", "category", "when"?, "value"?, "unless"?}]  one column each;
+#                  "when" is a condition (0/1), "value" a number in 0..1 ("ratio" of a numeric
+#                  column to "full", or capped weighted "count" of texts/patterns), "unless"
+#                  zeroes rows where any of the listed (earlier) features is active
+#   "weight_sets": {name: {feature: points}}  "default" must weight every feature; other sets
+#                  override some of them
+#   "ab_test":     null, or {"control": set, "variant": set, "share": 0..1} to split visitors
+# Edits to the file are picked up on the next request (weights only: no card is re-parsed).
+#
+#   python score_rules.py [cards.csv]   (validates the rules and prints the top cards per weight set)
+
+SCORE_RULES = os.environ.get("SCORE_RULES", "score_rules.json")
+DEFAULT_WEIGHT_SET = "default"
+
+# Derived columns that frames which did not go through catalog.prepare_frame may lack
+_DERIVED_NUMERIC = {"年会費数値": annual_fee_column}
+
+# Conditions comparing a numeric column; a missing (NaN) value never satisfies them
+_COMPARISONS = {"at_least": np.greater_equal, "above": np.greater, "at_most": np.less_equal, "below": np.less}
+
+
+def _numeric(df, col):
+    if col in _DERIVED_NUMERIC:
+        values = _DERIVED_NUMERIC[col](df)
+    elif col in df.columns:
+        values = df[col]
+    else:
+        return np.zeros(len(df))
+    return pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+
+def _condition(df, cond):
+    """ Evaluates a "when" condition to a boolean array over the rows of df. """
+    (op, arg), = cond.items()
+    if op == "any":
+        return np.logical_or.reduce([_condition(df, c) for c in arg] + [np.zeros(len(df), dtype=bool)])
+    if op == "all":
+        return np.logical_and.reduce([_condition(df, c) for c in arg] + [np.ones(len(df), dtype=bool)])
+    if op == "not":
+        return ~_condition(df, arg)
+    col, operand = arg
+    if op == "contains":
+        return _contains(_str_col(df, col), operand)
+    if op == "equals":
+        return (_str_col(df, col) == operand).to_numpy(dtype=bool)
+    with np.errstate(invalid="ignore"):
+        return _COMPARISONS[op](_numeric(df, col), operand)
+
+def _value(df, value):
+    """ Evaluates a "value" spec to a float array in 0..1 over the rows of df. """
+    if "ratio" in value:
+        return np.minimum(_num_col(df, value["ratio"]) / value["full"], 1)
+    points = np.zeros(len(df))
+    for term in value["count"]:
+        texts = _str_col(df, term["column"])
+        pattern = term["pattern"] if "pattern" in term else re.escape(term["text"])
+        points = points + texts.str.count(pattern).to_numpy() * term["points"]
+    return np.minimum(points, value["cap"]) / value["cap"]
+
+def _check_condition(cond, name):
+    if not isinstance(cond, dict) or len(cond) != 1:
+        raise ValueError(f"feature {name}: a condition is a single-key object, got {cond!r}")
+    (op, arg), = cond.items()
+    if op in ("any", "all"):
+        for c in arg:
+            _check_condition(c, name)
+    elif op == "not":
+        _check_condition(arg, name)
+    elif op in ("contains", "equals") or op in _COMPARISONS:
+        if not (isinstance(arg, list) and len(arg) == 2):
+            raise ValueError(f"feature {name}: {op} takes [column, operand]")
+    else:
+        raise ValueError(f"feature {name}: unknown condition {op!r}")
+
+
+class ScoreFeatures:
+    """ Feature columns of one catalog (cards x features, in catalog order) and the rules they were compiled with. """
+
+    def __init__(self, values, fingerprint):
+        self.values = values
+        self.fingerprint = fingerprint
+
+    def updated(self, df, old_positions, rules=None):
+        """ Features for df, whose row i is row old_positions[i] here (-1: new or changed, compiled). """
+        rules = rules or get_rules()
+        if rules.fingerprint != self.fingerprint:
+            return rules.compile(df)
+        old_positions = np.asarray(old_positions)
+        fresh = np.flatnonzero(old_positions < 0)
+        values = self.values[np.where(old_positions >= 0, old_positions, 0)]
+        if len(fresh):
+            values[fresh] = rules.feature_matrix(df.iloc[fresh])
+        return ScoreFeatures(values, self.fingerprint)
+
+
+class ScoreRules:
+    """
+    Parsed and validated score_rules.json. feature_matrix() turns card text into feature
+    columns once; weights(name) are plain vectors over those columns.
+    """
+
+    def __init__(self, config, version=0):
+        self.version = version # Increases on every reload of the file; part of score cache keys
+        self.max_total = float(config.get("max_total", 100))
+        self.categories = dict(config["categories"])
+        self.features = list(config["features"])
+        self.names = [f["name"] for f in self.features]
+        # Only the feature definitions decide the matrix; weight edits keep it valid
+        self.fingerprint = hashlib.sha1(json.dumps(self.features, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+        seen = set()
+        for feature in self.features:
+            name = feature["name"]
+            if name in seen:
+                raise ValueError(f"duplicate feature {name}")
+            if feature.get("category") not in self.categories:
+                raise ValueError(f"feature {name}: unknown category {feature.get('category')!r}")
+            for other in feature.get("unless", []):
+                if other not in seen:
+                    raise ValueError(f"feature {name}: unless refers to {other!r}, which is not an earlier feature")
+            if "when" in feature:
+                _check_condition(feature["when"], name)
+            value = feature.get("value")
+            if value is not None and not ("ratio" in value and value.get("full") or "count" in value and value.get("cap")):
+                raise ValueError(f"feature {name}: value needs ratio+full or count+cap")
+            seen.add(name)
+
+        sets = config["weight_sets"]
+        default = sets.get(DEFAULT_WEIGHT_SET)
+        if default is None or set(default) != seen:
+            raise ValueError(f"weight set {DEFAULT_WEIGHT_SET!r} must weight exactly the features {self.names}")
+        self.weight_sets = {}
+        for set_name, weights in sets.items():
+            unknown = set(weights) - seen
+            if unknown:
+                raise ValueError(f"weight set {set_name!r}: unknown features {sorted(unknown)}")
+            merged = {**default, **weights}
+            self.weight_sets[set_name] = np.array([float(merged[name]) for name in self.names])
+
+        self.ab_test = config.get("ab_test")
+        if self.ab_test:
+            for key in ("control", "variant"):
+                if self.ab_test.get(key) not in self.weight_sets:
+                    raise ValueError(f"ab_test {key}: unknown weight set {self.ab_test.get(key)!r}")
+            if not 0 <= float(self.ab_test.get("share", 0.5)) <= 1:
+                raise ValueError("ab_test share must be between 0 and 1")
+
+    def feature_matrix(self, df):
+        """ float array (rows of df x features): the only step that reads card text. """
+        columns = {}
+        for feature in self.features:
+            active = _condition(df, feature["when"]) if "when" in feature else np.ones(len(df), dtype=bool)
+            for other in feature.get("unless", []):
+                active = active & (columns[other] == 0)
+            values = _value(df, feature["value"]) if "value" in feature else np.ones(len(df))
+            columns[feature["name"]] = np.where(active, values, 0.0)
+        if not columns:
+            return np.zeros((len(df), 0))
+        return np.column_stack([columns[name] for name in self.names]).astype(float)
+
+    def compile(self, df):
+        return ScoreFeatures(self.feature_matrix(df), self.fingerprint)
+
+    def weights(self, weight_set=None):
+        return self.weight_sets[weight_set or DEFAULT_WEIGHT_SET]
+
+    def scores(self, features, weight_set=None):
+        """ Base scores: one matrix-vector product over the compiled features. """
+        if not len(features):
+            return np.zeros(0)
+        return np.clip(features @ self.weights(weight_set), 0, self.max_total)
+
+    def breakdown(self, feature_row, weight_set=None):
+        """ {category: points} of one card's feature row (before the max_total clip), in category order. """
+        points = feature_row * self.weights(weight_set)
+        totals = dict.fromkeys(self.categories, 0.0)
+        for feature, value in zip(self.features, points):
+            totals[feature["category"]] += float(value)
+        return totals
+
+    def resolve(self, weight_set):
+        """ weight_set if it names a known set, else the default. """
+        return weight_set if weight_set in self.weight_sets else DEFAULT_WEIGHT_SET
+
+    def ab_bucket(self, visitor_id):
+        """ Weight set of a visitor under ab_test: a stable hash of the id against the variant share. """
+        test = self.ab_test
+        if not test or not visitor_id:
+            return DEFAULT_WEIGHT_SET
+        # The set names are part of the hash, so a new experiment reshuffles visitors
+        digest = hashlib.sha1(f"{test['control']}/{test['variant']}:{visitor_id}".encode("utf-8")).hexdigest()
+        return test["variant"] if int(digest[:8], 16) / 2**32 < float(test.get("share", 0.5)) else test["control"]
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def load_rules(path=SCORE_RULES, version=0):
+    with open(path, encoding="utf-8") as f:
+        return ScoreRules(json.load(f), version)
+
+_lock = threading.Lock()
+_current = None # (path, signature, ScoreRules)
+_version = 0
+
+def get_rules(path=None):
+    """
+    Current rules, re-read when the file's mtime/size changes. An edit that fails to parse
+    or validate is reported and the previous rules stay in use.
+    """
+    global _current, _version
+    path = path or SCORE_RULES
+    signature = _file_signature(path)
+    current = _current
+    if current is not None and current[0] == path and current[1] == signature:
+        return current[2]
+    with _lock:
+        current = _current
+        if current is not None and current[0] == path and current[1] == signature:
+            return current[2]
+        try:
+            rules = load_rules(path, _version + 1)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if current is None:
+                raise
+            print(f"Error: could not reload {path}, keeping the previous score rules: {e}")
+            _current = (path, signature, current[2])
+            return current[2]
+        _version += 1
+        _current = (path, signature, rules)
+        if current is not None:
+            print(f"Score rules reloaded from {path} (v{rules.version}, weight sets: {', '.join(rules.weight_sets)})")
+        return rules
+
+
+# Scores per (catalog version, rules version, weight set), and features recompiled after a rules edit
+SCORE_CACHE_SIZE = int(os.environ.get("SCORE_CACHE_SIZE", "8"))
+_score_cache = LRUCache(SCORE_CACHE_SIZE)
+_feature_cache = LRUCache(2)
+
+# Requests scored with each weight set since startup (for /metrics; guarded by _lock)
+assignments = Counter()
+
+def catalog_features(catalog, rules=None):
+    """ The catalog's compiled features, recompiled (once) if the feature definitions changed since it was built. """
+    rules = rules or get_rules()
+    features = catalog.score_features
+    if features.fingerprint == rules.fingerprint:
+        return features
+    key = (catalog.version, rules.fingerprint)
+    features = _feature_cache.get(key)
+    if features is None:
+        features = rules.compile(catalog.df)
+        _feature_cache.put(key, features)
+    return features
+
+def catalog_scores(catalog, weight_set=None):
+    """ Base score of every catalog row (catalog order) under a weight set. """
+    rules = get_rules()
+    weight_set = rules.resolve(weight_set)
+    key = (catalog.version, rules.version, weight_set)
+    scores = _score_cache.get(key)
+    if scores is None:
+        scores = rules.scores(catalog_features(catalog, rules).values, weight_set)
+        _score_cache.put(key, scores)
+    return scores
+
+def score_breakdown(catalog, position, weight_set=None):
+    """ Per-category points of one catalog row under a weight set (see ScoreRules.breakdown). """
+    rules = get_rules()
+    return rules.breakdown(catalog_features(catalog, rules).values[position], rules.resolve(weight_set))
+
+def compute_base_scores(df, weight_set=None):
+    """ Returns a float array with the base score (0-100) of every row of df, in row order. """
+    rules = get_rules()
+    return rules.scores(rules.feature_matrix(df), rules.resolve(weight_set))
+
+def score_key(weight_set=None):
+    """ What a cached ranking depends on besides the query and catalog: (rules version, weight set). """
+    rules = get_rules()
+    return (rules.version, rules.resolve(weight_set))
+
+def assign_weight_set(requested=None, visitor_id=None):
+    """
+    Weight set for one request: an explicitly requested known set, else the visitor's
+    ab_test bucket (the default set when no test is running). Counted in `assignments`.
+    """
+    rules = get_rules()
+    weight_set = requested if requested in rules.weight_sets else rules.ab_bucket(visitor_id)
+    with _lock:
+        assignments[weight_set] += 1
+    return weight_set
+
+def assignment_counts():
+    """ Snapshot of `assignments` ({weight set: requests}), safe to iterate while requests keep counting. """
+    with _lock:
+        return dict(assignments)
+
+
+if __name__ == "__main__":
+    from catalog import load_cards, prepare_frame
+    from ranking import top_k
+
+    rules = load_rules()
+    print(f"{len(rules.names)} features, fingerprint {rules.fingerprint}")
+    for category, maximum in rules.categories.items():
+        names = [f["name"] for f in rules.features if f["category"] == category]
+        weights = ", ".join(f"{set_name}={'/'.join(f'{w[rules.names.index(n)]:g}' for n in names)}"
+                            for set_name, w in rules.weight_sets.items())
+        print(f"  {category} (max {maximum}): {', '.join(names)}  [{weights}]")
+
+    cards = prepare_frame(load_cards(sys.argv[1] if len(sys.argv) > 1 else "cards.csv"))
+    features = rules.feature_matrix(cards)
+    for set_name in rules.weight_sets:
+        scores = rules.scores(features, set_name)
+        top = ", ".join(f"{cards['カード名'].iloc[pos]} ({scores[pos]:.1f})" for pos in top_k(scores, 5))
+        print(f"{set_name}: {top}")
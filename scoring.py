@@ -0,0 +1,124 @@
+import re
+import numpy as np
+import pandas as pd
+from text_index import NgramIndex
+
+# 列単位のスコア計算: ライフスタイルボーナスの索引と、score_rules が使う列ヘルパー。
+# 100点満点の「基本スコア」のルールは score_rules.json にある (内訳は「スコア詳細」を参照)。
+
+def _str_col(df, col, default=""):
+    """ Column values as str(value), matching str(row.get(col, default)) in the per-row code. """
+    if col not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    return df[col].astype(object).map(str)
+
+def _num_col(df, col):
+    if col not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[col], errors="coerce").fillna(0).to_numpy(dtype=float)
+
+def _contains(s, text):
+    return s.str.contains(text, regex=False).to_numpy(dtype=bool)
+
+# --- ライフスタイルボーナス (最大30点) ---
+# Fields searched by _calculate_lifestyle_bonus, and the hints behind each 交通手段 option
+LIFESTYLE_FIELDS = ["カード名", "メリット", "還元対象カテゴリ"]
+TRANSPORT_HINTS = {
+    "電車": ["suica", "pasmo", "交通系", "オートチャージ"],
+    "飛行機": ["マイル", "jal", "ana"],
+    "自動車": ["etc", "ガソリン", "出光", "eneos"],
+}
+
+def _lifestyle_texts(df):
+    """ Lowercased LIFESTYLE_FIELDS text of every row, as searched by the lifestyle bonus. """
+    if df.empty:
+        return pd.Series([], dtype=object)
+    texts = _str_col(df, LIFESTYLE_FIELDS[0])
+    for col in LIFESTYLE_FIELDS[1:]:
+        texts = texts + " " + _str_col(df, col)
+    return texts.str.lower()
+
+class LifestyleIndex:
+    """
+    Precomputed lookups for the lifestyle bonus: an n-gram index over the lowercased
+    カード名/メリット/還元対象カテゴリ text and one flag array per 交通手段.
+    bonuses() returns the bonus of every catalog row, in row order.
+    """
+
+    def __init__(self, df, text_index=None):
+        self.text_index = text_index if text_index is not None else NgramIndex(_lifestyle_texts(df))
+        self.size = self.text_index.size
+        self.transport_flags = {
+            mode: np.logical_or.reduce([self.text_index.contains(h) for h in hints])
+            for mode, hints in TRANSPORT_HINTS.items()
+        }
+
+    def updated(self, df, old_positions):
+        """ Index for df, whose row i is this index's row old_positions[i] (-1: new or changed, re-indexed). """
+        old_positions = np.asarray(old_positions)
+        fresh = np.flatnonzero(old_positions < 0)
+        fresh_texts = dict(zip(fresh, _lifestyle_texts(df.iloc[fresh])))
+        return LifestyleIndex(df, self.text_index.updated(old_positions, fresh_texts))
+
+    def bonuses(self, lifestyle_keywords="", lifestyle_single=""):
+        bonus = np.zeros(self.size, dtype=int)
+
+        # --- 1. キーワードボーナス (最大15点): 1キーワードヒットにつき5点 ---
+        if lifestyle_keywords:
+            matched = np.zeros(self.size, dtype=int)
+            for keyword in re.split(r'[\s　]+', lifestyle_keywords.lower()):
+                if keyword:
+                    matched[self.text_index.positions(keyword)] += 1
+            bonus += np.minimum(matched * 5, 15)
+
+        # --- 2. 交通手段ボーナス (最大15点) ---
+        if lifestyle_single:
+            for mode, flags in self.transport_flags.items():
+                if mode in lifestyle_single:
+                    bonus += flags * 15
+                    break
+        return bonus
+
+def verify_base_scores(df):
+    """
+    Compares score_rules.compute_base_scores (default weights) against the per-row
+    display_result._calculate_base_score.
+    Returns a list of (index, card name, expected, actual) for every mismatching row.
+    """
+    from display_result import _calculate_base_score
+    from score_rules import compute_base_scores
+
+    actual = compute_base_scores(df)
+    mismatches = []
+    for pos, (index, row) in enumerate(df.iterrows()):
+        expected = _calculate_base_score(row)
+        if not np.isclose(expected, actual[pos]):
+            mismatches.append((index, row.get("カード名"), expected, actual[pos]))
+    return mismatches
+
+def verify_lifestyle_bonuses(df, lifestyle_keywords, lifestyle_single):
+    """ Same as verify_base_scores, for LifestyleIndex.bonuses against _calculate_lifestyle_bonus. """
+    from display_result import _calculate_lifestyle_bonus
+
+    actual = LifestyleIndex(df).bonuses(lifestyle_keywords, lifestyle_single)
+    mismatches = []
+    for pos, (index, row) in enumerate(df.iterrows()):
+        expected = _calculate_lifestyle_bonus(row, lifestyle_keywords, lifestyle_single)
+        if expected != actual[pos]:
+            mismatches.append((index, row.get("カード名"), expected, actual[pos]))
+    return mismatches
+
+if __name__ == "__main__":
+    # Parity check over the real catalog: python scoring.py [cards.csv]
+    import sys
+    from catalog import load_cards
+
+    cards = load_cards(sys.argv[1] if len(sys.argv) > 1 else "cards.csv")
+    bad = verify_base_scores(cards)
+    for keywords, single in [("Amazon コンビニ　イオン", ""), ("", "電車 (Suica / PASMOなど)"),
+                             ("jal", "飛行機 (マイルを貯めたい)"), ("ガソリン etc", "自動車 (ETC / ガソリン)")]:
+        bad += verify_lifestyle_bonuses(cards, keywords, single)
+    for index, name, expected, actual in bad:
+        print(f"MISMATCH row {index} {name}: per-row={expected} vectorized={actual}")
+    print(f"{len(bad)} mismatches over {len(cards)} cards")
+    sys.exit(1 if bad else 0)
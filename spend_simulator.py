@@ -0,0 +1,326 @@
+import argparse
+import math
+import re
+import sys
+import time
+import numpy as np
+import pandas as pd
+from cache import LRUCache
+from card_tier import annual_fee_column
+from catalog import catalog_for
+from text_index import normalize_text
+
+# 年間シミュレーション: 1か月のカテゴリ別利用額から、全カードの「年間の獲得ポイント(円換算) − 年会費」を
+# まとめて計算する。カードごとの文字列 (還元対象カテゴリ, 還元上限, ポイント換算, 年会費条件) は
+# カタログごとに一度だけ配列へ変換し、利用額が変わっても配列演算だけで済む。
+#
+# Model (per card, per month; x12 for the year):
+#   base points  = floor(total spend / 換算単位) x points per unit; 1 point is worth
+#                  還元率_基本 x 単位 / points円, so base value ~= spend x 還元率_基本
+#   bonus        = spend in the categories named by 還元対象カテゴリ x ボーナス還元率 (on top of
+#                  the base rate), capped at 還元上限（月額） ("/年" caps count 1/12 per month)
+#   fee          = 年会費数値, waived when 年会費条件 says "年N万円利用で無料" / "年1回利用で無料" and
+#                  the yearly spend qualifies, or in the first year for 初年度無料 when asked
+#   net value    = yearly base + bonus value - fee
+# 指定なし and conditions that cannot be priced (誕生月, 日曜日, ...) earn no bonus.
+#
+#   python spend_simulator.py [cards.csv] --spend convenience=30000 online=20000 [--first-year] [--top 10] [--verify]
+
+# Spend categories of the simulator: form field spend_<key>, label, and the 還元対象カテゴリ hints
+# that make a card's bonus rate apply to that spend
+SPEND_CATEGORIES = {
+    "general": {"label": "その他の買い物", "hints": []},
+    "convenience": {"label": "コンビニ・飲食店", "hints": ["コンビニ", "飲食店", "セブン", "ローソン", "ファミリーマート"]},
+    "online": {"label": "ネットショッピング (Amazon・楽天など)",
+               "hints": ["amazon", "楽天", "モール", "zozotown", "メルカリ", "dmm", "ニッセン", "point名人"]},
+    "shopping": {"label": "スーパー・百貨店・家電量販店",
+                 "hints": ["イオン", "西友", "ダイエー", "コストコ", "高島屋", "三越", "伊勢丹", "大丸", "松坂屋", "parco",
+                           "ルミネ", "ららぽーと", "無印良品", "ヤマダデンキ", "ヨドバシ", "joshin", "洋服の青山", "majica"]},
+    "transport": {"label": "電車・交通系ICチャージ",
+                  "hints": ["suica", "pasmo", "nimoca", "電車", "駅", "定期券", "メトロ", "小田急", "京王", "東急",
+                            "東武", "西武", "京急", "京成", "相鉄"]},
+    "car": {"label": "ガソリン・ETC・車", "hints": ["ガソリン", "eneos", "出光", "シェル", "apollostation", "etc", "nexco", "トヨタ", "honda"]},
+    "travel": {"label": "航空券・旅行・ホテル", "hints": ["jal", "ana", "航空", "デルタ", "ユナイテッド", "マイル", "ホテル", "marriott", "トラベル"]},
+    "utilities": {"label": "携帯電話・公共料金", "hints": ["携帯", "ドコモ", "料金", "ガス", "ntt", "プロバイダ"]},
+    "overseas": {"label": "海外での利用", "hints": ["海外"]},
+}
+CATEGORY_KEYS = list(SPEND_CATEGORIES)
+_CATEGORY_HINTS = [[normalize_text(h) for h in SPEND_CATEGORIES[key]["hints"]] for key in CATEGORY_KEYS]
+
+# Upper bound on one category's monthly spend (keeps sums exact and rejects typos)
+MAX_MONTHLY_SPEND = 100_000_000
+
+# "100円→1P", "1000円→15マイル"; cards without a parsable rule earn 還元率 points per 100円
+_CONVERSION = re.compile(r"([\d,]+)円→([\d.]+)")
+_AMOUNT = re.compile(r"([\d,]+(?:\.\d+)?)(万)?(円|ポイント|p|マイル)")
+_WAIVER_AMOUNT = re.compile(r"年間?([\d.]+)万円(?:以上)?(?:の)?利用で無料")
+_WAIVER_ANY_USE = re.compile(r"年1回(?:以上)?(?:の)?利用で無料")
+
+
+def _text(df, col):
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[col].fillna("").astype(str)
+
+def _number(df, col):
+    if col not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[col], errors="coerce").fillna(0).to_numpy(dtype=float)
+
+def category_matches(text):
+    """ Booleans per CATEGORY_KEYS: whether a 還元対象カテゴリ text covers spend of that category. """
+    norm = normalize_text(text)
+    return [any(h in norm for h in hints) for hints in _CATEGORY_HINTS]
+
+def parse_conversion(text):
+    """ (yen per unit, points per unit) from ポイント換算（円→P）, or None if it cannot be read. """
+    m = _CONVERSION.search(normalize_text(text))
+    if not m:
+        return None
+    unit, points = float(m.group(1).replace(",", "")), float(m.group(2))
+    return (unit, points) if unit > 0 and points > 0 else None
+
+def parse_cap(text):
+    """ (amount, in_points, per_year) from 還元上限（月額）, or None for no (or no usable) cap. """
+    m = _AMOUNT.search(normalize_text(text))
+    if not m:
+        return None
+    amount = float(m.group(1).replace(",", "")) * (10000 if m.group(2) else 1)
+    return amount, m.group(3) != "円", "/年" in text or "／年" in text
+
+def parse_waiver(text):
+    """ Yearly spend (円) that waives the fee under 年会費条件: 1 for "年1回利用で無料", inf if none. """
+    norm = normalize_text(text)
+    m = _WAIVER_AMOUNT.search(norm)
+    if m:
+        return float(m.group(1)) * 10000
+    if _WAIVER_ANY_USE.search(norm):
+        return 1.0
+    return math.inf
+
+def _distinct(series, parse):
+    """ parse applied once per distinct value, returned per row. """
+    codes, uniques = pd.factorize(series)
+    parsed = [parse(value) for value in uniques]
+    return codes, parsed
+
+
+class RewardModel:
+    """
+    Per-card reward terms of a frame as arrays (row order), parsed once: base rate, bonus
+    rate, category coverage, bonus cap, point conversion, fee and fee waivers.
+    """
+
+    def __init__(self, df):
+        n = len(df)
+        self.size = n
+        base_rate = _number(df, "還元率数値")
+        self.bonus_rate = _number(df, "ボーナス還元率（%）")
+
+        codes, parsed = _distinct(_text(df, "還元対象カテゴリ"), category_matches)
+        table = np.array(parsed, dtype=bool).reshape(len(parsed), len(CATEGORY_KEYS))
+        self.matches = table[codes] if n else np.zeros((0, len(CATEGORY_KEYS)), dtype=bool)
+
+        codes, parsed = _distinct(_text(df, "ポイント換算（円→P）"), parse_conversion)
+        unit = np.array([p[0] if p else 100.0 for p in parsed])[codes] if n else np.zeros(0)
+        points = np.array([p[1] if p else np.nan for p in parsed])[codes] if n else np.zeros(0)
+        # No conversion rule: 還元率 points per 100円, each worth 1円
+        points = np.where(np.isnan(points), base_rate, points)
+        self.unit_yen = unit
+        self.points_per_unit = points
+        with np.errstate(divide="ignore", invalid="ignore"):
+            value = base_rate / 100 * unit / points
+        self.point_value = np.where(np.isfinite(value) & (value > 0), value, 1.0) # 円 per point
+
+        codes, parsed = _distinct(_text(df, "還元上限（月額）"), parse_cap)
+        cap = np.full(n, np.inf)
+        for i, p in enumerate(parsed):
+            if p is not None:
+                rows = codes == i
+                amount, in_points, per_year = p
+                monthly = amount / 12 if per_year else amount
+                cap[rows] = monthly * self.point_value[rows] if in_points else monthly
+        self.bonus_cap = cap # 円 of bonus value per month
+
+        self.fee = annual_fee_column(df).fillna(0).to_numpy(dtype=float) if n else np.zeros(0)
+        codes, parsed = _distinct(_text(df, "年会費条件"), parse_waiver)
+        self.waiver_spend = np.array(parsed, dtype=float)[codes] if n else np.zeros(0)
+        self.first_year_free = (_text(df, "年会費条件").str.contains("初年度無料", regex=False) |
+                                _text(df, "年会費（税込）").str.contains("初年度無料", regex=False)).to_numpy(dtype=bool)
+
+    def simulate(self, spend, first_year=False, rows=None):
+        """ Simulation of a monthly spend vector (CATEGORY_KEYS order) for all rows, or the given row positions. """
+        take = (lambda a: a) if rows is None else (lambda a: a[rows])
+        spend = np.asarray(spend, dtype=float)
+        total = float(spend.sum())
+
+        base_points = np.floor(total / take(self.unit_yen)) * take(self.points_per_unit)
+        point_value = take(self.point_value)
+        eligible = np.zeros(len(point_value))
+        matches = take(self.matches)
+        for c in np.flatnonzero(spend):
+            eligible += matches[:, c] * spend[c]
+        bonus_yen = np.minimum(eligible * take(self.bonus_rate) / 100, take(self.bonus_cap))
+
+        fee = np.where(12 * total >= take(self.waiver_spend), 0.0, take(self.fee))
+        if first_year:
+            fee = np.where(take(self.first_year_free), 0.0, fee)
+        reward = 12 * (base_points * point_value + bonus_yen)
+        return Simulation(12 * (base_points + bonus_yen / point_value), 12 * bonus_yen, reward, fee, point_value)
+
+
+class Simulation:
+    """ Yearly results of one spend vector, one entry per row: points, bonus and total value (円), fee, net. """
+
+    def __init__(self, points, bonus, reward, fee, point_value):
+        self.points = points
+        self.bonus = bonus
+        self.reward = reward
+        self.fee = fee
+        self.net = reward - fee
+        self.point_value = point_value
+
+    def summary(self, pos):
+        """ JSON-serializable figures of one row. """
+        return {
+            "annual_points": round(float(self.points[pos]), 1),
+            "point_value_yen": round(float(self.point_value[pos]), 4),
+            "reward_yen": round(float(self.reward[pos])),
+            "bonus_yen": round(float(self.bonus[pos])),
+            "fee_yen": round(float(self.fee[pos])),
+            "net_yen": round(float(self.net[pos])),
+        }
+
+
+# Compiled models of recent catalogs, by catalog version
+_models = LRUCache(2)
+
+def reward_model(catalog):
+    model = _models.get(catalog.version)
+    if model is None:
+        model = RewardModel(catalog.df)
+        _models.put(catalog.version, model)
+    return model
+
+def simulate(df, spend, first_year=False):
+    """
+    Simulation for the rows of df (row order) and a monthly spend vector. Catalog frames
+    and their slices use the catalog's compiled model; other frames are compiled on the fly.
+    """
+    catalog = catalog_for(df)
+    if catalog is not None:
+        return reward_model(catalog).simulate(spend, first_year, rows=df.index.to_numpy())
+    return RewardModel(df).simulate(spend, first_year)
+
+def parse_spend(values, fallback_amount=-1):
+    """
+    Monthly spend vector (CATEGORY_KEYS order) from spend_<key> fields of a form/args mapping
+    or a {key: yen} dict. Raises ValueError for a value that is not a non-negative amount.
+    With no spend at all, a positive fallback_amount (the form's 月の利用金額) counts as general spend.
+    """
+    spend = np.zeros(len(CATEGORY_KEYS))
+    for i, key in enumerate(CATEGORY_KEYS):
+        raw = values.get(key, values.get(f"spend_{key}"))
+        if raw in (None, ""):
+            continue
+        try:
+            amount = float(str(raw).replace(",", ""))
+        except ValueError:
+            raise ValueError(f"{key}: not a number: {raw!r}")
+        if not 0 <= amount <= MAX_MONTHLY_SPEND:
+            raise ValueError(f"{key}: must be between 0 and {MAX_MONTHLY_SPEND}")
+        spend[i] = amount
+    if not spend.any() and fallback_amount > 0:
+        spend[CATEGORY_KEYS.index("general")] = fallback_amount
+    return spend
+
+def spend_dict(spend):
+    return {key: int(amount) if float(amount).is_integer() else float(amount) for key, amount in zip(CATEGORY_KEYS, spend) if amount}
+
+
+def simulate_row(row, spend, first_year=False):
+    """ Per-row reference of RewardModel.simulate (same rules, scalar code). Returns net yearly value. """
+    total = float(sum(spend))
+    base_rate = pd.to_numeric(row.get("還元率数値", 0), errors="coerce")
+    base_rate = 0.0 if pd.isna(base_rate) else float(base_rate)
+    conversion = parse_conversion(str(row.get("ポイント換算（円→P）", "") if pd.notna(row.get("ポイント換算（円→P）")) else ""))
+    unit, points = conversion if conversion else (100.0, base_rate)
+    point_value = base_rate / 100 * unit / points if points else 0.0
+    if not (math.isfinite(point_value) and point_value > 0):
+        point_value = 1.0
+    base_yen = math.floor(total / unit) * points * point_value
+
+    category = row.get("還元対象カテゴリ", "")
+    covered = category_matches(str(category) if pd.notna(category) else "")
+    eligible = sum(amount for amount, hit in zip(spend, covered) if hit)
+    bonus_rate = pd.to_numeric(row.get("ボーナス還元率（%）", 0), errors="coerce")
+    bonus_yen = eligible * (0.0 if pd.isna(bonus_rate) else float(bonus_rate)) / 100
+    cap_text = row.get("還元上限（月額）", "")
+    cap = parse_cap(str(cap_text) if pd.notna(cap_text) else "")
+    if cap is not None:
+        amount, in_points, per_year = cap
+        monthly = amount / 12 if per_year else amount
+        bonus_yen = min(bonus_yen, monthly * point_value if in_points else monthly)
+
+    fee = row.get("年会費数値", 0)
+    fee = 0.0 if pd.isna(fee) else float(fee)
+    condition = str(row.get("年会費条件", "")) if pd.notna(row.get("年会費条件")) else ""
+    if 12 * total >= parse_waiver(condition):
+        fee = 0.0
+    fee_text = str(row.get("年会費（税込）", "")) if pd.notna(row.get("年会費（税込）")) else ""
+    if first_year and ("初年度無料" in condition or "初年度無料" in fee_text):
+        fee = 0.0
+    return 12 * (base_yen + bonus_yen) - fee
+
+def verify_simulation(df, spend, first_year=False):
+    """ Compares RewardModel.simulate with simulate_row. Returns [(index, card name, expected, actual)] mismatches. """
+    actual = RewardModel(df).simulate(spend, first_year).net
+    mismatches = []
+    for pos, (index, row) in enumerate(df.iterrows()):
+        expected = simulate_row(row, spend, first_year)
+        if not np.isclose(expected, actual[pos]):
+            mismatches.append((index, row.get("カード名"), expected, actual[pos]))
+    return mismatches
+
+
+def main(argv=None):
+    from catalog import load_cards, prepare_frame
+    from ranking import top_k
+
+    parser = argparse.ArgumentParser(description="Yearly net value of every card for a monthly spend pattern.")
+    parser.add_argument("csv", nargs="?", default="cards.csv")
+    parser.add_argument("--spend", nargs="*", default=[], metavar="CATEGORY=YEN",
+                        help="monthly spend per category: " + ", ".join(CATEGORY_KEYS))
+    parser.add_argument("--first-year", action="store_true", help="apply 初年度無料")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--verify", action="store_true", help="check against the per-row reference")
+    args = parser.parse_args(argv)
+
+    try:
+        spend = parse_spend(dict(item.split("=", 1) for item in args.spend))
+    except ValueError as e:
+        parser.error(str(e))
+    df = prepare_frame(load_cards(args.csv))
+
+    start = time.perf_counter()
+    model = RewardModel(df)
+    compiled = time.perf_counter()
+    result = model.simulate(spend, args.first_year)
+    simulated = time.perf_counter()
+    print(f"{len(df)} cards: compile {(compiled - start) * 1000:.1f} ms, simulate {(simulated - compiled) * 1000:.2f} ms; "
+          f"spend {spend_dict(spend)} per month")
+    for rank, pos in enumerate(top_k(result.net, args.top), 1):
+        s = result.summary(pos)
+        print(f"{rank:>3}. {df['カード名'].iloc[pos]}: net {s['net_yen']:,}円 "
+              f"(reward {s['reward_yen']:,}円 incl. bonus {s['bonus_yen']:,}円, fee {s['fee_yen']:,}円)")
+
+    if args.verify:
+        bad = verify_simulation(df, spend, args.first_year)
+        for index, name, expected, actual in bad[:20]:
+            print(f"MISMATCH row {index} {name}: per-row={expected} vectorized={actual}")
+        print(f"{len(bad)} mismatches over {len(df)} cards")
+        return 1 if bad else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import re
+import threading
+from urllib.parse import quote
+
+# Fingerprinted static URLs: /static/<file>?v=<content hash>. A URL names exactly one
+# version of the file, so responses for a matching v can be cached for a year
+# (app.static_cache_headers); a stale or missing v falls back to revalidation.
+# Hashes are recomputed only when a file's mtime/size changes.
+# Cached HTML (card fragments, /diagnose results) must not contain fingerprints: a file
+# rewritten in place keeps its name and the images directory mtime, so nothing would
+# invalidate those caches. It holds asset_slot() placeholders instead, which
+# resolve_asset_urls() turns into fingerprinted URLs for each response.
+
+STATIC_DIR = "static"
+STATIC_URL_PATH = "/static"
+
+# Cache lifetime of fingerprinted assets (one year, the usual "forever")
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+_lock = threading.Lock()
+_fingerprints = {} # filename -> ((mtime_ns, size), digest)
+
+
+def fingerprint(filename, static_dir=STATIC_DIR):
+    """ Short content hash of static/<filename>, or None if the file does not exist. """
+    try:
+        st = os.stat(os.path.join(static_dir, filename))
+    except OSError:
+        return None
+    signature = (st.st_mtime_ns, st.st_size)
+    cached = _fingerprints.get((static_dir, filename))
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with _lock:
+        try:
+            with open(os.path.join(static_dir, filename), "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        except OSError:
+            return None
+        _fingerprints[(static_dir, filename)] = (signature, digest)
+        return digest
+
+def asset_url(filename):
+    """
+    URL of static/<filename> carrying its current fingerprint. Plain string (no url_for),
+    so it also works outside a request context.
+    """
+    url = f"{STATIC_URL_PATH}/{quote(filename)}"
+    digest = fingerprint(filename)
+    return f"{url}?v={digest}" if digest else url
+
+# Placeholder for an asset URL inside cached HTML (file names cannot contain NUL)
+_ASSET_SLOT = re.compile("\x00asset:([^\x00]*)\x00")
+
+def asset_slot(filename):
+    return f"\x00asset:{filename}\x00"
+
+def resolve_asset_urls(text):
+    """ text with every asset_slot() replaced by the current asset_url(). """
+    if "\x00asset:" not in text:
+        return text
+    return _ASSET_SLOT.sub(lambda m: asset_url(m.group(1)), text)
+
+def is_current(filename, version):
+    """ Whether version (the ?v= of a request) is the current fingerprint of static/<filename>. """
+    return bool(version) and version == fingerprint(filename)
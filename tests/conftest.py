@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules live at the repository root and read cards.csv, score_rules.json and
+# static/ by relative path, so tests import and run from there.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)
@@ -0,0 +1,25 @@
+import pytest
+from batch_diagnosis import prepare_profiles, sample_profiles, verify_batch
+
+# Batch results (filter matrix + vectorized scoring) must match the one-profile pipeline.
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    return prepare_profiles(sample_profiles(200))
+
+@pytest.mark.parametrize("weight_set", [None, "cashback_heavy"])
+def test_batch_matches_single_profile_pipeline(profiles, weight_set):
+    assert verify_batch(profiles, weight_set=weight_set) == []
+
+def test_batch_matches_with_all_matching_cards(profiles):
+    assert verify_batch(profiles[:50], top_n=1000) == []
+
+def test_hand_written_profiles():
+    records = [
+        {"id": "empty"},
+        {"id": "keyword", "keyword": "ＪＣＢ", "amount": "30000"},
+        {"id": "lifestyle", "lifestyle_keywords": "Amazon コンビニ", "lifestyle_single": "電車 (Suica / PASMOなど)"},
+        {"id": "no match", "keyword": "存在しないカード"},
+    ]
+    assert verify_batch(prepare_profiles(records)) == []
@@ -0,0 +1,46 @@
+import pytest
+from catalog_reload import verify_reload
+
+# An incremental reload must leave the catalog exactly as a full build of the new file.
+# Variants of cards.csv are made line by line (one card per line).
+
+
+def _edit_name(lines):
+    lines[5] = lines[5].replace(",", "改,", 1)
+    return lines
+
+def _edit_fee(lines):
+    lines[10] = lines[10].replace('"33,000円"', '"22,000円"', 1)
+    return lines
+
+def _delete(lines):
+    del lines[3]
+    return lines
+
+def _append(lines):
+    return lines + [lines[7].replace(",", "プラス,", 1)]
+
+def _reverse(lines):
+    return lines[:1] + lines[1:][::-1]
+
+VARIANTS = {
+    "identical": lambda lines: lines,
+    "edited name": _edit_name,
+    "edited field": _edit_fee,
+    "deleted card": _delete,
+    "added card": _append,
+    "reordered": _reverse,
+    "all changed": lambda lines: lines[:1] + [line.replace(",", "新,", 1) for line in lines[1:]],
+}
+
+@pytest.fixture(scope="module")
+def lines():
+    with open("cards.csv", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_incremental_reload_matches_full_build(tmp_path, lines, variant):
+    new_lines = VARIANTS[variant](list(lines))
+    new_csv = tmp_path / "new.csv"
+    new_csv.write_text("\n".join(new_lines) + "\n", encoding="utf-8")
+    assert verify_reload("cards.csv", str(new_csv)) == []
@@ -0,0 +1,42 @@
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from catalog import load_cards, prepare_frame
+from catalog_snapshot import compile_snapshot, load_snapshot
+from filter_index import BitmapIndex
+
+# The compiled snapshot must load back exactly as a CSV build would produce it
+# (what `python catalog_snapshot.py --check` used to check by hand).
+
+
+@pytest.fixture(scope="module")
+def compiled(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("snapshot")
+    csv_path = str(directory / "cards.csv")
+    shutil.copyfile("cards.csv", csv_path)
+    path = str(directory / "cards.snapshot.npz")
+    compile_snapshot(csv_path, path)
+    return csv_path, path
+
+@pytest.mark.parametrize("mmap_arrays", [False, True])
+def test_snapshot_matches_csv_build(compiled, mmap_arrays):
+    csv_path, path = compiled
+    loaded = load_snapshot(csv_path, path, mmap_arrays=mmap_arrays)
+    assert loaded is not None
+    df, bitsets = loaded
+    expected = prepare_frame(load_cards(csv_path))
+    pd.testing.assert_frame_equal(df, expected)
+
+    expected_bits = BitmapIndex(expected).bitsets()
+    assert bitsets.keys() == expected_bits.keys()
+    for key, bits in expected_bits.items():
+        assert np.array_equal(bitsets[key], bits), key
+
+def test_edited_csv_makes_snapshot_stale(compiled, tmp_path):
+    csv_path, path = compiled
+    edited = str(tmp_path / "cards.csv")
+    shutil.copyfile(csv_path, edited)
+    with open(edited, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert load_snapshot(edited, path) is None
@@ -0,0 +1,22 @@
+import pytest
+from benchmarks.synthetic_catalog import write_catalog
+from catalog import CardCatalog, load_cards, prepare_frame
+from query_plan import verify_plan
+
+# Any predicate order the planner picks must give exactly the fixed-order result.
+
+
+@pytest.fixture(scope="module")
+def synthetic_catalog(tmp_path_factory):
+    # Large enough that bitset costs and selectivities actually reorder the steps
+    path = str(tmp_path_factory.mktemp("plan") / "cards.csv")
+    write_catalog(5000, path)
+    # Version 0 is never served, so catalog_for() does not hand out the served catalog's indexes for it
+    return CardCatalog(prepare_frame(load_cards(path)), path, None, 0)
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_planned_order_matches_fixed_order(seed):
+    assert verify_plan(queries=300, seed=seed) == []
+
+def test_planned_order_matches_fixed_order_on_large_catalog(synthetic_catalog):
+    assert verify_plan(queries=300, seed=7, catalog=synthetic_catalog) == []
@@ -0,0 +1,12 @@
+import pytest
+from result_cache import normalize_query
+
+# Keywords that keyword search treats alike must share a cache key, and only those.
+
+
+@pytest.mark.parametrize("a, b", [("JCB", "jcb"), ("ＪＣＢ", "jcb"), ("ｊｃｂ", "JCB"), ("ラクテン", "らくてん"), ("ﾗｸﾃﾝ", "ラクテン")])
+def test_equivalent_keywords_share_a_key(a, b):
+    assert normalize_query({"keyword": a}) == normalize_query({"keyword": b})
+
+def test_different_keywords_get_different_keys():
+    assert normalize_query({"keyword": "楽天"}) != normalize_query({"keyword": "らくてん"})
@@ -0,0 +1,28 @@
+import pytest
+from catalog import load_cards
+from scoring import verify_base_scores, verify_lifestyle_bonuses
+
+# Parity of the vectorized scoring against the per-row reference functions in
+# display_result, over every card in cards.csv.
+
+LIFESTYLE_CASES = [
+    ("", ""),
+    ("Amazon コンビニ　イオン", ""),
+    ("", "電車 (Suica / PASMOなど)"),
+    ("jal", "飛行機 (マイルを貯めたい)"),
+    ("ガソリン etc", "自動車 (ETC / ガソリン)"),
+    ("楽天 ＡＮＡ", "電車 (Suica / PASMOなど)"),
+]
+
+
+@pytest.fixture(scope="module")
+def cards():
+    return load_cards("cards.csv")
+
+def test_base_scores_match_per_row(cards):
+    assert len(cards)
+    assert verify_base_scores(cards) == []
+
+@pytest.mark.parametrize("keywords, single", LIFESTYLE_CASES)
+def test_lifestyle_bonuses_match_per_row(cards, keywords, single):
+    assert verify_lifestyle_bonuses(cards, keywords, single) == []
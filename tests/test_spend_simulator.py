@@ -0,0 +1,24 @@
+import pytest
+from catalog import load_cards, prepare_frame
+from spend_simulator import CATEGORY_KEYS, parse_spend, verify_simulation
+
+# The vectorized RewardModel must give every card the same yearly net value as simulate_row.
+
+SPEND_CASES = [
+    {},
+    {"general": 50000},
+    {"online": 30000, "convenience": 10000},
+    {"transport": 20000, "car": 15000, "utilities": 12000},
+    {"travel": 300000, "overseas": 100000}, # Large enough to reach monthly caps
+    {key: 20000 for key in CATEGORY_KEYS},
+]
+
+
+@pytest.fixture(scope="module")
+def df():
+    return prepare_frame(load_cards("cards.csv"))
+
+@pytest.mark.parametrize("first_year", [False, True])
+@pytest.mark.parametrize("spend", SPEND_CASES)
+def test_vectorized_simulation_matches_per_row(df, spend, first_year):
+    assert verify_simulation(df, parse_spend(spend), first_year) == []
@@ -0,0 +1,102 @@
+import unicodedata
+import numpy as np
+
+# Katakana (ァ..ヶ) folded onto hiragana so either script finds the other
+_KATAKANA_TO_HIRAGANA = str.maketrans({chr(c): chr(c - 0x60) for c in range(0x30A1, 0x30F7)})
+
+def normalize_text(text):
+    """
+    Search form of text: NFKC (full-width ASCII and half-width kana become their
+    standard forms, so ＪＣＢ == JCB), lower case, katakana folded onto hiragana.
+    """
+    return unicodedata.normalize("NFKC", text).lower().translate(_KATAKANA_TO_HIRAGANA)
+
+def _collect_postings(items):
+    """ {gram: [positions]} over (position, text) pairs, in the order given. """
+    postings = {}
+    for pos, text in items:
+        grams = set(text)
+        grams.update(text[i:i + 2] for i in range(len(text) - 1))
+        for gram in grams:
+            postings.setdefault(gram, []).append(pos)
+    return postings
+
+class NgramIndex:
+    """
+    Character n-gram inverted index (unigrams + bigrams) over one text per card.
+    Works for Japanese text without a tokenizer: a term can only occur in a text that
+    contains all of its bigrams, so lookup is posting-list intersection followed by a
+    substring check on the (few) surviving candidates.
+    """
+
+    def __init__(self, texts):
+        self.texts = list(texts)
+        self.size = len(self.texts)
+        postings = _collect_postings(enumerate(self.texts))
+        # Positions are appended in order, so every posting list is already sorted
+        self._postings = {gram: np.array(p, dtype=np.int64) for gram, p in postings.items()}
+
+    def updated(self, old_positions, fresh_texts):
+        """
+        Index over a new list of texts, where text i is this index's text old_positions[i]
+        when that is >= 0 and fresh_texts[i] otherwise. Postings of the carried-over texts
+        are remapped instead of re-tokenized, so only the fresh texts are scanned.
+        """
+        old_positions = np.asarray(old_positions, dtype=np.int64)
+        kept = np.flatnonzero(old_positions >= 0)
+        old_to_new = np.full(self.size, -1, dtype=np.int64)
+        old_to_new[old_positions[kept]] = kept
+        in_order = bool(np.all(np.diff(old_positions[kept]) > 0))
+
+        index = NgramIndex.__new__(NgramIndex)
+        index.texts = [self.texts[o] if o >= 0 else fresh_texts[i] for i, o in enumerate(old_positions)]
+        index.size = len(index.texts)
+        fresh = _collect_postings((int(pos), fresh_texts[pos]) for pos in np.flatnonzero(old_positions < 0))
+        postings = {}
+        for gram, p in self._postings.items():
+            mapped = old_to_new[p]
+            mapped = mapped[mapped >= 0]
+            added = fresh.pop(gram, None)
+            if added is not None:
+                mapped = np.sort(np.concatenate([mapped, np.array(added, dtype=np.int64)]))
+            elif not in_order:
+                mapped = np.sort(mapped)
+            if len(mapped):
+                postings[gram] = mapped
+        for gram, p in fresh.items():
+            postings[gram] = np.array(p, dtype=np.int64)
+        index._postings = postings
+        return index
+
+    def candidates(self, term):
+        """ Sorted positions of the texts that contain every n-gram of term. """
+        grams = {term} if len(term) < 2 else {term[i:i + 2] for i in range(len(term) - 1)}
+        lists = []
+        for gram in grams:
+            p = self._postings.get(gram)
+            if p is None:
+                return np.empty(0, dtype=np.int64)
+            lists.append(p)
+        lists.sort(key=len) # Intersect starting from the rarest gram
+        result = lists[0]
+        for p in lists[1:]:
+            result = np.intersect1d(result, p, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def positions(self, term):
+        """ Sorted positions of the texts containing term as a substring. """
+        if not term:
+            return np.empty(0, dtype=np.int64)
+        cand = self.candidates(term)
+        if len(term) <= 2:
+            return cand # Unigram/bigram postings are already exact
+        texts = self.texts
+        return np.array([p for p in cand if term in texts[p]], dtype=np.int64)
+
+    def contains(self, term):
+        """ Boolean mask over all texts: True where term occurs. """
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.positions(term)] = True
+        return mask